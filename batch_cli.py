@@ -0,0 +1,161 @@
+"""Headless batch deadlock analysis of many scenario files.
+
+Reads scenario files (``.rag``/``.ragz``, see ``rag_io``) from the given
+files and directories, or paths from standard input with ``-``, analyses
+them on a pool of worker processes and writes one JSON line per scenario:
+
+    python batch_cli.py snapshots/ --jobs 8 --output results.jsonl
+    find snapshots -name '*.rag' | python batch_cli.py - --mode reduction
+
+No Qt is imported, so this runs without a display. Detection is the same
+``RAGEngine.detect`` call that ``GraphManager.check_deadlock`` makes.
+``--trace`` records the load and detection phases of every scenario, in
+every worker, as one Chrome trace.
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+
+import profiling
+import rag_io
+from deadlock_engine import DETECTION_MODES, CYCLE_MODE
+from profiling import profiler
+
+SCENARIO_SUFFIXES = ('.rag', rag_io.BINARY_SUFFIX)
+
+
+def iter_scenarios(sources, stdin=sys.stdin):
+    """Yield scenario paths from files, directories (recursively) and ``-``"""
+    for source in sources:
+        if source == '-':
+            for line in stdin:
+                line = line.strip()
+                if line:
+                    yield line
+        elif os.path.isdir(source):
+            for root, dirs, files in os.walk(source):
+                dirs.sort()
+                for name in sorted(files):
+                    if name.endswith(SCENARIO_SUFFIXES):
+                        yield os.path.join(root, name)
+        else:
+            yield source
+
+
+def analyze_file(path, mode=CYCLE_MODE, cycle_limit=5):
+    """Load one scenario and run detection; never raises"""
+    record = {'path': path, 'mode': mode}
+    try:
+        start = time.perf_counter()
+        engine, _ = rag_io.load(path)
+        loaded = time.perf_counter()
+        result = engine.detect(mode)
+        record.update(result.summary(cycle_limit))
+        record['nodes'] = len(engine)
+        record['edges'] = engine.edge_count
+        record['load_seconds'] = loaded - start
+        record['detect_seconds'] = time.perf_counter() - loaded
+    except (OSError, rag_io.RAGFormatError) as error:
+        record['error'] = str(error)
+    except (ValueError, TypeError, KeyError, IndexError, AttributeError) as error:
+        # A file the loader's checks let through; one bad scenario must
+        # not end the batch
+        record['error'] = f"{type(error).__name__}: {error}"
+    return record
+
+
+def _analyze_in_worker(path, mode, cycle_limit):
+    """``analyze_file`` in a pool worker, with the trace events it recorded"""
+    return analyze_file(path, mode, cycle_limit), profiler.drain()
+
+
+def run(paths, output, mode=CYCLE_MODE, cycle_limit=5, jobs=None,
+        max_pending=None, tasks_per_worker=100):
+    """Analyse ``paths`` in parallel, writing JSON lines as results arrive.
+
+    At most ``max_pending`` scenarios are in flight at once, so memory is
+    bounded however many paths there are. Workers are replaced after
+    ``tasks_per_worker`` scenarios to release memory from large graphs
+    (Python 3.11 and later).
+    Returns ``(scenarios, deadlocked, failed)`` counts.
+    """
+    jobs = jobs or os.cpu_count() or 1
+    max_pending = max_pending or 2 * jobs
+    counts = [0, 0, 0]
+
+    def write(record):
+        output.write(json.dumps(record) + '\n')
+        counts[0] += 1
+        if record.get('error'):
+            counts[2] += 1
+        elif record['deadlock']:
+            counts[1] += 1
+
+    if jobs == 1:
+        for path in paths:
+            write(analyze_file(path, mode, cycle_limit))
+        return tuple(counts)
+
+    def collect(future, path):
+        try:
+            record, events = future.result()
+        except Exception as error:  # The worker died, e.g. out of memory
+            record = {'path': path, 'mode': mode,
+                      'error': f"{type(error).__name__}: {error}"}
+        else:
+            profiler.merge(events)
+        write(record)
+
+    # Workers profile when the parent does and send their events back
+    initializer = profiling.enable if profiler.enabled else None
+    options = {}
+    if sys.version_info >= (3, 11):
+        # Older Pythons keep each worker for the whole run
+        options['max_tasks_per_child'] = tasks_per_worker
+    with ProcessPoolExecutor(max_workers=jobs, initializer=initializer, **options) as pool:
+        pending = {}
+        for path in paths:
+            if len(pending) >= max_pending:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    collect(future, pending.pop(future))
+            pending[pool.submit(_analyze_in_worker, path, mode, cycle_limit)] = path
+        for future in wait(pending).done:
+            collect(future, pending[future])
+    return tuple(counts)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Analyse resource allocation graph scenarios for deadlocks.")
+    parser.add_argument('sources', nargs='+',
+                        help="scenario files, directories, or - to read paths from stdin")
+    parser.add_argument('--mode', choices=DETECTION_MODES, default=CYCLE_MODE)
+    parser.add_argument('--cycles', type=int, default=5,
+                        help="example cycles reported per deadlocked component")
+    parser.add_argument('--jobs', '-j', type=int, default=None,
+                        help="worker processes (default: all cores)")
+    parser.add_argument('--output', '-o', help="write JSON lines here instead of stdout")
+    parser.add_argument('--trace', help="write a Chrome trace of the run here")
+    args = parser.parse_args(argv)
+
+    profiler.enable(bool(args.trace))
+    output = open(args.output, 'w', encoding='utf-8') if args.output else sys.stdout
+    try:
+        scenarios, deadlocked, failed = run(
+            iter_scenarios(args.sources), output, args.mode, args.cycles, args.jobs)
+    finally:
+        if output is not sys.stdout:
+            output.close()
+    if args.trace:
+        profiler.export(args.trace)
+    print(f"{scenarios} scenarios, {deadlocked} deadlocked, {failed} failed",
+          file=sys.stderr)
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,152 @@
+"""Benchmarks for the detection, rendering and history hot paths.
+
+Runs headless (Qt's offscreen platform unless QT_QPA_PLATFORM is set) and
+prints one JSON object per measurement, so results from two commits can be
+compared with ordinary tools:
+
+    python benchmark.py --sizes 100 1000 10000 --output results.jsonl
+
+``--trace`` also records the instrumented phases inside each benchmark as a
+Chrome trace; the timings then include the instrumentation overhead.
+"""
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+
+from deadlock_engine import CYCLE_MODE, REDUCTION_MODE
+from profiling import profiler
+from rag_generator import random_rag, adversarial_rag, chain_rag
+
+
+def _timed(function, repeat, setup=None):
+    """Best wall time of ``repeat`` calls of ``function``, each after ``setup``"""
+    best = float('inf')
+    for _ in range(repeat):
+        if setup is not None:
+            setup()
+        start = time.perf_counter()
+        function()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def _commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'],
+                              capture_output=True, text=True, check=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def engine_benchmarks(size, seed, repeat):
+    """Yield ``(name, seconds)`` for the Qt-free hot paths at one size"""
+    engine = random_rag(size, size, edge_density=min(1.0, 5 / size),
+                        cycle_density=0.2, seed=seed)
+    yield 'detect_cycle', _timed(lambda: engine.detect(CYCLE_MODE), repeat)
+    yield 'detect_reduction', _timed(lambda: engine.detect(REDUCTION_MODE), repeat)
+    yield 'detect_report', _timed(lambda: engine.detect(CYCLE_MODE).message(), repeat)
+    yield 'generate_incremental', _timed(
+        lambda: random_rag(size, size, edge_density=min(1.0, 5 / size),
+                           cycle_density=0.2, seed=seed), repeat)
+    snapshot = engine.snapshot()
+    yield 'snapshot', _timed(engine.snapshot, repeat)
+    yield 'from_snapshot', _timed(lambda: type(engine).from_snapshot(snapshot), repeat)
+
+    adversarial_size = max(4, min(size, 300))
+    dense = adversarial_rag(adversarial_size, seed=seed)
+    yield 'detect_adversarial', _timed(lambda: dense.detect(CYCLE_MODE).message(), repeat)
+    chain = chain_rag(size, seed=seed)
+    yield 'detect_chain', _timed(lambda: chain.detect(CYCLE_MODE), repeat)
+
+
+def gui_benchmarks(app, size, seed, repeat):
+    """Yield ``(name, seconds)`` for the scene-side hot paths at one size"""
+    from main_controller import RAGSimulator
+
+    engine = random_rag(size, size, edge_density=min(1.0, 5 / size),
+                        cycle_density=0.2, seed=seed)
+    counters = (size, size)
+    window = RAGSimulator()
+    window.show()
+
+    def load():
+        window.show_engine(engine.copy(), counters)
+        app.processEvents()
+    yield 'load_scene', _timed(load, repeat)
+
+    yield 'update_edges', _timed(window.update_edges, repeat)
+
+    node = window.graph_manager.nodes['P1']
+    def drag():
+        for step in range(20):
+            node.setPos(step * 5.0, step * 3.0)
+    yield 'drag_node_20_moves', _timed(drag, repeat)
+
+    def edit_and_save():
+        window.graph_manager.add_edge('P1', 'R1', 1)
+        window.update_edge('P1', 'R1')
+        window.graph_manager.save_state()
+    yield 'add_edge_save_state', _timed(edit_and_save, repeat)
+
+    def undo():
+        window.undo_last_action()
+        app.processEvents()
+    yield 'undo_last_action', _timed(undo, repeat, setup=edit_and_save)
+
+    def check():
+        window.graph_manager.check_deadlock()
+        window.update_edges()
+    yield 'check_deadlock', _timed(check, repeat)
+
+    def repaint():
+        window.view.viewport().repaint()
+    yield 'repaint', _timed(repaint, repeat)
+    window.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sizes', type=int, nargs='+', default=[100, 1000, 5000],
+                        help="processes (and resources) per generated graph")
+    parser.add_argument('--repeat', type=int, default=3,
+                        help="runs per measurement; the best time is reported")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--no-gui', action='store_true',
+                        help="skip the Qt benchmarks")
+    parser.add_argument('--output', help="append results to this file instead of stdout")
+    parser.add_argument('--trace', help="write a Chrome trace of the instrumented phases here")
+    args = parser.parse_args(argv)
+    profiler.enable(bool(args.trace))
+
+    app = None
+    if not args.no_gui:
+        os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+        from PyQt6.QtWidgets import QApplication
+        app = QApplication.instance() or QApplication(sys.argv[:1])
+
+    context = {'commit': _commit(), 'python': platform.python_version(),
+               'seed': args.seed, 'repeat': args.repeat}
+    out = open(args.output, 'a', encoding='utf-8') if args.output else sys.stdout
+    try:
+        for size in args.sizes:
+            results = list(engine_benchmarks(size, args.seed, args.repeat))
+            if app is not None:
+                results.extend(gui_benchmarks(app, size, args.seed, args.repeat))
+            for name, seconds in results:
+                record = dict(context, benchmark=name, size=size, seconds=seconds)
+                out.write(json.dumps(record) + '\n')
+                out.flush()
+    finally:
+        if out is not sys.stdout:
+            out.close()
+    if args.trace:
+        profiler.export(args.trace)
+
+
+if __name__ == '__main__':
+    main()
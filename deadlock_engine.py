@@ -0,0 +1,1025 @@
+"""Qt-free resource allocation graph model and deadlock detection.
+
+The engine stores the graph as compact integer-indexed arrays so it can be
+used without a QGraphicsScene: in headless workers, batch jobs and tests.
+``GraphManager`` and ``GraphicsNode`` are thin views over one ``RAGEngine``.
+"""
+from array import array
+from collections import deque
+
+import numpy as np
+
+from profiling import profiler
+
+PROCESS = 'process'
+RESOURCE = 'resource'
+
+# Detection modes accepted by ``RAGEngine.detect``
+CYCLE_MODE = 'cycle'
+REDUCTION_MODE = 'reduction'
+DETECTION_MODES = (CYCLE_MODE, REDUCTION_MODE)
+
+# How many traversal steps pass between two calls of a ``cancel`` callback
+_CANCEL_CHECK_MASK = 0xFFF
+
+
+class DetectionCancelled(Exception):
+    """Raised inside detection when its ``cancel`` callback returns true"""
+
+# Node kinds are stored as single bytes in ``RAGEngine.kinds``
+_KIND_CODES = {PROCESS: 0, RESOURCE: 1}
+_KIND_NAMES = (PROCESS, RESOURCE)
+
+
+class RAGEngine:
+    """Array-backed resource allocation graph.
+
+    Nodes are addressed by a dense integer index; ``index`` maps names to
+    indices. Edge multiplicities live in per-node ``succ``/``pred`` dicts of
+    ``{neighbour_index: instances}``. The edge type is implied by the kind of
+    the source node: process -> resource is a request, resource -> process is
+    an allocation.
+
+    The wait-for graph used by cycle detection is maintained incrementally:
+    every edge change re-evaluates only the affected request edges and keeps
+    a dynamic topological order (Pearce-Kelly) of the wait-for edges. Edges
+    that would close a cycle are kept aside in ``back_edges``, so
+    ``has_cycle`` is always current. Deleting an edge may break the cycle a
+    parked edge closed; those edges are re-tried lazily on the next
+    ``has_cycle`` query, so bulk deletions stay linear.
+
+    Maximum claims for deadlock avoidance are kept by name in ``claims``
+    (``{process: {resource: maximum}}``), independent of the node arrays.
+    """
+
+    __slots__ = ('names', 'index', 'kinds', 'instances', 'available',
+                 'requested', 'xs', 'ys', 'succ', 'pred', 'edge_count',
+                 'order', 'next_order', 'dag_succ', 'dag_pred', 'back_edges',
+                 'back_edges_stale', 'claims')
+
+    def __init__(self):
+        self.names = []
+        self.index = {}
+        self.kinds = bytearray()
+        self.instances = array('l')
+        self.available = array('l')
+        self.requested = array('l')
+        self.xs = array('d')
+        self.ys = array('d')
+        self.succ = []
+        self.pred = []
+        self.edge_count = 0
+        # Incremental wait-for graph: topological position of every node,
+        # acyclic part as adjacency sets, and the edges that close cycles
+        self.order = array('q')
+        self.next_order = 0
+        self.dag_succ = []
+        self.dag_pred = []
+        self.back_edges = set()
+        self.back_edges_stale = False
+        self.claims = {}
+
+    def __len__(self):
+        return len(self.names)
+
+    def __contains__(self, name):
+        return name in self.index
+
+    def copy(self):
+        """Return an independent copy of the engine"""
+        other = RAGEngine.__new__(RAGEngine)
+        other.names = list(self.names)
+        other.index = dict(self.index)
+        other.kinds = bytearray(self.kinds)
+        other.instances = array('l', self.instances)
+        other.available = array('l', self.available)
+        other.requested = array('l', self.requested)
+        other.xs = array('d', self.xs)
+        other.ys = array('d', self.ys)
+        other.succ = [dict(s) for s in self.succ]
+        other.pred = [dict(p) for p in self.pred]
+        other.edge_count = self.edge_count
+        other.order = array('q', self.order)
+        other.next_order = self.next_order
+        other.dag_succ = [set(s) for s in self.dag_succ]
+        other.dag_pred = [set(p) for p in self.dag_pred]
+        other.back_edges = set(self.back_edges)
+        other.back_edges_stale = self.back_edges_stale
+        other.claims = {p: dict(c) for p, c in self.claims.items()}
+        return other
+
+    def snapshot(self):
+        """Compact, immutable picture of the graph: names plus packed arrays.
+
+        The incremental wait-for state is not stored; ``from_snapshot``
+        rebuilds it in linear time.
+        """
+        sources = array('l')
+        targets = array('l')
+        counts = array('l')
+        for u, edges in enumerate(self.succ):
+            for v, n in edges.items():
+                sources.append(u)
+                targets.append(v)
+                counts.append(n)
+        return {
+            'names': tuple(self.names),
+            'kinds': bytes(self.kinds),
+            'instances': self.instances.tobytes(),
+            'available': self.available.tobytes(),
+            'xs': self.xs.tobytes(),
+            'ys': self.ys.tobytes(),
+            'sources': sources.tobytes(),
+            'targets': targets.tobytes(),
+            'counts': counts.tobytes(),
+            'claims': tuple(self.iter_claims()),
+        }
+
+    @classmethod
+    def from_snapshot(cls, snapshot):
+        """Build an engine from ``snapshot()`` output"""
+        engine = cls()
+        engine.load_arrays(
+            snapshot['names'], snapshot['kinds'],
+            array('l', snapshot['instances']), array('l', snapshot['available']),
+            array('d', snapshot['xs']), array('d', snapshot['ys']),
+            array('l', snapshot['sources']), array('l', snapshot['targets']),
+            array('l', snapshot['counts']))
+        for process, resource, maximum in snapshot.get('claims', ()):
+            engine.set_claim(process, resource, maximum)
+        return engine
+
+    def load_arrays(self, names, kinds, instances, available, xs, ys,
+                    sources, targets, counts):
+        """Replace the whole graph from columnar data in one pass.
+
+        ``sources``/``targets`` are node indices into ``names``. Available
+        counts are taken as given rather than derived from the allocations,
+        so they must equal the instances the allocations leave free
+        (``rag_io`` checks this for files).
+        """
+        n = len(names)
+        self.names = list(names)
+        self.index = {name: i for i, name in enumerate(self.names)}
+        self.kinds = bytearray(kinds)
+        self.instances = array('l', instances)
+        self.available = array('l', available)
+        self.requested = array('l', bytes(n * self.requested.itemsize))
+        self.xs = array('d', xs)
+        self.ys = array('d', ys)
+        self.succ = [{} for _ in range(n)]
+        self.pred = [{} for _ in range(n)]
+        requested = self.requested
+        for u, v, count in zip(sources, targets, counts):
+            self.succ[u][v] = self.succ[u].get(v, 0) + count
+            self.pred[v][u] = self.succ[u][v]
+            if self.kinds[u] == 0:
+                requested[v] += count
+        self.edge_count = sum(len(edges) for edges in self.succ)
+        self.rebuild_wait_for()
+
+    def rebuild_wait_for(self):
+        """Recompute the incremental wait-for state from scratch in O(V + E).
+
+        A depth-first search puts nodes in reverse postorder; edges into a
+        node still on the DFS path close cycles and become back edges, every
+        other edge agrees with that order.
+        """
+        n = len(self.names)
+        adjacency = [self.wait_for_successors(u) for u in range(n)]
+        self.dag_succ = [set() for _ in range(n)]
+        self.dag_pred = [set() for _ in range(n)]
+        self.back_edges = set()
+        self.back_edges_stale = False
+        state = bytearray(n)  # 0 new, 1 on the DFS path, 2 finished
+        finished = []
+        for root in range(n):
+            if state[root]:
+                continue
+            state[root] = 1
+            work = [(root, iter(adjacency[root]))]
+            while work:
+                u, successors = work[-1]
+                for v in successors:
+                    if state[v] == 1:
+                        self.back_edges.add((u, v))
+                        continue
+                    self.dag_succ[u].add(v)
+                    self.dag_pred[v].add(u)
+                    if state[v] == 0:
+                        state[v] = 1
+                        work.append((v, iter(adjacency[v])))
+                        break
+                else:
+                    state[u] = 2
+                    finished.append(u)
+                    work.pop()
+        self.order = array('q', bytes(n * 8))
+        for position, u in enumerate(reversed(finished)):
+            self.order[u] = position
+        self.next_order = n
+
+    @property
+    def has_cycle(self):
+        """Whether the wait-for graph currently contains a cycle"""
+        if self.back_edges_stale:
+            # A parked edge may no longer close a cycle; retry each of them
+            self.back_edges_stale = False
+            for edge in list(self.back_edges):
+                self.back_edges.discard(edge)
+                self._wait_insert(*edge)
+        return bool(self.back_edges)
+
+    # Nodes
+
+    def add_node(self, name, node_type, instances=1, x=0.0, y=0.0):
+        """Append a node and return its index"""
+        if name in self.index:
+            raise ValueError(f"Node {name!r} already exists")
+        i = len(self.names)
+        self.names.append(name)
+        self.index[name] = i
+        self.kinds.append(_KIND_CODES[node_type])
+        self.instances.append(instances)
+        self.available.append(instances)
+        self.requested.append(0)
+        self.xs.append(x)
+        self.ys.append(y)
+        self.succ.append({})
+        self.pred.append({})
+        self.order.append(self.next_order)
+        self.next_order += 1
+        self.dag_succ.append(set())
+        self.dag_pred.append(set())
+        return i
+
+    def remove_node(self, name):
+        """Remove a node that has no edges.
+
+        The last node is moved into the freed slot so the arrays stay dense;
+        code holding names instead of indices is unaffected.
+        """
+        i = self.index[name]
+        if self.succ[i] or self.pred[i]:
+            raise ValueError(f"Node {name!r} still has edges")
+        last = len(self.names) - 1
+        if i != last:
+            moved = self.names[last]
+            self.names[i] = moved
+            self.index[moved] = i
+            for column in (self.kinds, self.instances, self.available,
+                           self.requested, self.xs, self.ys, self.order):
+                column[i] = column[last]
+            self.succ[i] = self.succ[last]
+            self.pred[i] = self.pred[last]
+            for v in self.succ[i]:
+                self.pred[v][i] = self.pred[v].pop(last)
+            for u in self.pred[i]:
+                self.succ[u][i] = self.succ[u].pop(last)
+            self.dag_succ[i] = self.dag_succ[last]
+            self.dag_pred[i] = self.dag_pred[last]
+            for v in self.dag_succ[i]:
+                self.dag_pred[v].remove(last)
+                self.dag_pred[v].add(i)
+            for u in self.dag_pred[i]:
+                self.dag_succ[u].remove(last)
+                self.dag_succ[u].add(i)
+            self.back_edges = {(i if u == last else u, i if v == last else v)
+                               for u, v in self.back_edges}
+        del self.index[name]
+        for column in (self.names, self.kinds, self.instances, self.available,
+                       self.requested, self.xs, self.ys, self.succ, self.pred,
+                       self.order, self.dag_succ, self.dag_pred):
+            del column[last]
+
+    def set_instances(self, name, instances):
+        """Change a resource's total instances; the change is applied to the
+        available instances as well, which must not become negative"""
+        r = self.index[name]
+        delta = instances - self.instances[r]
+        if self.available[r] + delta < 0:
+            raise ValueError(f"{name!r} has more than {instances} instances allocated")
+        self.instances[r] = instances
+        self.available[r] += delta
+        for p in self.pred[r]:
+            self._refresh_request(p, r)
+
+    def node_type(self, name):
+        return _KIND_NAMES[self.kinds[self.index[name]]]
+
+    def is_process(self, i):
+        return self.kinds[i] == 0
+
+    def set_position(self, name, x, y):
+        i = self.index[name]
+        self.xs[i] = x
+        self.ys[i] = y
+
+    def position(self, name):
+        i = self.index[name]
+        return self.xs[i], self.ys[i]
+
+    # Maximum claims
+
+    def set_claim(self, process, resource, maximum):
+        """Declare the most instances of ``resource`` that ``process`` will
+        ever hold at once; 0 withdraws the claim"""
+        if maximum:
+            self.claims.setdefault(process, {})[resource] = maximum
+        elif resource in self.claims.get(process, ()):
+            del self.claims[process][resource]
+            if not self.claims[process]:
+                del self.claims[process]
+
+    def claim(self, process, resource):
+        """Declared maximum claim, 0 if none"""
+        return self.claims.get(process, {}).get(resource, 0)
+
+    def max_claim(self, process, resource):
+        """Claim used by avoidance. A process that declared nothing may
+        need every instance of every resource."""
+        if process in self.claims:
+            return self.claims[process].get(resource, 0)
+        return self.instances[self.index[resource]]
+
+    def iter_claims(self):
+        """Yield ``(process, resource, maximum)`` for every declared claim"""
+        for process, claims in self.claims.items():
+            for resource, maximum in claims.items():
+                yield process, resource, maximum
+
+    # Edges
+
+    def edge_type(self, u):
+        """Type of the edges leaving node index ``u``"""
+        return 'request' if self.kinds[u] == 0 else 'allocation'
+
+    def add_edge(self, from_node, to_node, instances=1):
+        """Add ``instances`` to the edge between two named nodes.
+
+        Allocation edges deduct from the resource's available instances.
+        """
+        u = self.index[from_node]
+        v = self.index[to_node]
+        if self.kinds[u] == self.kinds[v]:
+            raise ValueError("Edges must connect a process and a resource")
+        self._set_edge(u, v, self.succ[u].get(v, 0) + instances)
+
+    def remove_edge(self, from_node, to_node, instances=None):
+        """Remove ``instances`` from an edge, or the whole edge if ``None``.
+
+        Removing allocation instances returns them to the resource.
+        """
+        u = self.index[from_node]
+        v = self.index[to_node]
+        current = self.succ[u].get(v, 0)
+        if instances is None or instances > current:
+            instances = current
+        self._set_edge(u, v, current - instances)
+
+    def add_edges(self, edges):
+        """Add many ``(from_node, to_node, instances)`` edges at once.
+
+        Counters are updated per edge but the wait-for graph is rebuilt once
+        at the end, which beats incremental maintenance for large batches.
+        """
+        index = self.index
+        kinds = self.kinds
+        for from_node, to_node, instances in edges:
+            u = index[from_node]
+            v = index[to_node]
+            if kinds[u] == kinds[v]:
+                raise ValueError("Edges must connect a process and a resource")
+            self._set_edge(u, v, self.succ[u].get(v, 0) + instances, maintain=False)
+        self.rebuild_wait_for()
+
+    def _set_edge(self, u, v, instances, maintain=True):
+        """Set an edge multiplicity and update counters and the wait-for graph"""
+        current = self.succ[u].get(v, 0)
+        delta = instances - current
+        if delta == 0:
+            return
+        if instances:
+            if not current:
+                self.edge_count += 1
+            self.succ[u][v] = instances
+            self.pred[v][u] = instances
+        else:
+            self.edge_count -= 1
+            del self.succ[u][v]
+            del self.pred[v][u]
+
+        if self.kinds[u] == 0:
+            # Request p -> r: only this edge can change state
+            self.requested[v] += delta
+            if maintain:
+                self._refresh_request(u, v)
+            return
+
+        # Allocation r -> p changes what r has free and whether p holds
+        # anything, which affects requests into r and requests made by p
+        self.available[u] -= delta
+        if not maintain:
+            return
+        if instances and not current:
+            self._wait_insert(u, v)
+        elif current and not instances:
+            self._wait_delete(u, v)
+        for p in self.pred[u]:
+            self._refresh_request(p, u)
+        if (current == 0) != (instances == 0):
+            for r in self.succ[v]:
+                self._refresh_request(v, r)
+
+    def edge_instances(self, from_node, to_node):
+        """Multiplicity of an edge, 0 if it does not exist"""
+        return self.succ[self.index[from_node]].get(self.index[to_node], 0)
+
+    def iter_edges(self):
+        """Yield ``(from_name, to_name, edge_type, instances)`` for every edge"""
+        names = self.names
+        for u, targets in enumerate(self.succ):
+            edge_type = self.edge_type(u)
+            for v, instances in targets.items():
+                yield names[u], names[v], edge_type, instances
+
+    # Detection
+
+    def wait_for_successors(self, u):
+        """Successors of ``u`` in the wait-for graph used for detection.
+
+        Allocation edges always count. A request edge counts only when the
+        requesting process holds resources and the resource cannot satisfy
+        the request from its available instances.
+        """
+        if self.kinds[u] == 1:
+            return list(self.succ[u])
+        if not self.pred[u]:
+            return []
+        available = self.available
+        return [v for v, n in self.succ[u].items() if available[v] < n]
+
+    def on_cycle(self, name):
+        """Whether node ``name`` lies on a cycle of the wait-for graph.
+
+        Searches only what is reachable from the node, so it is much
+        cheaper than full detection when a new request may close a cycle.
+        """
+        start = self.index[name]
+        seen = {start}
+        stack = [start]
+        while stack:
+            for v in self.wait_for_successors(stack.pop()):
+                if v == start:
+                    return True
+                if v not in seen:
+                    seen.add(v)
+                    stack.append(v)
+        return False
+
+    def wait_for_graph(self):
+        """Adjacency lists of the wait-for graph, indexed like the nodes"""
+        back = {}
+        for u, v in self.back_edges:
+            back.setdefault(u, []).append(v)
+        return [list(dag) + back.get(u, [])
+                for u, dag in enumerate(self.dag_succ)]
+
+    def _is_waiting(self, u, v):
+        if v in self.dag_succ[u]:
+            return True
+        return (u, v) in self.back_edges
+
+    def _refresh_request(self, p, r):
+        """Bring request edge ``p -> r`` in line with ``wait_for_successors``"""
+        n = self.succ[p].get(r, 0)
+        wanted = bool(n) and bool(self.pred[p]) and self.available[r] < n
+        if wanted != self._is_waiting(p, r):
+            if wanted:
+                self._wait_insert(p, r)
+            else:
+                self._wait_delete(p, r)
+
+    def _wait_insert(self, x, y):
+        """Insert wait-for edge ``x -> y`` keeping the topological order.
+
+        Pearce-Kelly: only nodes whose position lies between ``y`` and ``x``
+        are visited and reordered. If ``x`` is reachable from ``y`` the edge
+        closes a cycle and is parked in ``back_edges`` instead.
+        """
+        order = self.order
+        lower = order[y]
+        upper = order[x]
+        if lower > upper:
+            self.dag_succ[x].add(y)
+            self.dag_pred[y].add(x)
+            return
+
+        forward = []
+        seen = {y}
+        stack = [y]
+        while stack:
+            u = stack.pop()
+            forward.append(u)
+            for w in self.dag_succ[u]:
+                if w == x:
+                    self.back_edges.add((x, y))
+                    return
+                if w not in seen and order[w] < upper:
+                    seen.add(w)
+                    stack.append(w)
+
+        backward = []
+        seen = {x}
+        stack = [x]
+        while stack:
+            u = stack.pop()
+            backward.append(u)
+            for w in self.dag_pred[u]:
+                if w not in seen and order[w] > lower:
+                    seen.add(w)
+                    stack.append(w)
+
+        forward.sort(key=order.__getitem__)
+        backward.sort(key=order.__getitem__)
+        affected = backward + forward
+        slots = sorted(order[u] for u in affected)
+        for u, slot in zip(affected, slots):
+            order[u] = slot
+        self.dag_succ[x].add(y)
+        self.dag_pred[y].add(x)
+
+    def _wait_delete(self, x, y):
+        """Delete wait-for edge ``x -> y``"""
+        if (x, y) in self.back_edges:
+            self.back_edges.discard((x, y))
+            return
+        self.dag_succ[x].discard(y)
+        self.dag_pred[y].discard(x)
+        if self.back_edges:
+            self.back_edges_stale = True
+
+    def detect(self, mode=CYCLE_MODE, cancel=None):
+        """Run detection in the given mode and return a ``DeadlockResult``.
+
+        ``cancel`` is an optional callable polled during long runs; when it
+        returns true, ``DetectionCancelled`` is raised.
+        """
+        if mode not in DETECTION_MODES:
+            raise ValueError(f"Unknown detection mode {mode!r}")
+        with profiler.span('detect', mode=mode, nodes=len(self.names)):
+            if mode == CYCLE_MODE:
+                return self.detect_cycles(cancel)
+            return self.detect_reduction(cancel)
+
+    def detect_cycles(self, cancel=None):
+        """Find the deadlocked nodes in linear time.
+
+        Every node of a strongly connected component with more than one node
+        lies on a cycle of the wait-for graph, so the deadlocked set is the
+        union of those components. Example cycles are only generated when the
+        result is reported.
+        """
+        with profiler.span('detect.wait_for_graph'):
+            adjacency = self.wait_for_graph()
+        return self._result_from_components(adjacency, cancel)
+
+    def _result_from_components(self, adjacency, cancel=None):
+        result = DeadlockResult(self.names, adjacency)
+        with profiler.span('detect.scc'):
+            components = list(strongly_connected_components(adjacency, cancel))
+        for component in components:
+            if len(component) < 2:
+                continue
+            members = set(component)
+            result.components.append(component)
+            for u in component:
+                result.nodes.add(self.names[u])
+                for v in adjacency[u]:
+                    if v in members:
+                        result.edges.add((self.names[u], self.names[v]))
+        return result
+
+    def edge_lists(self):
+        """Requests and allocations as sparse arrays, one entry per edge.
+
+        Returns ``(processes, resources, requests, allocations)``.
+        ``processes`` and ``resources`` are index arrays giving the node
+        index of each process row and resource column. ``requests`` and
+        ``allocations`` are ``(rows, cols, counts)`` array triples. Memory
+        grows with the edges, not with processes times resources.
+        """
+        kinds = np.frombuffer(bytes(self.kinds), dtype=np.uint8)
+        processes = np.flatnonzero(kinds == 0)
+        resources = np.flatnonzero(kinds == 1)
+        row = np.full(len(self.names), -1, dtype=np.intp)
+        row[processes] = np.arange(len(processes))
+        row[resources] = np.arange(len(resources))
+
+        sources = array('q')
+        targets = array('q')
+        counts = array('q')
+        for u, edges in enumerate(self.succ):
+            if edges:
+                sources.extend([u] * len(edges))
+                targets.extend(edges.keys())
+                counts.extend(edges.values())
+        sources = np.frombuffer(sources, dtype=np.int64).astype(np.intp)
+        targets = np.frombuffer(targets, dtype=np.int64).astype(np.intp)
+        counts = np.frombuffer(counts, dtype=np.int64)
+        is_request = kinds[sources] == 0
+        is_allocation = ~is_request
+        requests = (row[sources[is_request]], row[targets[is_request]], counts[is_request])
+        allocations = (row[targets[is_allocation]], row[sources[is_allocation]],
+                       counts[is_allocation])
+        return processes, resources, requests, allocations
+
+    def safe_sequence(self, hint=(), grant=None):
+        """Banker's safety check; returns a safe sequence of process names,
+        or ``None`` if the state is unsafe.
+
+        ``grant=(resource, process, instances)`` checks the state after that
+        allocation instead, with the allocation serving the process's
+        pending request first. Need is the claim (see ``max_claim``) minus
+        the allocation, and never less than what is already requested.
+
+        Need is kept sparse, one entry per edge or declared claim (see
+        ``edge_lists``). A process that declared nothing needs every
+        instance of the resources it has no entry for, so it fits only when
+        none of those is partly in use; that is checked by counting.
+
+        ``hint`` is a previous safe sequence. It is verified in one
+        vectorized pass over the entries and the valid prefix is kept; only
+        the rest is found by rounds that finish every process whose need
+        fits the free instances at once.
+        """
+        processes, resources, requests, allocations = self.edge_lists()
+        req_rows, req_cols, req_counts = requests
+        alloc_rows, alloc_cols, alloc_counts = allocations
+        P, R = len(processes), len(resources)
+        position = np.full(len(self.names), -1, dtype=np.intp)
+        position[processes] = np.arange(P)
+        position[resources] = np.arange(R)
+        instances = np.frombuffer(self.instances, dtype=self.instances.typecode)
+        instances = instances[resources].astype(np.int64)
+        available = np.frombuffer(self.available, dtype=self.available.typecode)
+        available = available[resources].astype(np.int64)
+
+        declared = np.zeros(P, dtype=bool)
+        claim_rows, claim_cols, claim_counts = [], [], []
+        for process, claims in self.claims.items():
+            if process in self.index:
+                row = position[self.index[process]]
+                declared[row] = True
+                for resource, maximum in claims.items():
+                    if resource in self.index:
+                        claim_rows.append(row)
+                        claim_cols.append(position[self.index[resource]])
+                        claim_counts.append(maximum)
+
+        if grant is not None:
+            resource, process, count = grant
+            row = position[self.index[process]]
+            col = position[self.index[resource]]
+            if available[col] < count:
+                return None
+            available[col] -= count
+            pending = self.succ[self.index[process]].get(self.index[resource], 0)
+            alloc_rows, alloc_cols, alloc_counts = (
+                np.append(alloc_rows, row), np.append(alloc_cols, col),
+                np.append(alloc_counts, count))
+            req_rows, req_cols, req_counts = (
+                np.append(req_rows, row), np.append(req_cols, col),
+                np.append(req_counts, -min(count, pending)))
+
+        # One entry per (process, resource) pair with an edge or a claim
+        width = max(R, 1)
+        keys, inverse = np.unique(np.concatenate([
+            req_rows.astype(np.int64) * width + req_cols,
+            alloc_rows.astype(np.int64) * width + alloc_cols,
+            np.asarray(claim_rows, dtype=np.int64) * width
+            + np.asarray(claim_cols, dtype=np.int64)]), return_inverse=True)
+        n_req, n_alloc = len(req_rows), len(alloc_rows)
+        requested = np.bincount(inverse[:n_req], req_counts,
+                                minlength=len(keys)).astype(np.int64)
+        held = np.bincount(inverse[n_req:n_req + n_alloc], alloc_counts,
+                           minlength=len(keys)).astype(np.int64)
+        rows = (keys // width).astype(np.intp)
+        cols = (keys % width).astype(np.intp)
+        claim = np.where(declared[rows], 0, instances[cols])
+        claim[inverse[n_req + n_alloc:]] = claim_counts
+        need = np.maximum(claim, held + requested) - held
+        holding = held > 0
+        held_rows, held_cols, held = rows[holding], cols[holding], held[holding]
+
+        # Order processes as in the hint, then everything it does not cover
+        hinted = list(dict.fromkeys(
+            position[self.index[name]] for name in hint
+            if name in self.index and self.kinds[self.index[name]] == 0))
+        listed = np.zeros(P, dtype=bool)
+        listed[hinted] = True
+        order = np.concatenate([np.asarray(hinted, dtype=np.intp),
+                                np.flatnonzero(~listed)])
+        rank = np.empty(P, dtype=np.int64)
+        rank[order] = np.arange(P)
+
+        # Free instances before each process in that order: the available
+        # ones plus what every process ranked before it released
+        by_rank = np.lexsort((rank[held_rows], held_cols))
+        held_keys = held_cols[by_rank] * (P + 1) + rank[held_rows[by_rank]]
+        released = np.concatenate([[0], np.cumsum(held[by_rank])])
+        column_start = np.searchsorted(held_keys, np.arange(R) * (P + 1))
+        before = (released[np.searchsorted(held_keys, cols * (P + 1) + rank[rows])]
+                  - released[column_start[cols]])
+        fits = np.ones(P, dtype=bool)
+        fits[rows[need > available[cols] + before]] = False
+        # Rank from which each resource is entirely free again
+        deficit = instances - available
+        sorted_cols = held_cols[by_rank]
+        reached = (released[1:] - released[column_start[sorted_cols]]
+                   >= deficit[sorted_cols])
+        free_from = np.where(deficit > 0, P + 1, 0)
+        np.minimum.at(free_from, sorted_cols[reached],
+                      rank[held_rows[by_rank]][reached] + 1)
+        partly_used = R - np.searchsorted(np.sort(free_from), rank, side='right')
+        partly_used -= np.bincount(rows[free_from[cols] > rank[rows]], minlength=P)
+        fits &= declared | (partly_used == 0)
+        if fits[order].all():
+            return [self.names[processes[row]] for row in order]
+
+        prefix = int(np.argmin(fits[order]))
+        sequence = order[:prefix].tolist()
+        finished = np.zeros(P, dtype=bool)
+        finished[sequence] = True
+        releasing = finished[held_rows]
+        work = available + np.bincount(held_cols[releasing], held[releasing],
+                                       minlength=R).astype(np.int64)
+        keep = ~finished[rows]
+        rows, cols, need = rows[keep], cols[keep], need[keep]
+        keep = ~releasing
+        held_rows, held_cols, held = held_rows[keep], held_cols[keep], held[keep]
+        while not finished.all():
+            runnable = ~finished
+            runnable[rows[need > work[cols]]] = False
+            partly_free = work < instances
+            partly_used = (np.count_nonzero(partly_free)
+                           - np.bincount(rows[partly_free[cols]], minlength=P))
+            runnable &= declared | (partly_used == 0)
+            if not runnable.any():
+                return None
+            sequence.extend(np.flatnonzero(runnable).tolist())
+            releasing = runnable[held_rows]
+            work = work + np.bincount(held_cols[releasing], held[releasing],
+                                      minlength=R).astype(np.int64)
+            finished |= runnable
+            # Drop the entries of finished processes
+            keep = ~finished[rows]
+            rows, cols, need = rows[keep], cols[keep], need[keep]
+            keep = ~releasing
+            held_rows, held_cols, held = held_rows[keep], held_cols[keep], held[keep]
+        return [self.names[processes[row]] for row in sequence]
+
+    def detect_reduction(self, cancel=None):
+        """Exact multi-instance detection by Coffman/Holt graph reduction.
+
+        Each step reduces every process whose outstanding requests fit in the
+        currently free instances, releasing their allocations at once.
+        Processes holding nothing cannot be part of a deadlock and start out
+        reduced. Whatever cannot be reduced is exactly the deadlocked set.
+
+        Works on per-edge arrays (see ``edge_lists``), so memory and each
+        step's cost grow with the edges still unreduced.
+        """
+        with profiler.span('detect.edge_lists'):
+            processes, resources, requests, allocations = self.edge_lists()
+        req_rows, req_cols, req_counts = requests
+        alloc_rows, alloc_cols, alloc_counts = allocations
+        available = np.frombuffer(self.available, dtype=self.available.typecode)
+        work = available[resources].astype(np.int64)
+        with profiler.span('detect.reduce'):
+            finished = np.bincount(alloc_rows, minlength=len(processes)) == 0
+            keep = ~finished[req_rows]
+            req_rows, req_cols, req_counts = req_rows[keep], req_cols[keep], req_counts[keep]
+            while True:
+                if cancel is not None and cancel():
+                    raise DetectionCancelled()
+                unmet = req_counts > work[req_cols]
+                runnable = ~finished
+                runnable[req_rows[unmet]] = False
+                if not runnable.any():
+                    break
+                released = runnable[alloc_rows]
+                work += np.bincount(alloc_cols[released], alloc_counts[released],
+                                    minlength=len(resources)).astype(np.int64)
+                finished |= runnable
+                # Drop the edges of reduced processes
+                keep = ~released
+                alloc_rows, alloc_cols, alloc_counts = (
+                    alloc_rows[keep], alloc_cols[keep], alloc_counts[keep])
+                keep = ~finished[req_rows]
+                req_rows, req_cols, req_counts = req_rows[keep], req_cols[keep], req_counts[keep]
+
+        blocked = ~finished
+        if not blocked.any():
+            result = DeadlockResult(self.names, [[] for _ in self.names])
+            result.processes = []
+            return result
+
+        # Restrict the graph to deadlocked processes, the resources they are
+        # blocked on and the allocations of those resources among them
+        unmet = req_counts > work[req_cols]
+        waiting_p = processes[req_rows[unmet]].tolist()
+        waiting_r = resources[req_cols[unmet]].tolist()
+        deadlocked = set(processes[blocked].tolist())
+        adjacency = [[] for _ in self.names]
+        for p, r in zip(waiting_p, waiting_r):
+            adjacency[p].append(r)
+        for r in set(waiting_r):
+            adjacency[r] = [p for p in self.succ[r] if p in deadlocked]
+
+        result = self._result_from_components(adjacency, cancel)
+        result.processes = sorted(self.names[p] for p in deadlocked)
+        for p in deadlocked:
+            result.nodes.add(self.names[p])
+            for r in adjacency[p]:
+                result.nodes.add(self.names[r])
+                result.edges.add((self.names[p], self.names[r]))
+                for q in adjacency[r]:
+                    result.edges.add((self.names[r], self.names[q]))
+        return result
+
+
+def strongly_connected_components(adjacency, cancel=None):
+    """Iterative Tarjan's algorithm over ``adjacency`` lists of indices.
+
+    Yields each component as a list of node indices. Runs in O(V + E) and
+    does not recurse, so deep graphs cannot exhaust the Python stack.
+    ``cancel`` is polled every few thousand nodes.
+    """
+    n = len(adjacency)
+    index_of = [-1] * n
+    lowlink = [0] * n
+    on_stack = bytearray(n)
+    stack = []
+    counter = 0
+    for root in range(n):
+        if index_of[root] != -1:
+            continue
+        index_of[root] = lowlink[root] = counter
+        counter += 1
+        if cancel is not None and not counter & _CANCEL_CHECK_MASK and cancel():
+            raise DetectionCancelled()
+        stack.append(root)
+        on_stack[root] = 1
+        work = [(root, iter(adjacency[root]))]
+        while work:
+            u, successors = work[-1]
+            for v in successors:
+                if index_of[v] == -1:
+                    index_of[v] = lowlink[v] = counter
+                    counter += 1
+                    if (cancel is not None and not counter & _CANCEL_CHECK_MASK
+                            and cancel()):
+                        raise DetectionCancelled()
+                    stack.append(v)
+                    on_stack[v] = 1
+                    work.append((v, iter(adjacency[v])))
+                    break
+                if on_stack[v] and index_of[v] < lowlink[u]:
+                    lowlink[u] = index_of[v]
+            else:
+                work.pop()
+                if work:
+                    parent = work[-1][0]
+                    if lowlink[u] < lowlink[parent]:
+                        lowlink[parent] = lowlink[u]
+                if lowlink[u] == index_of[u]:
+                    component = []
+                    while True:
+                        v = stack.pop()
+                        on_stack[v] = 0
+                        component.append(v)
+                        if v == u:
+                            break
+                    yield component
+
+
+def iter_component_cycles(adjacency, component, limit, cancel=None):
+    """Lazily yield up to ``limit`` distinct cycles inside one component.
+
+    Each cycle is the shortest one through a given start node, found with a
+    breadth-first search restricted to the component, so producing a cycle
+    costs O(component edges) regardless of how many cycles exist.
+    """
+    members = set(component)
+    seen = set()
+    produced = 0
+    for start in sorted(component):
+        if produced >= limit:
+            return
+        if cancel is not None and cancel():
+            raise DetectionCancelled()
+        parent = {}
+        queue = deque()
+        for v in adjacency[start]:
+            if v in members and v not in parent:
+                parent[v] = start
+                queue.append(v)
+        while queue:
+            u = queue.popleft()
+            if u == start:
+                break
+            for v in adjacency[u]:
+                if v in members and v not in parent:
+                    parent[v] = u
+                    queue.append(v)
+        if start not in parent:
+            continue
+        cycle = [start]
+        u = parent[start]
+        while u != start:
+            cycle.append(u)
+            u = parent[u]
+        cycle.reverse()
+        # Rotate so the smallest index leads, to recognise repeats
+        pivot = cycle.index(min(cycle))
+        cycle = cycle[pivot:] + cycle[:pivot]
+        key = tuple(cycle)
+        if key in seen:
+            continue
+        seen.add(key)
+        produced += 1
+        yield cycle
+
+
+class DeadlockResult:
+    """Outcome of a detection run, expressed in node names"""
+
+    __slots__ = ('nodes', 'edges', 'components', 'processes',
+                 '_names', '_adjacency')
+
+    def __init__(self, names=(), adjacency=()):
+        self.nodes = set()
+        self.edges = set()
+        self.components = []
+        # Exact deadlocked processes, set by reduction detection
+        self.processes = None
+        self._names = names
+        self._adjacency = adjacency
+
+    def __bool__(self):
+        return bool(self.nodes)
+
+    def component_of(self, name):
+        """The deadlocked component containing node ``name``, or ``None``"""
+        for component in self.components:
+            if any(self._names[i] == name for i in component):
+                return component
+        return None
+
+    def component_graph(self, component):
+        """Wait-for successors of each member of ``component`` that lie in
+        the same component, as ``{index: [index, ...]}``"""
+        members = set(component)
+        return {u: [v for v in self._adjacency[u] if v in members]
+                for u in component}
+
+    def iter_cycles(self, limit_per_component=5, components=None):
+        """Yield example cycles as lists of names, capped per component.
+
+        ``components`` restricts the cycles to some of ``self.components``.
+        """
+        names = self._names
+        for component in self.components if components is None else components:
+            for cycle in iter_component_cycles(self._adjacency, component,
+                                               limit_per_component):
+                yield [names[i] for i in cycle]
+
+    def summary(self, limit_per_component=5):
+        """JSON-friendly description of the result"""
+        names = self._names
+        return {
+            'deadlock': bool(self),
+            'deadlocked': sorted(self.nodes),
+            'processes': self.processes,
+            'components': [sorted(names[i] for i in component)
+                           for component in self.components],
+            'cycles': list(self.iter_cycles(limit_per_component)),
+        }
+
+    def message(self, limit_per_component=5, cancel=None):
+        if not self:
+            return "No deadlock detected."
+        header = "Deadlock detected!"
+        if self.processes is not None:
+            header += f"\nDeadlocked processes: {', '.join(self.processes)}"
+        lines = []
+        with profiler.span('detect.report', components=len(self.components)):
+            for number, component in enumerate(self.components, 1):
+                names = sorted(self._names[i] for i in component)
+                lines.append(f"Component {number}: {', '.join(names)}")
+                for cycle in iter_component_cycles(self._adjacency, component,
+                                                   limit_per_component, cancel):
+                    lines.append("  " + " → ".join(self._names[i] for i in cycle))
+        cycle_str = "\n".join(lines)
+        return f"{header}\nCycles found:\n{cycle_str}"
@@ -1,22 +1,59 @@
-from PyQt6.QtWidgets import QGraphicsItem
+from PyQt6.QtWidgets import QGraphicsItem, QGraphicsPathItem
 from PyQt6.QtCore import Qt, QRectF, QPointF
-from PyQt6.QtGui import QPainter, QPen, QBrush, QColor
-import networkx as nx
+from PyQt6.QtGui import QPainter, QPen, QBrush, QColor, QPainterPath
 import math
 
+from deadlock_engine import RAGEngine, CYCLE_MODE
+from history import History, HistoryEntry, apply_ops, diff_ops, invert
+from profiling import profiler
+import graph_script
+
+# Level of detail: below this zoom factor edge bundles collapse and node
+# labels are skipped. Above either size threshold the whole scene renders
+# in low detail regardless of zoom.
+LOD_ZOOM_THRESHOLD = 0.5
+LOD_NODE_THRESHOLD = 500
+LOD_EDGE_THRESHOLD = 2000
+
 class GraphicsNode(QGraphicsItem):
+    # Set for every node at once when the graph exceeds the LOD thresholds
+    low_detail = False
+
     def __init__(self, x, y, name, node_type, instances=1):
         super().__init__()
         self.name = name
         self.node_type = node_type
-        self.instances = instances
-        self.available_instances = instances
+        # Counts live in the engine once the node is bound to a GraphManager;
+        # they change only through the engine API, never through the node
+        self.engine = None
+        self._instances = instances
+        self._available_instances = instances
         self.setPos(x, y)
-        self.setFlag(QGraphicsItem.GraphicsItemFlag.ItemIsMovable)
-        self.setFlag(QGraphicsItem.GraphicsItemFlag.ItemIsSelectable)
-        self.setFlag(QGraphicsItem.GraphicsItemFlag.ItemSendsGeometryChanges)
+        # One setFlags call: every flag change goes through itemChange
+        self.setFlags(QGraphicsItem.GraphicsItemFlag.ItemIsMovable
+                      | QGraphicsItem.GraphicsItemFlag.ItemIsSelectable
+                      | QGraphicsItem.GraphicsItemFlag.ItemSendsGeometryChanges)
+        # Repaint only when the node itself changes, not on every scene update
+        self.setCacheMode(QGraphicsItem.CacheMode.DeviceCoordinateCache)
         self.size = 50
         self.is_in_deadlock = False
+        self.press_positions = None  # Positions of the dragged nodes when a drag started
+
+    def bind(self, engine):
+        """Make this node a view over its entry in ``engine``"""
+        self.engine = engine
+
+    @property
+    def instances(self):
+        if self.engine is None:
+            return self._instances
+        return self.engine.instances[self.engine.index[self.name]]
+
+    @property
+    def available_instances(self):
+        if self.engine is None:
+            return self._available_instances
+        return self.engine.available[self.engine.index[self.name]]
 
     def boundingRect(self):
         return QRectF(0, 0, self.size, self.size)
@@ -28,114 +65,385 @@ class GraphicsNode(QGraphicsItem):
         else:
             process_color = QColor(173, 216, 230)
             resource_color = QColor(144, 238, 144)
+        lod = option.levelOfDetailFromTransform(painter.worldTransform())
+        show_text = not self.low_detail and lod >= LOD_ZOOM_THRESHOLD
 
         if self.node_type == 'process':
             painter.setBrush(QBrush(process_color))
             painter.setPen(QPen(Qt.GlobalColor.black))
             painter.drawEllipse(0, 0, self.size, self.size)
-            painter.drawText(self.boundingRect(), Qt.AlignmentFlag.AlignCenter, self.name)
+            if show_text:
+                painter.drawText(self.boundingRect(), Qt.AlignmentFlag.AlignCenter, self.name)
         else:
             painter.setBrush(QBrush(resource_color))
             painter.setPen(QPen(Qt.GlobalColor.black))
             painter.drawRect(0, 0, self.size, self.size)
-            text = f"{self.name}\n({self.available_instances}/{self.instances})"
-            painter.drawText(self.boundingRect(), Qt.AlignmentFlag.AlignCenter, text)
+            if show_text:
+                text = f"{self.name}\n({self.available_instances}/{self.instances})"
+                painter.drawText(self.boundingRect(), Qt.AlignmentFlag.AlignCenter, text)
 
     def itemChange(self, change, value):
-        if change == QGraphicsItem.GraphicsItemChange.ItemPositionChange and self.scene():
-            self.scene().parent().update_edges()
+        if change == QGraphicsItem.GraphicsItemChange.ItemPositionHasChanged:
+            if self.engine is not None and self.name in self.engine:
+                self.engine.set_position(self.name, value.x(), value.y())
+            if self.scene():
+                # Only the edges touching this node need new geometry
+                self.scene().parent().update_node_edges(self.name)
         return super().itemChange(change, value)
 
+    def mousePressEvent(self, event):
+        super().mousePressEvent(event)
+        # Qt drags every selected node along with this one
+        dragged = [self] + [item for item in self.scene().selectedItems()
+                            if isinstance(item, GraphicsNode) and item is not self]
+        self.press_positions = {node: (node.pos().x(), node.pos().y()) for node in dragged}
+
+    def mouseReleaseEvent(self, event):
+        super().mouseReleaseEvent(event)
+        if self.press_positions is not None and self.scene():
+            # One history entry per drag, not per intermediate position
+            self.scene().parent().nodes_moved(
+                [(node.name, start, (node.pos().x(), node.pos().y()))
+                 for node, start in self.press_positions.items()
+                 if node.scene() is self.scene()])
+        self.press_positions = None
+
+class EdgeItem(QGraphicsPathItem):
+    """One persistent item drawing a whole bundle of parallel edge instances.
+
+    When zoomed out, or when the graph is large (``low_detail``), the bundle
+    is drawn as a single line weighted by the instance count with a count
+    label instead of one line per instance.
+    """
+
+    # Set for every edge at once when the graph exceeds the LOD thresholds
+    low_detail = False
+
+    def __init__(self, from_node, to_node, edge_type, instances, is_deadlock=False):
+        super().__init__()
+        self.from_node = from_node
+        self.to_node = to_node
+        self.collapsed_path = QPainterPath()
+        self.label_pos = QPointF()
+        self.edge_type = None
+        self.instances = 0
+        self.is_deadlock = None
+        self.set_state(edge_type, instances, is_deadlock)
+
+    def set_state(self, edge_type, instances, is_deadlock):
+        """Restyle and reshape only when something actually changed"""
+        if (edge_type, instances, is_deadlock) == (self.edge_type, self.instances,
+                                                   self.is_deadlock):
+            return
+        if (edge_type, is_deadlock) != (self.edge_type, self.is_deadlock):
+            color = QColor(255, 0, 0) if is_deadlock else (
+                Qt.GlobalColor.red if edge_type == 'request' else Qt.GlobalColor.green
+            )
+            self.setPen(QPen(color, 4 if is_deadlock else 2))  # Thicker for deadlocks
+        self.edge_type = edge_type
+        self.is_deadlock = is_deadlock
+        if instances != self.instances:
+            self.instances = instances
+            self.update_geometry()
+
+    def update_geometry(self):
+        """Rebuild the bundle path from the current node positions"""
+        start_pos = self.from_node.pos()
+        end_pos = self.to_node.pos()
+        base_start_x = start_pos.x() + self.from_node.size/2
+        base_start_y = start_pos.y() + self.from_node.size/2
+        base_end_x = end_pos.x() + self.to_node.size/2
+        base_end_y = end_pos.y() + self.to_node.size/2
+
+        path = QPainterPath()
+        dx = end_pos.x() - start_pos.x()
+        dy = end_pos.y() - start_pos.y()
+        length = math.sqrt(dx*dx + dy*dy)
+        if length == 0:  # Nodes on top of each other
+            self.collapsed_path = path
+            self.setPath(path)
+            return
+
+        # Perpendicular offset between parallel instance lines
+        normal_x = -dy/length * 5
+        normal_y = dx/length * 5
+        # Every line in the bundle shares the same angle
+        angle = math.atan2(dy, dx)
+        arrow_size = 10
+        arrow1_dx = arrow_size * math.cos(angle - math.pi/6)
+        arrow1_dy = arrow_size * math.sin(angle - math.pi/6)
+        arrow2_dx = arrow_size * math.cos(angle + math.pi/6)
+        arrow2_dy = arrow_size * math.sin(angle + math.pi/6)
+
+        # Collapsed form: one centre line with one arrowhead
+        collapsed = QPainterPath()
+        collapsed.moveTo(base_start_x, base_start_y)
+        collapsed.lineTo(base_end_x, base_end_y)
+        collapsed.moveTo(base_end_x - arrow1_dx, base_end_y - arrow1_dy)
+        collapsed.lineTo(base_end_x, base_end_y)
+        collapsed.lineTo(base_end_x - arrow2_dx, base_end_y - arrow2_dy)
+        self.collapsed_path = collapsed
+        self.label_pos = QPointF((base_start_x + base_end_x) / 2 + normal_x * 2,
+                                 (base_start_y + base_end_y) / 2 + normal_y * 2)
+        if self.low_detail:
+            # The full bundle is never shown, so don't build it
+            self.setPath(collapsed)
+            return
+
+        for i in range(self.instances):
+            offset = (i - (self.instances-1)/2)  # Center the bundle
+            end_x = base_end_x + normal_x * offset
+            end_y = base_end_y + normal_y * offset
+            path.moveTo(base_start_x + normal_x * offset, base_start_y + normal_y * offset)
+            path.lineTo(end_x, end_y)
+            path.moveTo(end_x - arrow1_dx, end_y - arrow1_dy)
+            path.lineTo(end_x, end_y)
+            path.lineTo(end_x - arrow2_dx, end_y - arrow2_dy)
+        self.setPath(path)
+
+    def boundingRect(self):
+        # Leave room for the weighted line and the count label
+        return super().boundingRect().adjusted(-20, -20, 20, 20)
+
+    def paint(self, painter: QPainter, option, widget):
+        lod = option.levelOfDetailFromTransform(painter.worldTransform())
+        if not self.low_detail and lod >= LOD_ZOOM_THRESHOLD:
+            super().paint(painter, option, widget)
+            return
+        pen = QPen(self.pen())
+        pen.setWidthF(pen.widthF() + min(self.instances - 1, 8))
+        painter.setPen(pen)
+        painter.drawPath(self.collapsed_path)
+        if self.instances > 1:
+            painter.drawText(self.label_pos, f"×{self.instances}")
+
 class GraphManager:
     def __init__(self):
-        self.graph = nx.DiGraph()
+        self.engine = RAGEngine()
         self.nodes = {}
-        self.edges = []
+        self.edges = {}  # (from, to) -> EdgeItem
         self.process_count = 0
         self.resource_count = 0
+        self.deadlock_nodes = set()
         self.deadlock_edges = set()
-        self.history = []
+        self.history = History()
+        # Operations of the action in progress, committed by save_state
+        self.pending_ops = []
+        self.committed_counters = (0, 0)
+        # Bumped whenever the graph changes, to spot stale detection results
+        self.revision = 0
+        # Example cycles listed per deadlocked component in the report
+        self.cycle_report_limit = 5
+        # 'cycle' (SCC on the wait-for graph) or 'reduction' (exact multi-instance)
+        self.detection_mode = CYCLE_MODE
+        # Banker's avoidance: allocations are granted only into safe states
+        self.avoidance = False
+        # Latest safe sequence (None when unsafe), reused as the next hint
+        self.safe_sequence = []
+        # Operations of the what-if branch shown on top of the committed graph
+        self.branch_ops = []
 
-    def save_state(self):
-        state = {
-            'graph': self.graph.copy(),
-            'nodes': dict(self.nodes),
-            'process_count': self.process_count,
-            'resource_count': self.resource_count,
-            'node_positions': {name: (node.pos().x(), node.pos().y(), 
-                                    node.instances if node.node_type == 'resource' else 1,
-                                    node.available_instances if node.node_type == 'resource' else 1) 
-                             for name, node in self.nodes.items()}
-        }
-        self.history.append(state)
-
-    def check_deadlock(self):
-        self.deadlock_edges.clear()
-        for node in self.nodes.values():
-            node.is_in_deadlock = False
-            node.update()
-
-        resource_status = {}
-        for node in self.nodes.values():
-            if node.node_type == 'resource':
-                resource_status[node.name] = {
-                    'total': node.instances,
-                    'allocated': 0,
-                    'requested': 0,
-                    'available': node.available_instances
-                }
-
-        for edge in self.graph.edges(data=True):
-            from_node, to_node, data = edge
-            edge_type = data.get('edge_type')
-            instances = data.get('instances', 1)
-            
-            if edge_type == 'allocation':
-                resource_status[from_node]['allocated'] += instances
-
-        allocation_graph = nx.DiGraph()
-        for node in self.nodes.values():
-            allocation_graph.add_node(node.name)
-
-        for edge in self.graph.edges(data=True):
-            from_node, to_node, data = edge
-            edge_type = data.get('edge_type')
-            instances = data.get('instances', 1)
-            
-            if edge_type == 'request':
-                resource = to_node
-                process = from_node
-                
-                holds_resources = False
-                for e in self.graph.edges(data=True):
-                    if (e[2].get('edge_type') == 'allocation' and 
-                        e[1] == process):
-                        holds_resources = True
-                        break
-                
-                if (holds_resources and 
-                    resource_status[resource]['available'] < instances):
-                    allocation_graph.add_edge(from_node, to_node)
-            else:
-                allocation_graph.add_edge(from_node, to_node)
-
-        try:
-            cycles = list(nx.simple_cycles(allocation_graph))
-            if cycles:
-                for cycle in cycles:
-                    for node_name in cycle:
-                        self.nodes[node_name].is_in_deadlock = True
-                        self.nodes[node_name].update()
-
-                    for i in range(len(cycle)):
-                        from_node = cycle[i]
-                        to_node = cycle[(i + 1) % len(cycle)]
-                        self.deadlock_edges.add((from_node, to_node))
-
-                cycle_str = "\n".join([" → ".join(cycle) for cycle in cycles])
-                return True, f"Deadlock detected!\nCycles found:\n{cycle_str}"
+    def add_node(self, node):
+        """Register a GraphicsNode and its counts with the engine"""
+        op = ('add_node', node.name, node.node_type, node.instances,
+              node.pos().x(), node.pos().y())
+        self.engine.add_node(*op[1:])
+        node.bind(self.engine)
+        self.nodes[node.name] = node
+        self.pending_ops.append(op)
+
+    def add_edge(self, from_node, to_node, instances):
+        """Add an edge; allocation edges deduct available instances"""
+        self.engine.add_edge(from_node, to_node, instances)
+        self.pending_ops.append(('add_edge', from_node, to_node, instances))
+        if self.engine.node_type(from_node) == 'resource':
+            self.nodes[from_node].update()
+
+    def remove_edge(self, from_node, to_node, instances=None):
+        """Remove instances from an edge (the whole edge by default)"""
+        current = self.engine.edge_instances(from_node, to_node)
+        if instances is None or instances > current:
+            instances = current
+        if not instances:
+            return
+        self.engine.remove_edge(from_node, to_node, instances)
+        self.pending_ops.append(('remove_edge', from_node, to_node, instances))
+        if self.engine.node_type(from_node) == 'resource':
+            self.nodes[from_node].update()
+
+    def set_claim(self, process, resource, maximum):
+        """Declare a maximum claim as part of the current action"""
+        old = self.engine.claim(process, resource)
+        if old != maximum:
+            self.engine.set_claim(process, resource, maximum)
+            self.pending_ops.append(('set_claim', process, resource, old, maximum))
+
+    def allocate_safely(self, resource, process, instances):
+        """Allocate only if the resulting state is safe (Banker's algorithm).
+
+        A granted allocation first serves the process's pending request.
+        A refused one is recorded as a pending request edge instead.
+        Returns whether the allocation was granted.
+        """
+        sequence = self.engine.safe_sequence(self.safe_sequence or (),
+                                             grant=(resource, process, instances))
+        pending = self.engine.edge_instances(process, resource)
+        if sequence is None:
+            if instances > pending:
+                self.add_edge(process, resource, instances - pending)
+            return False
+        if pending:
+            self.remove_edge(process, resource, min(pending, instances))
+        self.add_edge(resource, process, instances)
+        self.safe_sequence = sequence
+        return True
+
+    def update_safety(self):
+        """Recompute the safe sequence of the current state"""
+        self.safe_sequence = self.engine.safe_sequence(self.safe_sequence or ())
+        return self.safe_sequence
+
+    def play(self, ops):
+        """Apply simulated edge changes as part of the current action"""
+        for op in ops:
+            if op[0] == 'add_edge':
+                self.add_edge(*op[1:])
             else:
-                return False, "No deadlock detected."
-                
-        except nx.NetworkXNoCycle:
-            return False, "No deadlock detected."
+                self.remove_edge(*op[1:])
+        self.revision += 1
+
+    def apply(self, ops):
+        """Apply history operations as part of the current action"""
+        apply_ops(self.engine, ops)
+        self.pending_ops.extend(ops)
+        self.revision += 1
+
+    def move_node(self, name, old_pos, new_pos):
+        """Record a finished drag; the engine already has the new position"""
+        if old_pos != new_pos:
+            self.pending_ops.append(('move_node', name) + tuple(old_pos) + tuple(new_pos))
+
+    @property
+    def has_cycle(self):
+        """Live wait-for cycle status, maintained on every edge change"""
+        return self.engine.has_cycle
+
+    def save_state(self):
+        """Commit the operations of the current action as one history entry"""
+        if not self.pending_ops:
+            return
+        with profiler.span('save_state', ops=len(self.pending_ops)):
+            counters = (self.process_count, self.resource_count)
+            entry = HistoryEntry(self.pending_ops, self.committed_counters, counters)
+            self.history.record(entry)
+        if profiler.enabled:
+            profiler.count('save_state.bytes', entry.nbytes)
+        self.pending_ops = []
+        self.committed_counters = counters
+        self.revision += 1
+
+    def undo(self):
+        """Revert the latest action in the engine and return its entry"""
+        entry = self.history.undo()
+        if entry is not None:
+            self._apply_entry(invert(entry.ops), entry.counters_before)
+        return entry
+
+    def redo(self):
+        """Reapply the latest undone action and return its entry"""
+        entry = self.history.redo()
+        if entry is not None:
+            self._apply_entry(entry.ops, entry.counters_after)
+        return entry
+
+    def _apply_entry(self, ops, counters):
+        self.pending_ops = []
+        apply_ops(self.engine, ops)
+        self.process_count, self.resource_count = counters
+        self.committed_counters = counters
+        self.revision += 1
+
+    def load(self, engine, counters):
+        """Replace the whole graph with a loaded engine as one history entry.
+
+        The loaded engine is adopted as is; only the difference to the
+        previous graph is recorded, so the load can be undone.
+        """
+        self.save_state()  # Keep any half-finished action separate
+        ops = diff_ops(self.engine, engine)
+        self.engine = engine
+        for name in list(self.nodes):
+            if name in engine:
+                self.nodes[name].bind(engine)
+        self.pending_ops = ops
+        self.process_count, self.resource_count = counters
+        self.save_state()
+        return ops
+
+    def build(self, text):
+        """Add the nodes and edges of an edge-list script as one history
+        entry (see ``graph_script``) and return the operations.
+
+        Raises ``graph_script.ScriptError`` listing every problem, leaving
+        the graph unchanged. With avoidance on, a script whose allocations
+        lead to an unsafe state is rejected as a whole.
+        """
+        self.save_state()  # Keep any half-finished action separate
+        ops, counters = graph_script.build(
+            self.engine, text, (self.process_count, self.resource_count), self.avoidance)
+        if self.avoidance:
+            sequence = self.engine.safe_sequence(self.safe_sequence or ())
+            if sequence is None:
+                apply_ops(self.engine, invert(ops))
+                raise graph_script.ScriptError(
+                    [(None, "The allocations would leave an unsafe state")])
+            self.safe_sequence = sequence
+        self.pending_ops = list(ops)
+        self.process_count, self.resource_count = counters
+        self.save_state()
+        return ops
+
+    def switch_branch(self, ops):
+        """Show the what-if branch reached by ``ops`` instead of the one
+        shown now, without recording history; ``()`` returns to the
+        committed graph. Only the two branches' operations are applied.
+
+        Returns the operations so the view can update just what changed.
+        """
+        changes = invert(self.branch_ops) + list(ops)
+        apply_ops(self.engine, changes)
+        self.branch_ops = list(ops)
+        self.revision += 1
+        return changes
+
+    def keep_branch(self):
+        """Commit the branch shown as one history entry"""
+        self.pending_ops.extend(self.branch_ops)
+        self.branch_ops = []
+        self.save_state()
+
+    def clear_highlights(self):
+        """Reset deadlock highlighting and return the edges that had it"""
+        for name in self.deadlock_nodes:
+            node = self.nodes.get(name)
+            if node is not None:
+                node.is_in_deadlock = False
+                node.update()
+        self.deadlock_nodes = set()
+        edges = self.deadlock_edges
+        self.deadlock_edges = set()
+        return edges
+
+    def check_deadlock(self, mode=None):
+        result = self.engine.detect(mode or self.detection_mode)
+        self.apply_result(result)
+        return bool(result), result.message(self.cycle_report_limit)
+
+    def apply_result(self, result):
+        """Highlight the nodes and edges of a detection result"""
+        self.clear_highlights()
+        for node_name in result.nodes:
+            self.nodes[node_name].is_in_deadlock = True
+            self.nodes[node_name].update()
+        self.deadlock_nodes = set(result.nodes)
+        self.deadlock_edges = set(result.edges)
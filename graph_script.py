@@ -0,0 +1,270 @@
+"""Bulk graph construction from edge-list scripts.
+
+A script declares nodes and lists edges, one item per line:
+
+    # Two processes deadlocked over two resources
+    process P1 P2
+    resource R1=2 R2
+    R1 -> P1 x2
+    R2 -> P2
+    P1 -> R2
+    P2 -> R1 x1
+
+``process`` and ``resource`` lines declare new nodes (``=n`` sets the
+instances of a resource, 1 by default). ``A -> B xN`` adds ``N`` instances
+(default 1) to an edge: a request from a process, an allocation from a
+resource. Node types always come from declarations or the existing graph,
+never from names. ``#`` starts a comment.
+
+The whole script is checked in one pass before anything changes, and every
+problem is reported together in a ``ScriptError``. A valid script is applied
+as one batch of history operations:
+
+    ops, counters = graph_script.build(engine, text)
+    python graph_script.py edges.txt --base scenario.rag --output combined.rag
+"""
+import argparse
+import re
+import sys
+
+import numpy as np
+
+import rag_io
+from deadlock_engine import RAGEngine, PROCESS, RESOURCE
+from history import apply_ops
+from layout import grid_position
+
+_EDGE = re.compile(r'^(\S+?)\s*->\s*(\S+?)(?:\s+[x×*]\s*(\S+))?$')
+_DECLARATIONS = {'process': PROCESS, 'processes': PROCESS,
+                 'resource': RESOURCE, 'resources': RESOURCE}
+# How many problems a ScriptError message lists before summarising
+MAX_REPORTED_ERRORS = 20
+
+
+class ScriptError(ValueError):
+    """Raised with every problem found in a script; ``errors`` holds
+    ``(line_number, message)`` pairs (line ``None`` for the whole script)"""
+
+    def __init__(self, errors):
+        super().__init__()
+        self.errors = list(errors)
+
+    def __str__(self):
+        lines = [message if line is None else f"Line {line}: {message}"
+                 for line, message in self.errors[:MAX_REPORTED_ERRORS]]
+        if len(self.errors) > MAX_REPORTED_ERRORS:
+            lines.append(f"... and {len(self.errors) - MAX_REPORTED_ERRORS} more problems")
+        return "\n".join(lines)
+
+
+class GraphScript:
+    """Parsed script: declared nodes, edges and the problems found so far"""
+
+    __slots__ = ('nodes', 'edges', 'errors')
+
+    def __init__(self):
+        self.nodes = []  # (name, node_type, instances, line)
+        self.edges = []  # (from_node, to_node, instances, line)
+        self.errors = []  # (line, message)
+
+
+def _count(text, line, script, what):
+    try:
+        value = int(text)
+    except ValueError:
+        value = 0
+    if value < 1:
+        script.errors.append((line, f"{what} must be a positive whole number, got {text!r}"))
+        return None
+    return value
+
+
+def parse(text):
+    """Parse a script; syntax errors are collected in ``errors``"""
+    script = GraphScript()
+    for line, raw in enumerate(text.splitlines(), 1):
+        item = raw.split('#', 1)[0].strip()
+        if not item:
+            continue
+        words = item.split()
+        node_type = _DECLARATIONS.get(words[0].lower())
+        if node_type is not None:
+            if len(words) == 1:
+                script.errors.append((line, f"No names after {words[0]!r}"))
+            for word in words[1:]:
+                name, sep, value = word.partition('=')
+                instances = _count(value, line, script, "Instances") if sep else 1
+                if node_type == PROCESS and sep:
+                    script.errors.append((line, f"Process {name!r} cannot have instances"))
+                elif instances is not None:
+                    script.nodes.append((name, node_type, instances, line))
+            continue
+        match = _EDGE.match(item)
+        if match is None:
+            script.errors.append((line, f"Expected 'A -> B [xN]' or a declaration, got {item!r}"))
+            continue
+        from_node, to_node, value = match.groups()
+        instances = 1 if value is None else _count(value, line, script, "Edge instances")
+        if instances is not None:
+            script.edges.append((from_node, to_node, instances, line))
+    return script
+
+
+def check(engine, script, avoidance=False):
+    """Check a parsed script against ``engine`` and add what is wrong to
+    ``script.errors``; returns the errors.
+
+    Names, edge directions and free instances are checked for all edges at
+    once with NumPy. With ``avoidance`` no process may be allocated beyond
+    its maximum claim.
+    """
+    errors = script.errors
+    lookup = dict(engine.index)
+    kinds = list(engine.kinds)
+    free = list(engine.available)
+    for name, node_type, instances, line in script.nodes:
+        if name in lookup:
+            where = "already exists" if name in engine else "is declared twice"
+            errors.append((line, f"Node {name!r} {where}"))
+            continue
+        lookup[name] = len(kinds)
+        kinds.append(0 if node_type == PROCESS else 1)
+        free.append(instances if node_type == RESOURCE else 0)
+    if not script.edges:
+        return errors
+
+    from_nodes, to_nodes, counts, lines = zip(*script.edges)
+    sources = np.array([lookup.get(name, -1) for name in from_nodes], dtype=np.intp)
+    targets = np.array([lookup.get(name, -1) for name in to_nodes], dtype=np.intp)
+    counts = np.array(counts, dtype=np.int64)
+    lines = np.array(lines, dtype=np.intp)
+    for row in np.flatnonzero((sources < 0) | (targets < 0)).tolist():
+        missing = [name for name, i in ((from_nodes[row], sources[row]),
+                                         (to_nodes[row], targets[row])) if i < 0]
+        errors.append((int(lines[row]), "Unknown node " + ", ".join(map(repr, missing))))
+
+    kinds = np.array(kinds, dtype=np.uint8)
+    known = (sources >= 0) & (targets >= 0)
+    same = known & (kinds[sources] == kinds[targets])
+    for row in np.flatnonzero(same).tolist():
+        errors.append((int(lines[row]),
+                       f"{from_nodes[row]} -> {to_nodes[row]} must join a process and a resource"))
+
+    # Allocations per resource against its free instances
+    allocation = known & ~same & (kinds[sources] == 1)
+    need = np.bincount(sources[allocation], counts[allocation], minlength=len(kinds))
+    free = np.array(free, dtype=np.int64)
+    for r in np.flatnonzero(need > free).tolist():
+        where = ", ".join(map(str, lines[allocation & (sources == r)].tolist()))
+        name = from_nodes[int(np.flatnonzero(sources == r)[0])]
+        errors.append((None, f"{name} allocates {int(need[r])} instances but only "
+                             f"{int(free[r])} are free (lines {where})"))
+
+    if avoidance:
+        totals = {}
+        for row in np.flatnonzero(allocation).tolist():
+            key = (to_nodes[row], from_nodes[row])
+            totals[key] = totals.get(key, 0) + int(counts[row])
+        for (process, resource), added in totals.items():
+            held = engine.edge_instances(resource, process) if resource in engine else 0
+            if process in engine.claims:
+                limit = engine.claims[process].get(resource, 0)
+            elif resource in engine:
+                limit = engine.instances[engine.index[resource]]
+            else:
+                limit = free[lookup[resource]]
+            if held + added > limit:
+                errors.append((None, f"{process} would exceed its maximum claim of "
+                                     f"{limit} on {resource}"))
+    return errors
+
+
+def script_ops(script, counters=(0, 0)):
+    """History operations that apply a checked script, and the new name
+    counters. New nodes are placed like hand-added ones."""
+    process_count, resource_count = counters
+    ops = []
+    for name, node_type, instances, _ in script.nodes:
+        if node_type == PROCESS:
+            process_count += 1
+            x, y = grid_position(node_type, process_count)
+        else:
+            resource_count += 1
+            x, y = grid_position(node_type, resource_count)
+        ops.append(('add_node', name, node_type, instances, x, y))
+    # Repeated edges become one operation each
+    edges = {}
+    for from_node, to_node, instances, _ in script.edges:
+        edges[from_node, to_node] = edges.get((from_node, to_node), 0) + instances
+    ops.extend(('add_edge', u, v, n) for (u, v), n in edges.items())
+
+    # Later P<n>/R<n> names must not collide with declared ones
+    for name, node_type, _, _ in script.nodes:
+        digits = name[1:]
+        if digits.isdigit():
+            if name[:1] == 'P':
+                process_count = max(process_count, int(digits))
+            elif name[:1] == 'R':
+                resource_count = max(resource_count, int(digits))
+    return ops, (process_count, resource_count)
+
+
+def build(engine, text, counters=None, avoidance=False):
+    """Parse, check and apply a script to ``engine`` as one batch.
+
+    Returns ``(ops, counters)``: the history operations that were applied
+    and the name counters afterwards. Raises ``ScriptError`` listing every
+    problem, in which case ``engine`` is left unchanged.
+    """
+    if counters is None:
+        counters = rag_io.default_counters(engine)
+    script = parse(text)
+    if check(engine, script, avoidance):
+        # In script order; problems spanning several lines last
+        raise ScriptError(sorted(script.errors, key=lambda error: (
+            error[0] is None, error[0] or 0)))
+    ops, counters = script_ops(script, counters)
+    # Undo and redo replay these through apply_ops as well, so all three
+    # take the same bulk path for the edges
+    apply_ops(engine, ops)
+    return ops, counters
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Build a scenario from edge-list scripts.")
+    parser.add_argument('scripts', nargs='+', help="script files, or - for stdin")
+    parser.add_argument('--base', help="scenario file to add to (default: empty graph)")
+    parser.add_argument('--output', '-o', required=True, help="scenario file to write")
+    args = parser.parse_args(argv)
+
+    try:
+        if args.base:
+            engine, counters = rag_io.load(args.base)
+        else:
+            engine, counters = RAGEngine(), (0, 0)
+    except (OSError, rag_io.RAGFormatError) as error:
+        parser.error(f"cannot open {args.base}: {error}")
+    for path in args.scripts:
+        try:
+            if path == '-':
+                text = sys.stdin.read()
+            else:
+                with open(path, encoding='utf-8') as f:
+                    text = f.read()
+            _, counters = build(engine, text, counters)
+        except OSError as error:
+            parser.error(f"cannot read {path}: {error}")
+        except ScriptError as error:
+            print(f"{path}:\n{error}", file=sys.stderr)
+            return 1
+    try:
+        rag_io.save(args.output, engine, counters)
+    except OSError as error:
+        print(f"cannot save {args.output}: {error}", file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
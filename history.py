@@ -0,0 +1,220 @@
+"""Delta-based undo/redo history for the resource allocation graph.
+
+Each history entry is one user action stored as a short list of operations
+on a ``RAGEngine``, together with the node counters before and after. Undo
+applies the inverse operations, so memory grows with the size of the edits
+and not with the size of the graph.
+
+Operations are plain tuples:
+
+- ``('add_node', name, node_type, instances, x, y)``
+- ``('remove_node', name, node_type, instances, x, y)``
+- ``('add_edge', from_node, to_node, instances)`` allocates instances when
+  ``from_node`` is a resource
+- ``('remove_edge', from_node, to_node, instances)`` frees them again
+- ``('move_node', name, old_x, old_y, new_x, new_y)``
+- ``('set_claim', process, resource, old_maximum, new_maximum)``
+"""
+import sys
+from collections import deque
+
+# Consecutive edge additions from which a rebuild of the wait-for graph
+# beats incremental maintenance: at least this many, and at least a
+# 1/BULK_EDGE_SHARE share of the edges already in the graph
+BULK_EDGES = 64
+BULK_EDGE_SHARE = 4
+# Default cap on the memory held by the undo/redo log, in bytes
+MAX_HISTORY_BYTES = 256 * 1024 * 1024
+
+_INVERSE = {
+    'add_node': 'remove_node',
+    'remove_node': 'add_node',
+    'add_edge': 'remove_edge',
+    'remove_edge': 'add_edge',
+}
+
+
+def invert(ops):
+    """Return the operations that undo ``ops``, in the order to apply them"""
+    inverse = []
+    for op in reversed(ops):
+        if op[0] == 'move_node':
+            name, old_x, old_y, new_x, new_y = op[1:]
+            inverse.append(('move_node', name, new_x, new_y, old_x, old_y))
+        elif op[0] == 'set_claim':
+            process, resource, old, new = op[1:]
+            inverse.append(('set_claim', process, resource, new, old))
+        else:
+            inverse.append((_INVERSE[op[0]],) + op[1:])
+    return inverse
+
+
+def apply_op(engine, op):
+    """Apply a single operation to ``engine``"""
+    kind = op[0]
+    if kind == 'add_node':
+        engine.add_node(*op[1:])
+    elif kind == 'remove_node':
+        engine.remove_node(op[1])
+    elif kind == 'add_edge':
+        engine.add_edge(*op[1:])
+    elif kind == 'remove_edge':
+        engine.remove_edge(*op[1:])
+    elif kind == 'move_node':
+        engine.set_position(op[1], op[4], op[5])
+    elif kind == 'set_claim':
+        engine.set_claim(op[1], op[2], op[4])
+    else:
+        raise ValueError(f"Unknown history operation {kind!r}")
+
+
+def apply_ops(engine, ops):
+    """Apply operations in order. Long runs of consecutive ``add_edge``
+    operations (see ``BULK_EDGES``) go through ``engine.add_edges``, which
+    rebuilds the wait-for graph once instead of maintaining it per edge."""
+    start = 0
+    while start < len(ops):
+        end = start
+        while end < len(ops) and ops[end][0] == 'add_edge':
+            end += 1
+        run = end - start
+        if run >= BULK_EDGES and run * BULK_EDGE_SHARE >= engine.edge_count:
+            engine.add_edges([op[1:] for op in ops[start:end]])
+        else:
+            for op in ops[start:end]:
+                apply_op(engine, op)
+        if end < len(ops):
+            apply_op(engine, ops[end])
+        start = end + 1
+
+
+def touched_nodes(ops):
+    """Names of the nodes an operation list creates, removes or changes"""
+    names = set()
+    for op in ops:
+        names.add(op[1])
+        if op[0] in ('add_edge', 'remove_edge'):
+            names.add(op[2])
+    return names
+
+
+def diff_ops(current, target):
+    """Operations that turn engine ``current`` into engine ``target``.
+
+    Nodes are matched by name. A node whose type or instance count differs
+    is removed and re-added; positions that differ become moves.
+    """
+    ops = []
+    replaced = set()
+    for name in current.names:
+        if name not in target or (
+                current.node_type(name) != target.node_type(name)
+                or current.instances[current.index[name]]
+                != target.instances[target.index[name]]):
+            replaced.add(name)
+
+    # Edges first, so nodes can be removed and allocations freed
+    current_edges = {(u, v): n for u, v, _, n in current.iter_edges()}
+    target_edges = {(u, v): n for u, v, _, n in target.iter_edges()
+                    if u not in replaced and v not in replaced}
+    for (u, v), n in current_edges.items():
+        wanted = 0 if u in replaced or v in replaced else target_edges.get((u, v), 0)
+        if n > wanted:
+            ops.append(('remove_edge', u, v, n - wanted))
+    for name in replaced:
+        x, y = current.position(name)
+        i = current.index[name]
+        ops.append(('remove_node', name, current.node_type(name),
+                    current.instances[i], x, y))
+    for name in target.names:
+        i = target.index[name]
+        if name in replaced or name not in current:
+            ops.append(('add_node', name, target.node_type(name),
+                        target.instances[i], target.xs[i], target.ys[i]))
+        elif current.position(name) != target.position(name):
+            ops.append(('move_node', name) + current.position(name)
+                       + target.position(name))
+    for u, v, _, n in target.iter_edges():
+        have = 0 if u in replaced or v in replaced else current_edges.get((u, v), 0)
+        if n > have:
+            ops.append(('add_edge', u, v, n - have))
+
+    # Claims are keyed by name and do not depend on the nodes existing
+    current_claims = {(p, r): m for p, r, m in current.iter_claims()}
+    target_claims = {(p, r): m for p, r, m in target.iter_claims()}
+    for key in current_claims.keys() | target_claims.keys():
+        old = current_claims.get(key, 0)
+        new = target_claims.get(key, 0)
+        if old != new:
+            ops.append(('set_claim',) + key + (old, new))
+    return ops
+
+
+def ops_nbytes(ops):
+    """Approximate memory held by an operation list, in bytes"""
+    return sys.getsizeof(ops) + sum(
+        sys.getsizeof(op) + sum(sys.getsizeof(field) for field in op) for op in ops)
+
+
+class HistoryEntry:
+    """One undoable action"""
+
+    __slots__ = ('ops', 'counters_before', 'counters_after', 'nbytes')
+
+    def __init__(self, ops, counters_before, counters_after):
+        self.ops = tuple(ops)
+        self.counters_before = counters_before
+        self.counters_after = counters_after
+        self.nbytes = ops_nbytes(self.ops)
+
+
+class History:
+    """Bounded undo/redo log of ``HistoryEntry`` deltas.
+
+    ``max_entries`` caps the undo depth and ``max_bytes`` the approximate
+    memory held by undo and redo entries together (see ``ops_nbytes``);
+    ``None`` leaves either unbounded. The oldest entries are dropped first,
+    and an action larger than ``max_bytes`` on its own cannot be undone.
+
+    No checkpoints of the whole graph are kept: undo and redo apply the
+    inverse or original deltas to the live engine, so an old state is never
+    rebuilt from scratch, and every checkpoint would cost a full snapshot.
+    """
+
+    def __init__(self, max_entries=1000, max_bytes=MAX_HISTORY_BYTES):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.entries = deque()
+        self.redo_stack = []
+        self.nbytes = 0  # Held by ``entries`` and ``redo_stack``
+
+    def __len__(self):
+        return len(self.entries)
+
+    def record(self, entry):
+        """Append an entry for an action already applied"""
+        self.entries.append(entry)
+        self.nbytes += entry.nbytes - sum(undone.nbytes for undone in self.redo_stack)
+        self.redo_stack.clear()
+        if self.max_entries is not None:
+            while len(self.entries) > self.max_entries:
+                self.nbytes -= self.entries.popleft().nbytes
+        if self.max_bytes is not None:
+            while self.entries and self.nbytes > self.max_bytes:
+                self.nbytes -= self.entries.popleft().nbytes
+
+    def undo(self):
+        """Pop the latest entry for the caller to revert, or ``None``"""
+        if not self.entries:
+            return None
+        entry = self.entries.pop()
+        self.redo_stack.append(entry)
+        return entry
+
+    def redo(self):
+        """Pop the latest undone entry for the caller to reapply, or ``None``"""
+        if not self.redo_stack:
+            return None
+        entry = self.redo_stack.pop()
+        self.entries.append(entry)
+        return entry
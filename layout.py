@@ -0,0 +1,276 @@
+"""Automatic node placement for resource allocation graphs.
+
+Two layouts, both Qt-free so they can run on a copy of the engine off the
+GUI thread:
+
+- ``layered_layout`` puts processes and resources on two alternating rows,
+  ordered by barycenter sweeps to reduce edge crossings. Long rows wrap
+  into bands so large graphs stay readable.
+- ``force_layout`` is a Fruchterman-Reingold style layout vectorized with
+  NumPy. Repulsion is only computed between nodes in neighbouring cells of
+  a uniform grid, plus a coarse density term, so each iteration is close
+  to linear in the graph size.
+
+Both return ``{name: (x, y)}`` for every node.
+"""
+import math
+
+import numpy as np
+
+from deadlock_engine import PROCESS
+
+
+class LayoutCancelled(Exception):
+    """Raised inside a layout when its ``cancel`` callback returns true"""
+
+
+SPACING = 100.0  # Distance between neighbouring nodes
+ROW_GAP = 200.0  # Between a process row and its resource row
+COLUMNS = 7  # Nodes per row of the default placement
+
+
+def grid_position(node_type, count):
+    """Position of the ``count``-th process or resource added by hand.
+
+    Processes and resources alternate in rows of ``COLUMNS``, so nodes
+    never stack however many are added.
+    """
+    band, column = divmod(count - 1, COLUMNS)
+    y = SPACING + band * 2 * ROW_GAP
+    if node_type != PROCESS:
+        y += ROW_GAP
+    return (column + 1) * SPACING, y
+
+
+def _edge_arrays(engine):
+    """Process and resource endpoints of every edge, and its instances"""
+    processes = []
+    resources = []
+    weights = []
+    kinds = engine.kinds
+    for u, edges in enumerate(engine.succ):
+        for v, n in edges.items():
+            if kinds[u] == 0:
+                processes.append(u)
+                resources.append(v)
+            else:
+                processes.append(v)
+                resources.append(u)
+            weights.append(n)
+    return (np.asarray(processes, dtype=np.intp), np.asarray(resources, dtype=np.intp),
+            np.asarray(weights, dtype=np.float64))
+
+
+def count_crossings(upper, lower):
+    """Crossings between two rows joined by edges ``upper[i] -> lower[i]``
+    (row positions), counted as inversions with a Fenwick tree"""
+    if len(upper) < 2:
+        return 0
+    order = np.lexsort((lower, upper))
+    ranks = np.unique(lower, return_inverse=True)[1][order]
+    size = int(ranks.max()) + 1
+    tree = [0] * (size + 1)
+    crossings = 0
+    for seen, rank in enumerate(ranks.tolist()):
+        # Edges so far that end right of this one cross it
+        i = rank + 1
+        below = 0
+        while i > 0:
+            below += tree[i]
+            i -= i & -i
+        crossings += seen - below
+        i = rank + 1
+        while i <= size:
+            tree[i] += 1
+            i += i & -i
+    return crossings
+
+
+def _barycenter_order(keys, neighbour_rank, own, other, weights, count):
+    """Rank the nodes of one row by the weighted mean rank of their
+    neighbours in the other row; nodes without edges keep ``keys``"""
+    total = np.bincount(own, weights * neighbour_rank[other], minlength=count)
+    degree = np.bincount(own, weights, minlength=count)
+    connected = degree > 0
+    key = keys.astype(np.float64)
+    key[connected] = total[connected] / degree[connected]
+    order = np.lexsort((keys, key))
+    rank = np.empty(count, dtype=np.float64)
+    rank[order] = np.arange(count)
+    return rank
+
+
+def layered_layout(engine, sweeps=8, columns=None, cancel=None):
+    """Two-row layout with crossings reduced by barycenter sweeps.
+
+    Rows start in the current x order. Each sweep reorders resources by
+    their processes, then processes by their resources; the order with the
+    fewest crossings is kept. Rows longer than ``columns`` nodes (by default
+    about twice the square root of the row length) wrap into bands of a
+    process row above a resource row.
+    """
+    kinds = np.frombuffer(bytes(engine.kinds), dtype=np.uint8)
+    processes = np.flatnonzero(kinds == 0)
+    resources = np.flatnonzero(kinds == 1)
+    row = np.empty(len(kinds), dtype=np.intp)
+    row[processes] = np.arange(len(processes))
+    row[resources] = np.arange(len(resources))
+    edge_p, edge_r, weights = _edge_arrays(engine)
+    edge_p = row[edge_p]
+    edge_r = row[edge_r]
+
+    xs = np.frombuffer(engine.xs, dtype=np.float64)
+    p_keys = np.argsort(np.argsort(xs[processes], kind='stable'), kind='stable')
+    r_keys = np.argsort(np.argsort(xs[resources], kind='stable'), kind='stable')
+    p_rank = p_keys.astype(np.float64)
+    r_rank = r_keys.astype(np.float64)
+    best = (count_crossings(p_rank[edge_p], r_rank[edge_r]), p_rank, r_rank)
+    for _ in range(sweeps):
+        if not best[0]:
+            break
+        if cancel is not None and cancel():
+            raise LayoutCancelled()
+        r_rank = _barycenter_order(r_keys, p_rank, edge_r, edge_p, weights, len(resources))
+        p_rank = _barycenter_order(p_keys, r_rank, edge_p, edge_r, weights, len(processes))
+        crossings = count_crossings(p_rank[edge_p], r_rank[edge_r])
+        if crossings < best[0]:
+            best = (crossings, p_rank, r_rank)
+    _, p_rank, r_rank = best
+
+    longest = max(len(processes), len(resources), 1)
+    if columns is None:
+        columns = max(COLUMNS, math.ceil(2 * math.sqrt(longest)))
+    bands = math.ceil(longest / columns)
+    positions = {}
+    for indices, rank, offset in ((processes, p_rank, 0.0), (resources, r_rank, ROW_GAP)):
+        if not len(indices):
+            continue
+        # Spread each row evenly over the same bands so linked nodes line up
+        per_band = math.ceil(len(indices) / bands)
+        band, column = np.divmod(rank.astype(np.intp), per_band)
+        x = SPACING / 2 + (column + 0.5) * SPACING * (columns / per_band)
+        y = SPACING + band * 2 * ROW_GAP + offset
+        for i, px, py in zip(indices.tolist(), x.tolist(), y.tolist()):
+            positions[engine.names[i]] = (px, py)
+    return positions
+
+
+def _grid_pairs(points, cell):
+    """Index pairs ``(i, j)`` of points in the same or neighbouring cells of
+    a grid with cells ``cell`` wide, each unordered pair once"""
+    cells = np.floor(points / cell).astype(np.int64)
+    cells -= cells.min(axis=0) - 1
+    width = int(cells[:, 1].max()) + 2
+    keys = cells[:, 0] * width + cells[:, 1]
+    order = np.argsort(keys, kind='stable')
+    unique, starts, counts = np.unique(keys[order], return_index=True, return_counts=True)
+    firsts = []
+    seconds = []
+    # The own cell and half of the neighbours; the other half sees us
+    for dx, dy in ((0, 0), (0, 1), (1, -1), (1, 0), (1, 1)):
+        wanted = keys + dx * width + dy
+        slot = np.minimum(np.searchsorted(unique, wanted), len(unique) - 1)
+        i = np.flatnonzero(unique[slot] == wanted)
+        n = counts[slot[i]]
+        total = int(n.sum())
+        if not total:
+            continue
+        # Every point of the neighbouring cell, for each point in i
+        offsets = np.repeat(starts[slot[i]] - np.cumsum(n) + n, n) + np.arange(total)
+        first = np.repeat(i, n)
+        second = order[offsets]
+        if not dx and not dy:
+            keep = first < second
+            first = first[keep]
+            second = second[keep]
+        firsts.append(first)
+        seconds.append(second)
+    return np.concatenate(firsts), np.concatenate(seconds)
+
+
+def _scatter(index, vectors, count):
+    """Sum of ``vectors`` per target ``index``, as a ``(count, 2)`` array"""
+    return np.column_stack([np.bincount(index, vectors[:, 0], minlength=count),
+                            np.bincount(index, vectors[:, 1], minlength=count)]
+                           ).astype(np.float64, copy=False)
+
+
+def _pressure(points, k, scale=4, strength=16):
+    """Long-range push out of crowded regions, from the gradient of node
+    density on a grid of cells ``scale * k`` wide (particle-mesh style).
+
+    Without it, the cut-off repulsion lets large components collapse.
+    """
+    cell = scale * k
+    origin = points.min(axis=0) - cell
+    cells = ((points - origin) // cell).astype(np.intp)
+    shape = tuple(cells.max(axis=0) + 2)
+    density = np.bincount(np.ravel_multi_index(cells.T, shape),
+                          minlength=shape[0] * shape[1]).reshape(shape)
+    # One node per k * k is the rest density; more pushes outwards
+    density = density / (scale * scale)
+    gx, gy = np.gradient(density)
+    return -strength * k * np.column_stack([gx[cells[:, 0], cells[:, 1]],
+                                            gy[cells[:, 0], cells[:, 1]]])
+
+
+def force_layout(engine, iterations=80, spacing=SPACING, seed=0, cancel=None):
+    """Force-directed layout starting from the current positions.
+
+    Edges act as springs of rest length ``k`` (``spacing``); nodes closer
+    than ``2 * k`` push each other apart with force ``k**2 / d``, and a
+    density grid spreads out crowded regions. Steps are capped by a
+    temperature that cools linearly, and a weak pull to the centre keeps
+    components together.
+    """
+    n = len(engine)
+    if not n:
+        return {}
+    rng = np.random.default_rng(seed)
+    k = float(spacing)
+    points = np.column_stack([np.frombuffer(engine.xs, dtype=np.float64),
+                              np.frombuffer(engine.ys, dtype=np.float64)]).copy()
+    side = k * math.sqrt(n)
+    extent = points.max(axis=0) - points.min(axis=0)
+    if extent[0] * extent[1] < side * side / 4:
+        # Too crowded to start from: repulsion would see every pair
+        points = rng.uniform(0, side, size=(n, 2))
+    points += rng.uniform(-k / 10, k / 10, size=(n, 2))
+
+    sources = []
+    targets = []
+    for u, edges in enumerate(engine.succ):
+        for v in edges:
+            sources.append(u)
+            targets.append(v)
+    sources = np.asarray(sources, dtype=np.intp)
+    targets = np.asarray(targets, dtype=np.intp)
+
+    temperature = min(side / 10, 3 * k)
+    cooling = temperature / iterations
+    for _ in range(iterations):
+        if cancel is not None and cancel():
+            raise LayoutCancelled()
+        first, second = _grid_pairs(points, 2 * k)
+        delta = points[first] - points[second]
+        distance = np.maximum(np.hypot(delta[:, 0], delta[:, 1]), 0.01)
+        near = distance < 2 * k
+        push = (k * k / distance[near] ** 2)[:, None] * delta[near]
+        shift = _scatter(first[near], push, n) - _scatter(second[near], push, n)
+
+        delta = points[sources] - points[targets]
+        distance = np.maximum(np.hypot(delta[:, 0], delta[:, 1]), 0.01)
+        pull = (1 - k / distance)[:, None] * delta
+        shift += _scatter(targets, pull, n) - _scatter(sources, pull, n)
+
+        shift += _pressure(points, k)
+        shift += (points.mean(axis=0) - points) * (0.01 * k / side)
+        length = np.maximum(np.hypot(shift[:, 0], shift[:, 1]), 0.01)
+        points += shift * (np.minimum(length, temperature) / length)[:, None]
+        temperature = max(temperature - cooling, k / 100)
+
+    points -= points.min(axis=0) - k / 2
+    return {name: (float(x), float(y)) for name, (x, y) in zip(engine.names, points)}
+
+
+LAYOUTS = {'layered': layered_layout, 'force': force_layout}
@@ -0,0 +1,436 @@
+"""Streaming ingestion of lock-manager traces with live deadlock detection.
+
+A trace is a log of lock events, one per line, either JSON objects
+
+    {"time": 12.5, "event": "wait", "owner": "txn17", "lock": "row:42"}
+
+or whitespace separated ``time event owner [lock [count]]`` text; blank
+lines and ``#`` comments are skipped, and ``.gz`` files are read directly.
+Times are seconds or ISO 8601 timestamps. Owners (threads, transactions)
+become processes and locks become resources:
+
+- ``wait``/``request``: the owner waits for the lock (request edge)
+- ``acquire``/``grant``/``lock``: the owner holds the lock (allocation
+  edge), ending its wait
+- ``release``/``unlock``: the owner releases the lock (all instances
+  unless a count is given)
+- ``cancel``/``timeout``: the owner stops waiting for the lock
+- ``exit``/``abort``/``end``: the owner releases everything and is gone
+
+Only live state is kept: nodes without edges are dropped at once, so
+memory follows the number of locks held or awaited, not the trace length.
+Every wait and acquire is checked against the engine's incremental
+wait-for graph and each deadlock is reported once, when the event that
+closes it arrives, together with the events that created its edges; one
+that ends and forms again is reported again. Locks default to one holder;
+a lock seen with more holders grows to fit (shared locks).
+
+    python lock_trace.py service-locks.log.gz --output deadlocks.jsonl
+    python lock_trace.py trace.jsonl --until 1700000000 --snapshot state.rag
+"""
+import argparse
+import gzip
+import heapq
+import io
+import json
+import sys
+import time
+from collections import deque
+from datetime import datetime
+
+import rag_io
+from deadlock_engine import RAGEngine, PROCESS, RESOURCE, CYCLE_MODE, DETECTION_MODES
+
+WAIT = 'wait'
+ACQUIRE = 'acquire'
+RELEASE = 'release'
+CANCEL = 'cancel'
+EXIT = 'exit'
+EVENT_ALIASES = {
+    'wait': WAIT, 'request': WAIT,
+    'acquire': ACQUIRE, 'grant': ACQUIRE, 'lock': ACQUIRE,
+    'release': RELEASE, 'unlock': RELEASE,
+    'cancel': CANCEL, 'timeout': CANCEL,
+    'exit': EXIT, 'abort': EXIT, 'end': EXIT,
+}
+
+_SPACING = 100
+# Latest deadlock reports a replayer keeps when nothing consumes them
+KEEP_REPORTS = 1000
+
+
+class TraceFormatError(ValueError):
+    """Raised when a trace line cannot be understood"""
+
+
+def parse_time(value):
+    """Seconds as a float from a number or an ISO 8601 timestamp"""
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        pass
+    try:
+        return datetime.fromisoformat(str(value)).timestamp()
+    except ValueError:
+        raise TraceFormatError(f"Bad timestamp {value!r}") from None
+
+
+def parse_line(line, line_number):
+    """Parse one trace line into ``(time, event, owner, lock, count)``.
+
+    Returns ``None`` for blank and comment lines.
+    """
+    line = line.strip()
+    if not line or line.startswith('#'):
+        return None
+    if line.startswith('{'):
+        try:
+            record = json.loads(line)
+            fields = (record['time'], record['event'], record['owner'],
+                      record.get('lock'), record.get('count'))
+        except (ValueError, KeyError) as error:
+            raise TraceFormatError(f"Line {line_number}: {error}") from None
+    else:
+        fields = line.split()
+        if len(fields) < 3:
+            raise TraceFormatError(f"Line {line_number}: expected time, event and owner")
+        fields += [None] * (5 - len(fields))
+    timestamp, event, owner, lock, count = fields[:5]
+    kind = EVENT_ALIASES.get(str(event).lower())
+    if kind is None:
+        raise TraceFormatError(f"Line {line_number}: unknown event {event!r}")
+    if lock is None and kind != EXIT:
+        raise TraceFormatError(f"Line {line_number}: {event} needs a lock")
+    try:
+        count = None if count is None else int(count)
+    except ValueError:
+        raise TraceFormatError(f"Line {line_number}: bad count {count!r}") from None
+    try:
+        timestamp = parse_time(timestamp)
+    except TraceFormatError as error:
+        raise TraceFormatError(f"Line {line_number}: {error}") from None
+    return timestamp, kind, str(owner), None if lock is None else str(lock), count
+
+
+def open_trace(path):
+    """Open a trace for reading as text; returns ``(stream, raw_file)``.
+
+    ``raw_file.tell()`` gives the position in the file on disk, for
+    progress reporting, also when the trace is gzip compressed.
+    """
+    raw = open(path, 'rb')
+    binary = gzip.GzipFile(fileobj=raw) if str(path).endswith('.gz') else raw
+    return io.TextIOWrapper(binary, encoding='utf-8'), raw
+
+
+def iter_events(stream):
+    """Yield ``(line_number, time, event, owner, lock, count)`` from a text
+    stream of trace lines"""
+    for line_number, line in enumerate(stream, 1):
+        event = parse_line(line, line_number)
+        if event is not None:
+            yield (line_number,) + event
+
+
+def _groups(edges):
+    """Weakly connected groups of the nodes of ``edges``, as sets of names"""
+    parent = {}
+
+    def root(name):
+        while parent.setdefault(name, name) != name:
+            parent[name] = parent[parent[name]]
+            name = parent[name]
+        return name
+
+    for u, v in edges:
+        parent[root(u)] = root(v)
+    groups = {}
+    for name in parent:
+        groups.setdefault(root(name), set()).add(name)
+    return list(groups.values())
+
+
+class LockTraceReplayer:
+    """Apply lock events to a ``RAGEngine`` that holds only the live state.
+
+    Each deadlock produces a report dict and counts in ``deadlocks``.
+    ``on_deadlock`` is called with each report as it is found; without it
+    ``reports`` keeps the latest ``keep_reports`` of them, so memory stays
+    bounded however many deadlocks a trace holds. With ``window`` set,
+    waits and holds older than ``window`` seconds are dropped, which keeps
+    memory bounded when a trace misses release events.
+    """
+
+    def __init__(self, mode=CYCLE_MODE, window=None, cycle_limit=5, on_deadlock=None,
+                 keep_reports=KEEP_REPORTS):
+        self.engine = RAGEngine()
+        self.mode = mode
+        self.window = window
+        self.cycle_limit = cycle_limit
+        self.on_deadlock = on_deadlock
+        self.reports = deque(maxlen=0 if on_deadlock is not None else keep_reports)
+        self.deadlocks = 0
+        self.deadlocked = set()  # Processes in the deadlocks reported so far
+        # Event that created each live edge, as reported with a deadlock
+        self.provenance = {}
+        self.expiry = []  # (time, sequence, edge, event) heap for the window
+        self.sequence = 0
+        self.capacities = {}  # Locks seen with more than one holder
+        self.time = None
+        self.events = 0
+        self.unmatched = 0  # Releases and cancels of things never seen
+        self.expired = 0
+        self.peak_nodes = 0
+
+    def feed(self, line_number, timestamp, kind, owner, lock=None, count=None):
+        """Apply one parsed event"""
+        self.events += 1
+        self.time = timestamp
+        if self.window is not None:
+            self._expire(timestamp - self.window)
+        record = {'line': line_number, 'time': timestamp, 'event': kind,
+                  'owner': owner, 'lock': lock}
+        if kind == WAIT:
+            self._wait(owner, lock, count or 1, record)
+        elif kind == ACQUIRE:
+            self._acquire(owner, lock, count or 1, record)
+        elif kind == RELEASE:
+            self._drop(lock, owner, count)
+            self._resolve(owner)
+        elif kind == CANCEL:
+            self._drop(owner, lock, count)
+            self._resolve(owner)
+        else:
+            self._exit(owner)
+            self._resolve(owner)
+
+    def run(self, events, until=None):
+        """Feed events until the trace ends or passes time ``until``; returns
+        the reports kept"""
+        for event in events:
+            if until is not None and event[1] > until:
+                break
+            self.feed(*event)
+        return self.reports
+
+    # Live state
+
+    def _node(self, name, node_type, line):
+        engine = self.engine
+        if name in engine:
+            if engine.node_type(name) != node_type:
+                raise TraceFormatError(
+                    f"Line {line}: {name!r} is used as both an owner and a lock")
+            return
+        instances = self.capacities.get(name, 1) if node_type == RESOURCE else 1
+        engine.add_node(name, node_type, instances)
+        if len(engine) > self.peak_nodes:
+            self.peak_nodes = len(engine)
+
+    def _prune(self, name):
+        """Forget a node once nothing refers to it"""
+        engine = self.engine
+        if name in engine:
+            i = engine.index[name]
+            if not engine.succ[i] and not engine.pred[i]:
+                engine.remove_node(name)
+
+    def _add(self, u, v, count, record):
+        self.engine.add_edge(u, v, count)
+        self.provenance[(u, v)] = record
+        if self.window is not None:
+            self.sequence += 1
+            heapq.heappush(self.expiry, (record['time'], self.sequence, (u, v), record))
+
+    def _drop(self, u, v, count=None):
+        """Remove ``count`` instances (all by default) of edge ``u -> v``"""
+        engine = self.engine
+        if u not in engine or v not in engine or not engine.edge_instances(u, v):
+            self.unmatched += 1
+            return
+        engine.remove_edge(u, v, count)
+        if not engine.edge_instances(u, v):
+            del self.provenance[(u, v)]
+            self._prune(u)
+            self._prune(v)
+
+    def _expire(self, horizon):
+        expiry = self.expiry
+        while expiry and expiry[0][0] < horizon:
+            _, _, edge, record = heapq.heappop(expiry)
+            if self.provenance.get(edge) is record:  # Not renewed since
+                self.expired += 1
+                self._drop(*edge)
+                self._resolve(record['owner'])
+
+    def _wait(self, owner, lock, count, record):
+        self._node(owner, PROCESS, record['line'])
+        self._node(lock, RESOURCE, record['line'])
+        self._add(owner, lock, count, record)
+        self._check(owner, owner, record)
+
+    def _acquire(self, owner, lock, count, record):
+        engine = self.engine
+        # Lock first: a new allocation edge then already agrees with the
+        # wait-for topological order and needs no reordering
+        self._node(lock, RESOURCE, record['line'])
+        self._node(owner, PROCESS, record['line'])
+        waiting = engine.edge_instances(owner, lock)
+        if waiting:
+            engine.remove_edge(owner, lock, min(waiting, count))
+            if not engine.edge_instances(owner, lock):
+                del self.provenance[(owner, lock)]
+        r = engine.index[lock]
+        if engine.available[r] < count:
+            # The trace says it was granted, so the lock admits more holders
+            capacity = engine.instances[r] + count - engine.available[r]
+            engine.set_instances(lock, capacity)
+            self.capacities[lock] = capacity
+        self._add(lock, owner, count, record)
+        # Taking instances of the lock can block the owners waiting for it
+        self._check(lock, owner, record)
+
+    def _exit(self, owner):
+        engine = self.engine
+        if owner not in engine:
+            self.unmatched += 1
+            return
+        i = engine.index[owner]
+        edges = ([(owner, engine.names[r]) for r in engine.succ[i]]
+                 + [(engine.names[r], owner) for r in engine.pred[i]])
+        for u, v in edges:
+            engine.remove_edge(u, v)
+            del self.provenance[(u, v)]
+        self._prune(owner)
+        for u, v in edges:
+            self._prune(v if u == owner else u)
+
+    # Reporting
+
+    def _check(self, name, owner, record):
+        """Report the deadlocks the event in ``record`` by ``owner`` formed.
+
+        The event added edges at node ``name``, so in cycle mode any new
+        cycle passes through it. In reduction mode a cycle elsewhere can
+        become a deadlock too, as can an owner waiting for more than a
+        lock's capacity. While deadlocks are reported, full detection runs
+        after every wait and acquire in either mode: owners can queue
+        behind them, and acquires can end them.
+        """
+        engine = self.engine
+        if self.mode == CYCLE_MODE:
+            if not engine.has_cycle:
+                self.deadlocked.clear()
+                return
+            if not self.deadlocked and not engine.on_cycle(name):
+                return
+        elif not (engine.has_cycle or self.deadlocked or self._unsatisfiable(owner)):
+            return
+        result = engine.detect(self.mode)
+        reported = self.deadlocked
+        self.deadlocked = {node for node in result.nodes if engine.node_type(node) == PROCESS}
+        for members in _groups(result.edges):
+            if any(node not in reported for node in members
+                   if engine.node_type(node) == PROCESS):
+                self._report(result, members, record)
+
+    def _unsatisfiable(self, owner):
+        """Whether ``owner`` waits for more instances than a lock has"""
+        engine = self.engine
+        instances = engine.instances
+        return any(n > instances[r] for r, n in engine.succ[engine.index[owner]].items())
+
+    def _resolve(self, owner):
+        """Forget the reported deadlocks that removing edges of ``owner``
+        ended.
+
+        Reduction already counts on owners outside a deadlock releasing what
+        they hold, so only changes to deadlocked owners can end one there.
+        In cycle mode any lock coming free can unblock a wait on a cycle.
+        """
+        if not self.deadlocked:
+            return
+        if self.mode == CYCLE_MODE and not self.engine.has_cycle:
+            self.deadlocked.clear()  # Cycle mode finds nothing without a cycle
+        elif self.mode == CYCLE_MODE or owner in self.deadlocked:
+            self.deadlocked &= self.engine.detect(self.mode).nodes
+
+    def _report(self, result, members, record):
+        engine = self.engine
+        forming = sorted((self.provenance[edge] for edge in result.edges
+                          if edge[0] in members and edge[1] in members),
+                         key=lambda event: event['line'])
+        components = [component for component in result.components
+                      if engine.names[component[0]] in members]
+        report = {
+            'time': record['time'],
+            'line': record['line'],
+            'deadlocked': sorted(members),
+            'processes': sorted(name for name in members
+                                if engine.node_type(name) == PROCESS),
+            'cycles': list(result.iter_cycles(self.cycle_limit, components)),
+            'events': forming,
+        }
+        self.deadlocks += 1
+        self.reports.append(report)
+        if self.on_deadlock is not None:
+            self.on_deadlock(report)
+
+    def snapshot(self):
+        """Copy of the live state laid out on a grid, ready for the GUI"""
+        engine = self.engine.copy()
+        processes = [i for i in range(len(engine)) if engine.is_process(i)]
+        resources = [i for i in range(len(engine)) if not engine.is_process(i)]
+        columns = max(1, int(max(len(processes), len(resources)) ** 0.5))
+        offset = (len(processes) // columns + 2) * _SPACING
+        for members, row_offset in ((processes, 0), (resources, offset)):
+            for k, i in enumerate(members):
+                engine.xs[i] = float((k % columns) * _SPACING)
+                engine.ys[i] = float(row_offset + (k // columns) * _SPACING)
+        return engine
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Detect deadlocks in a lock acquire/wait/release trace.")
+    parser.add_argument('trace', help="trace file, optionally .gz compressed")
+    parser.add_argument('--mode', choices=DETECTION_MODES, default=CYCLE_MODE)
+    parser.add_argument('--window', type=float, default=None,
+                        help="forget waits and holds older than this many seconds")
+    parser.add_argument('--cycles', type=int, default=5,
+                        help="example cycles reported per deadlock")
+    parser.add_argument('--until', type=parse_time, default=None,
+                        help="stop at this time (seconds or ISO 8601)")
+    parser.add_argument('--snapshot',
+                        help="save the live graph where reading stopped (.rag or .ragz)")
+    parser.add_argument('--output', '-o', help="write JSON lines here instead of stdout")
+    args = parser.parse_args(argv)
+
+    output = open(args.output, 'w', encoding='utf-8') if args.output else sys.stdout
+    replayer = LockTraceReplayer(
+        args.mode, args.window, args.cycles,
+        on_deadlock=lambda report: output.write(json.dumps(report) + '\n'))
+    start = time.perf_counter()
+    try:
+        stream, _ = open_trace(args.trace)
+        with stream:
+            replayer.run(iter_events(stream), args.until)
+        if args.snapshot:
+            engine = replayer.snapshot()
+            rag_io.save(args.snapshot, engine, rag_io.default_counters(engine))
+    except (OSError, TraceFormatError) as error:
+        print(f"{args.trace}: {error}", file=sys.stderr)
+        return 1
+    finally:
+        if output is not sys.stdout:
+            output.close()
+    elapsed = time.perf_counter() - start
+    print(f"{replayer.events} events, {replayer.deadlocks} deadlocks, "
+          f"{replayer.unmatched} unmatched, {replayer.expired} expired, "
+          f"peak {replayer.peak_nodes} live nodes, "
+          f"{replayer.events / elapsed if elapsed else 0:,.0f} events/s", file=sys.stderr)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
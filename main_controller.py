@@ -1,15 +1,156 @@
 # Import necessary PyQt6 modules for GUI components
-from PyQt6.QtWidgets import QApplication, QMessageBox  # Main app and message dialogs
-from PyQt6.QtCore import Qt, QPointF  # Core functionalities and point coordinates
-from PyQt6.QtGui import QPen, QColor  # Drawing tools and color management
+from PyQt6.QtWidgets import QApplication, QMessageBox, QFileDialog  # App, dialogs
+from PyQt6.QtWidgets import QGraphicsScene, QProgressDialog  # Bulk loads, progress
+from PyQt6.QtWidgets import QInputDialog  # Point in time for traces
+from PyQt6.QtCore import Qt, QThread, QTimer, pyqtSignal  # Background detection
 
 # Import standard libraries
-import math  # For mathematical operations (e.g., sqrt, atan2)
+import os  # File sizes for trace progress
 import sys  # System-specific functions and variables
+import random  # Seeds for simulated workloads
+import threading  # Cancellation flag shared with the detection thread
+import multiprocessing  # Start method of the what-if worker pool
 
 # Import custom modules
-from graph_elements import GraphManager, GraphicsNode  # Graph logic and node visualization
-from ui_components import MainWindowUI, ResourceDialog, EdgeDialog  # GUI components
+from graph_elements import (GraphManager, GraphicsNode, EdgeItem,  # Graph logic and visualization
+                            LOD_NODE_THRESHOLD, LOD_EDGE_THRESHOLD)
+from ui_components import (MainWindowUI, ResourceDialog, EdgeDialog, ClaimDialog,  # GUI components
+                           RecoveryDialog, BulkEdgeDialog, WhatIfDialog)
+from history import touched_nodes  # Nodes affected by a history entry
+import rag_io  # Scenario files
+from deadlock_engine import DetectionCancelled  # Raised when a check is cancelled
+from simulation import Simulation, random_workload  # Workload simulation for replay
+import lock_trace  # Lock-manager trace ingestion
+import recovery  # Deadlock recovery planning
+from profiling import profiler  # Timers and counters for the stats overlay
+import layout  # Automatic node placement
+from graph_script import ScriptError  # Problems found in a bulk edit script
+import whatif  # What-if branches evaluated in parallel
+
+SCENARIO_FILTER = "RAG scenario (*.rag);;Binary RAG scenario (*.ragz)"
+TRACE_FILTER = "Lock traces (*.log *.jsonl *.txt *.gz);;All files (*)"
+PROFILE_FILTER = "Chrome trace (*.json)"
+REPLAY_TICK_MS = 40  # Replay frame interval
+STATS_REFRESH_MS = 500  # Stats overlay refresh interval
+LAYOUT_ANIMATION_FRAMES = 10  # Frames (REPLAY_TICK_MS apart) moving nodes into place
+TRACE_REPORTS = 5  # Latest trace deadlocks listed after loading a trace
+
+class DetectionWorker(QThread):
+    """Runs deadlock detection on an engine snapshot off the GUI thread"""
+    result_ready = pyqtSignal(object, str, int)  # result, message, revision
+    cancelled = pyqtSignal(int)  # revision
+
+    def __init__(self, engine, mode, cycle_limit, revision, parent=None):
+        super().__init__(parent)
+        self.engine = engine  # Private copy; the GUI keeps editing its own
+        self.mode = mode
+        self.cycle_limit = cycle_limit
+        self.revision = revision
+        self.cancel_event = threading.Event()
+
+    def cancel(self):
+        self.cancel_event.set()
+
+    def run(self):
+        try:
+            result = self.engine.detect(self.mode, self.cancel_event.is_set)
+            message = result.message(self.cycle_limit, self.cancel_event.is_set)
+        except DetectionCancelled:
+            self.cancelled.emit(self.revision)
+            return
+        self.result_ready.emit(result, message, self.revision)
+
+class TraceWorker(QThread):
+    """Reads a lock trace up to a point in time off the GUI thread"""
+    progress = pyqtSignal(int)  # Percent of the file read
+    trace_ready = pyqtSignal(object)  # LockTraceReplayer holding the live state
+    failed = pyqtSignal(str)
+    cancelled = pyqtSignal()
+
+    def __init__(self, path, until, mode, parent=None):
+        super().__init__(parent)
+        self.path = path
+        self.until = until
+        self.mode = mode
+        self.cancel_event = threading.Event()
+
+    def cancel(self):
+        self.cancel_event.set()
+
+    def run(self):
+        replayer = lock_trace.LockTraceReplayer(self.mode, keep_reports=TRACE_REPORTS)
+        try:
+            size = os.path.getsize(self.path) or 1
+            stream, raw = lock_trace.open_trace(self.path)
+            with stream:
+                for count, event in enumerate(lock_trace.iter_events(stream)):
+                    if self.until is not None and event[1] > self.until:
+                        break
+                    replayer.feed(*event)
+                    if not count & 0xFFFF:
+                        if self.cancel_event.is_set():
+                            self.cancelled.emit()
+                            return
+                        self.progress.emit(100 * raw.tell() // size)
+        except (OSError, UnicodeDecodeError, lock_trace.TraceFormatError) as error:
+            self.failed.emit(str(error))
+            return
+        self.trace_ready.emit(replayer)
+
+class LayoutWorker(QThread):
+    """Computes an automatic layout on an engine snapshot off the GUI thread"""
+    layout_ready = pyqtSignal(object, int)  # {name: (x, y)}, revision
+    cancelled = pyqtSignal()
+
+    def __init__(self, engine, method, revision, parent=None):
+        super().__init__(parent)
+        self.engine = engine
+        self.method = method
+        self.revision = revision
+        self.cancel_event = threading.Event()
+
+    def cancel(self):
+        self.cancel_event.set()
+
+    def run(self):
+        try:
+            with profiler.span('layout', method=self.method, nodes=len(self.engine)):
+                positions = layout.LAYOUTS[self.method](
+                    self.engine, cancel=self.cancel_event.is_set)
+        except layout.LayoutCancelled:
+            self.cancelled.emit()
+            return
+        self.layout_ready.emit(positions, self.revision)
+
+class WhatIfWorker(QThread):
+    """Forks a branch per candidate next allocation and evaluates them on a
+    pool of worker processes, off the GUI thread"""
+    results_ready = pyqtSignal(object, object, int)  # branches, ranked records, revision
+    cancelled = pyqtSignal()
+
+    def __init__(self, engine, mode, safety, revision, parent=None):
+        super().__init__(parent)
+        self.engine = engine
+        self.mode = mode
+        self.safety = safety
+        self.revision = revision
+        self.cancel_event = threading.Event()
+
+    def cancel(self):
+        self.cancel_event.set()
+
+    def run(self):
+        root = whatif.Branch.from_engine(self.engine)
+        branches = whatif.allocation_branches(root, self.engine)
+        try:
+            # Forking a process that runs Qt threads is unsafe; start afresh
+            records = whatif.evaluate(branches, self.mode, self.safety,
+                                      cancel=self.cancel_event.is_set,
+                                      mp_context=multiprocessing.get_context('spawn'))
+        except DetectionCancelled:
+            self.cancelled.emit()
+            return
+        self.results_ready.emit(branches, records, self.revision)
 
 class RAGSimulator(MainWindowUI):
     """Main controller class that inherits from the UI and manages application logic"""
@@ -18,8 +159,37 @@ class RAGSimulator(MainWindowUI):
         """Initialize the simulator"""
         super().__init__()  # Initialize parent UI class
         self.graph_manager = GraphManager()  # Create graph management instance
+        self.large_graph = False  # Low-detail rendering above the LOD thresholds
+        self.detection_worker = None  # Running background deadlock check
+        self.detection_progress = None
+        self.detection_timed_out = False
+        self.detection_timeout_ms = 30000  # Cancel checks running longer than this
+        self.trace_worker = None  # Running trace import
+        self.trace_progress = None
+        self.layout_worker = None  # Running layout computation
+        self.layout_progress = None
+        self.whatif_worker = None  # Running what-if evaluation
+        self.whatif_progress = None
+        # Layout animation: start and target positions, frames shown so far
+        self.layout_moves = None
+        self.layout_frame = 0
+        self.layout_timer = QTimer(self)
+        self.layout_timer.setInterval(REPLAY_TICK_MS)
+        self.layout_timer.timeout.connect(self.layout_step)
+        self.deferring_edges = False  # Edge geometry is updated in one batch
+        # Simulation replay: the recorded run, how far it has been applied
+        self.replay_result = None
+        self.replay_position = 0
+        self.replay_time = 0.0
+        self.replay_max_events = 100000  # Longer runs are cut off
+        self.replay_timer = QTimer(self)
+        self.replay_timer.setInterval(REPLAY_TICK_MS)
+        self.replay_timer.timeout.connect(self.replay_step)
+        self.stats_timer = QTimer(self)
+        self.stats_timer.setInterval(STATS_REFRESH_MS)
+        self.stats_timer.timeout.connect(self.refresh_stats)
         self.connect_buttons()  # Set up button event handlers
-        self.graph_manager.save_state()  # Save initial empty state
+        self.update_deadlock_status()  # Show initial live status
 
     def connect_buttons(self):
         """Connect UI buttons to their respective functions"""
@@ -28,36 +198,51 @@ class RAGSimulator(MainWindowUI):
         # Lambda functions for edge dialogs with preset type
         self.request_edge_btn.clicked.connect(lambda: self.show_add_edge_dialog('request')) 
         self.allocation_edge_btn.clicked.connect(lambda: self.show_add_edge_dialog('allocation'))
+        self.bulk_btn.clicked.connect(self.show_bulk_dialog)
         self.check_deadlock_btn.clicked.connect(self.check_deadlock)
+        self.recover_btn.clicked.connect(self.show_recovery_dialog)
+        self.detection_mode_combo.currentIndexChanged.connect(self.set_detection_mode)
         self.undo_btn.clicked.connect(self.undo_last_action)
+        self.redo_btn.clicked.connect(self.redo_last_action)
+        self.save_btn.clicked.connect(self.save_scenario)
+        self.open_btn.clicked.connect(self.open_scenario)
+        self.simulate_btn.clicked.connect(self.toggle_simulation)
+        self.avoidance_checkbox.toggled.connect(self.set_avoidance)
+        self.claim_btn.clicked.connect(self.show_claim_dialog)
+        self.trace_btn.clicked.connect(self.open_trace)
+        self.stats_btn.clicked.connect(self.toggle_stats)
+        self.export_trace_btn.clicked.connect(self.export_profile)
+        self.layout_btn.clicked.connect(self.start_layout)
+        self.whatif_btn.clicked.connect(self.start_whatif)
 
     def add_process(self):
         """Create a new process node"""
+        self.stop_replay()
+        self.finish_layout_animation()  # Its save_state would absorb the node
         self.graph_manager.process_count += 1  # Increment counter
         name = f"P{self.graph_manager.process_count}"  # Generate ID (P1, P2...)
-        # Position nodes in a grid pattern
-        x = (self.graph_manager.process_count * 100) % 700  
-        y = 100  # Fixed Y position for processes
+        # Rows of processes alternate with rows of resources
+        x, y = layout.grid_position('process', self.graph_manager.process_count)
         node = GraphicsNode(x, y, name, 'process')  # Create visual node
         self.scene.addItem(node)  # Add to graphics scene
-        self.graph_manager.nodes[name] = node  # Register in graph manager
-        self.graph_manager.graph.add_node(name, node_type='process')  # Add to NetworkX graph
+        self.graph_manager.add_node(node)  # Register with the deadlock engine
+        self.refresh_render_mode()
         self.graph_manager.save_state()  # Save current state for undo
 
     def add_resource(self):
         """Create a new resource node with configurable instances"""
         dialog = ResourceDialog(self)  # Create instance configuration dialog
         if dialog.exec():  # Show dialog and wait for user input
+            self.stop_replay()
+            self.finish_layout_animation()
             self.graph_manager.resource_count += 1
             name = f"R{self.graph_manager.resource_count}"  # Generate ID (R1, R2...)
-            x = (self.graph_manager.resource_count * 100) % 700
-            y = 300  # Fixed Y position for resources
+            x, y = layout.grid_position('resource', self.graph_manager.resource_count)
             instances = dialog.instance_spinbox.value()  # Get user-specified instances
             node = GraphicsNode(x, y, name, 'resource', instances)  # Create node
             self.scene.addItem(node)
-            self.graph_manager.nodes[name] = node
-            # Store instances in graph metadata
-            self.graph_manager.graph.add_node(name, node_type='resource', instances=instances)
+            self.graph_manager.add_node(node)  # Engine stores the instance counts
+            self.refresh_render_mode()
             self.graph_manager.save_state()
 
     def show_add_edge_dialog(self, edge_type):
@@ -96,7 +281,16 @@ class RAGSimulator(MainWindowUI):
             
             # Check available instances
             resource_node = self.graph_manager.nodes[from_node]
-            if resource_node.available_instances < instances:
+            if self.graph_manager.avoidance:
+                # Banker's rule: never beyond the declared maximum claim.
+                # Too few free instances is fine: the request waits.
+                engine = self.graph_manager.engine
+                limit = engine.max_claim(to_node, from_node)
+                if engine.edge_instances(from_node, to_node) + instances > limit:
+                    QMessageBox.warning(self, "Error",
+                        f"{to_node} would exceed its maximum claim of {limit} on {from_node}!")
+                    return False
+            elif resource_node.available_instances < instances:
                 QMessageBox.warning(self, "Error", 
                     f"Only {resource_node.available_instances} instances available!")
                 return False
@@ -105,136 +299,709 @@ class RAGSimulator(MainWindowUI):
 
     def create_edge(self, from_node, to_node, edge_type, instances):
         """Create a validated edge between nodes"""
-        if edge_type == 'allocation':
-            # Deduct available instances when allocating
-            resource_node = self.graph_manager.nodes[from_node]
-            resource_node.available_instances -= instances
-            resource_node.update()  # Trigger visual update
-
-        # Add edge to graph with metadata
-        self.graph_manager.graph.add_edge(
-            from_node, 
-            to_node, 
-            edge_type=edge_type, 
-            instances=instances
-        )
-        self.update_edges()  # Redraw all edges
+        self.stop_replay()  # The rest of the run assumed the old graph
+        self.finish_layout_animation()
+        if edge_type == 'allocation' and self.graph_manager.avoidance:
+            # Granted only into a safe state, otherwise left as a request
+            granted = self.graph_manager.allocate_safely(from_node, to_node, instances)
+            self.update_edge(to_node, from_node)
+            if not granted:
+                self.statusBar().showMessage(
+                    f"Allocation of {from_node} to {to_node} refused: the state would "
+                    f"be unsafe. {to_node} now waits on a request.")
+        else:
+            # Add edge to the engine (allocation edges deduct available instances)
+            self.graph_manager.add_edge(from_node, to_node, instances)
+        self.update_edge(from_node, to_node)  # Only this edge changed
+        self.refresh_render_mode()
         self.graph_manager.save_state()  # Save state
+        self.update_deadlock_status()  # Engine already knows the new status
+
+    def show_bulk_dialog(self):
+        """Add many nodes and edges from a script as one undoable action"""
+        dialog = BulkEdgeDialog(self)
+        if not dialog.exec():
+            return
+        self.stop_replay()
+        self.finish_layout_animation()
+        try:
+            ops = self.graph_manager.build(dialog.script_edit.toPlainText())
+        except ScriptError as error:
+            QMessageBox.warning(self, "Bulk Edit", str(error))
+            return
+        # One redraw for the whole script, as when loading a scenario
+        self.view.setUpdatesEnabled(False)
+        self.scene.setItemIndexMethod(QGraphicsScene.ItemIndexMethod.NoIndex)
+        try:
+            self.sync_scene(touched_nodes(ops))
+        finally:
+            self.apply_render_settings(self.large_graph)
+            self.view.setUpdatesEnabled(True)
+
+    def update_deadlock_status(self):
+        """Refresh the live status indicator from the incremental detector"""
+        if self.graph_manager.has_cycle:
+            self.deadlock_status_label.setText("Live status: wait-for cycle present")
+            self.deadlock_status_label.setStyleSheet("color: red;")
+        else:
+            self.deadlock_status_label.setText("Live status: no wait-for cycle")
+            self.deadlock_status_label.setStyleSheet("")
+        self.update_safety_status()
+
+    def update_safety_status(self):
+        """Show the current safe sequence while avoidance is on"""
+        if not self.graph_manager.avoidance:
+            self.safe_sequence_label.hide()
+            return
+        sequence = self.graph_manager.update_safety()
+        if sequence is None:
+            self.safe_sequence_label.setText("Unsafe state")
+            self.safe_sequence_label.setStyleSheet("color: red;")
+        else:
+            self.safe_sequence_label.setText("Safe sequence: " + (" → ".join(sequence) or "-"))
+            self.safe_sequence_label.setStyleSheet("")
+        self.safe_sequence_label.show()
+
+    def set_avoidance(self, enabled):
+        """Switch Banker's avoidance on or off for new allocations"""
+        self.graph_manager.avoidance = enabled
+        self.update_safety_status()
+
+    def show_claim_dialog(self):
+        """Declare a process's maximum claim on a resource"""
+        dialog = ClaimDialog(self)
+        if not dialog.exec():
+            return
+        process = dialog.process_edit.text()
+        resource = dialog.resource_edit.text()
+        maximum = dialog.maximum_spinbox.value()
+        engine = self.graph_manager.engine
+        if (process not in engine or resource not in engine
+                or engine.node_type(process) != 'process'
+                or engine.node_type(resource) != 'resource'):
+            QMessageBox.warning(self, "Error", "Claims go from a process to a resource!")
+            return
+        if maximum > engine.instances[engine.index[resource]]:
+            QMessageBox.warning(self, "Error",
+                f"{resource} has only {engine.instances[engine.index[resource]]} instances!")
+            return
+        self.stop_replay()
+        self.finish_layout_animation()
+        self.graph_manager.set_claim(process, resource, maximum)
+        self.graph_manager.save_state()
+        self.update_safety_status()
+
+    def refresh_render_mode(self):
+        """Switch between full and low-detail rendering by graph size"""
+        large = (len(self.graph_manager.engine) > LOD_NODE_THRESHOLD
+                 or self.graph_manager.engine.edge_count > LOD_EDGE_THRESHOLD)
+        if large == self.large_graph:
+            return
+        self.large_graph = large
+        GraphicsNode.low_detail = large
+        EdgeItem.low_detail = large
+        self.apply_render_settings(large)
+        for item in self.graph_manager.edges.values():
+            item.update_geometry()  # Build (or drop) the full bundle paths
+            item.update()
+        # Nodes keep cached pixmaps of their old labels until told otherwise
+        for node in self.graph_manager.nodes.values():
+            node.update()
 
     def update_edges(self):
-        """Redraw all edges in the graph"""
-        # Clear existing edges
-        for edge in self.graph_manager.edges:
-            self.scene.removeItem(edge)
-        self.graph_manager.edges.clear()
-
-        # Draw each edge from the NetworkX graph
-        for edge in self.graph_manager.graph.edges(data=True):
-            from_node = self.graph_manager.nodes[edge[0]]
-            to_node = self.graph_manager.nodes[edge[1]]
-            edge_type = edge[2].get('edge_type', 'request')  # Default to request
-            instances = edge[2].get('instances', 1)  # Default to 1 instance
-            is_deadlock = (edge[0], edge[1]) in self.graph_manager.deadlock_edges
-
-            self.draw_edge(from_node, to_node, edge_type, instances, is_deadlock)
+        """Sync every edge item with the engine, touching only changed ones"""
+        engine = self.graph_manager.engine
+        items = self.graph_manager.edges
+        live = set()
+        with profiler.span('update_edges', edges=engine.edge_count):
+            for from_name, to_name, edge_type, instances in engine.iter_edges():
+                live.add((from_name, to_name))
+                self.update_edge(from_name, to_name, edge_type, instances)
+
+            # Drop items whose edge no longer exists
+            for key in [key for key in items if key not in live]:
+                self.scene.removeItem(items.pop(key))
+
+    def update_edge(self, from_name, to_name, edge_type=None, instances=None):
+        """Create, restyle or remove the item of a single edge"""
+        items = self.graph_manager.edges
+        key = (from_name, to_name)
+        if profiler.enabled:
+            profiler.count('edges.updated')
+        if instances is None:
+            engine = self.graph_manager.engine
+            instances = engine.edge_instances(from_name, to_name)
+            edge_type = engine.edge_type(engine.index[from_name])
+        if not instances:
+            if key in items:
+                self.scene.removeItem(items.pop(key))
+            return
+        is_deadlock = key in self.graph_manager.deadlock_edges
+        if key in items:
+            items[key].set_state(edge_type, instances, is_deadlock)
+        else:
+            self.draw_edge(self.graph_manager.nodes[from_name],
+                           self.graph_manager.nodes[to_name],
+                           edge_type, instances, is_deadlock)
+
+    def update_node_edges(self, name):
+        """Recompute geometry for the edges incident to a moved node"""
+        if self.deferring_edges:
+            return  # The mover updates every edge once afterwards
+        engine = self.graph_manager.engine
+        items = self.graph_manager.edges
+        if name not in engine:
+            return
+        i = engine.index[name]
+        with profiler.span('update_node_edges'):
+            for j in engine.succ[i]:
+                item = items.get((name, engine.names[j]))
+                if item is not None:
+                    item.update_geometry()
+            for j in engine.pred[i]:
+                item = items.get((engine.names[j], name))
+                if item is not None:
+                    item.update_geometry()
 
     def draw_edge(self, from_node, to_node, edge_type, instances, is_deadlock):
-        """Render an edge with proper styling and arrowheads"""
-        # Calculate positions
-        start_pos = from_node.pos()
-        end_pos = to_node.pos()
-        # Center points on nodes
-        base_start_x = start_pos.x() + from_node.size/2
-        base_start_y = start_pos.y() + from_node.size/2
-        base_end_x = end_pos.x() + to_node.size/2
-        base_end_y = end_pos.y() + to_node.size/2
-
-        # Set visual properties
-        color = QColor(255, 0, 0) if is_deadlock else (
-            Qt.GlobalColor.red if edge_type == 'request' else Qt.GlobalColor.green
-        )
-        pen = QPen(color, 4 if is_deadlock else 2)  # Thicker for deadlocks
-
-        # Calculate edge path geometry
-        dx = end_pos.x() - start_pos.x()
-        dy = end_pos.y() - start_pos.y()
-        length = math.sqrt(dx*dx + dy*dy)
-        if length == 0:  # Skip if same node
-            return
-
-        # Calculate perpendicular offset for multiple instances
-        normal_x = -dy/length * 5  
-        normal_y = dx/length * 5
-
-        # Draw each instance (parallel lines for multiple instances)
-        for i in range(instances):
-            offset = (i - (instances-1)/2)  # Center the bundle
-            # Calculate offset positions
-            start_x = base_start_x + normal_x * offset
-            start_y = base_start_y + normal_y * offset
-            end_x = base_end_x + normal_x * offset
-            end_y = base_end_y + normal_y * offset
-
-            # Draw main line
-            line = self.scene.addLine(start_x, start_y, end_x, end_y, pen)
-            self.graph_manager.edges.append(line)
-
-            # Draw arrowhead (triangle)
-            arrow_size = 10
-            angle = math.atan2(end_y - start_y, end_x - start_x)  # Edge angle
-            # Calculate arrow points
-            arrow_p1 = QPointF(
-                end_x - arrow_size * math.cos(angle - math.pi/6),
-                end_y - arrow_size * math.sin(angle - math.pi/6)
-            )
-            arrow_p2 = QPointF(
-                end_x - arrow_size * math.cos(angle + math.pi/6),
-                end_y - arrow_size * math.sin(angle + math.pi/6)
-            )
-            
-            # Draw arrow lines
-            arrow1 = self.scene.addLine(end_x, end_y, arrow_p1.x(), arrow_p1.y(), pen)
-            arrow2 = self.scene.addLine(end_x, end_y, arrow_p2.x(), arrow_p2.y(), pen)
-            self.graph_manager.edges.extend([arrow1, arrow2])
+        """Add a persistent item rendering an edge bundle with arrowheads"""
+        item = EdgeItem(from_node, to_node, edge_type, instances, is_deadlock)
+        self.scene.addItem(item)
+        if profiler.enabled:
+            profiler.count('edges.created')
+        self.graph_manager.edges[(from_node.name, to_node.name)] = item
+        return item
+
+    def set_detection_mode(self, index):
+        """Switch the detector used by the Check Deadlock action"""
+        self.graph_manager.detection_mode = self.detection_mode_combo.itemData(index)
 
     def check_deadlock(self):
-        """Check for deadlock conditions in the graph"""
-        has_deadlock, message = self.graph_manager.check_deadlock()
-        if has_deadlock:
-            self.update_edges()  # Redraw with highlights
+        """Start a deadlock check in the background; the UI stays responsive"""
+        if self.detection_worker is not None:
+            return  # A check is already running
+        gm = self.graph_manager
+        worker = DetectionWorker(gm.engine.copy(), gm.detection_mode,
+                                 gm.cycle_report_limit, gm.revision, self)
+        worker.result_ready.connect(self.detection_finished)
+        worker.cancelled.connect(self.detection_cancelled)
+        self.detection_worker = worker
+        self.detection_timed_out = False
+
+        # Busy indicator with a cancel button, shown only for slow checks
+        self.detection_progress = QProgressDialog("Checking for deadlock...", "Cancel",
+                                                  0, 0, self)
+        self.detection_progress.setWindowModality(Qt.WindowModality.NonModal)
+        self.detection_progress.setMinimumDuration(300)
+        self.detection_progress.canceled.connect(worker.cancel)
+        QTimer.singleShot(self.detection_timeout_ms,
+                          lambda: self.detection_timeout(worker))
+        worker.start()
+
+    def detection_timeout(self, worker):
+        """Cancel a check that has been running for too long"""
+        if worker is self.detection_worker:
+            self.detection_timed_out = True
+            worker.cancel()
+
+    def finish_detection(self):
+        """Tear down the worker and progress indicator of a finished check"""
+        self.detection_worker.wait()
+        self.detection_worker.deleteLater()
+        self.detection_worker = None
+        self.detection_progress.canceled.disconnect()
+        self.detection_progress.close()
+        self.detection_progress.deleteLater()
+        self.detection_progress = None
+
+    def detection_finished(self, result, message, revision):
+        """Apply a finished check on the GUI thread"""
+        self.finish_detection()
+        if revision != self.graph_manager.revision:
+            # The graph was edited during the check; its result is stale
+            self.deadlock_status_label.setText("Live status: check result stale, re-checking")
+            self.check_deadlock()
+            return
+        previous = set(self.graph_manager.deadlock_edges)
+        self.graph_manager.apply_result(result)
+        # Restyle only edges whose highlight changed
+        for key in previous | self.graph_manager.deadlock_edges:
+            self.update_edge(*key)
+        self.update_deadlock_status()
+        if result:
             QMessageBox.warning(self, "Deadlock Detection", message)
         else:
             QMessageBox.information(self, "Deadlock Detection", message)
 
+    def detection_cancelled(self, revision):
+        """Report a check that was cancelled by the user or timed out"""
+        self.finish_detection()
+        if self.detection_timed_out:
+            QMessageBox.warning(self, "Deadlock Detection",
+                f"Deadlock check timed out after {self.detection_timeout_ms / 1000:g} s.")
+
+    def show_recovery_dialog(self):
+        """Plan victims that end every deadlock and apply them on request"""
+        dialog = RecoveryDialog(self)
+        if not dialog.exec():
+            return
+        try:
+            costs = recovery.parse_costs(dialog.costs_edit.text())
+        except ValueError as error:
+            QMessageBox.warning(self, "Error", str(error))
+            return
+        gm = self.graph_manager
+        exact_limit = recovery.EXACT_LIMIT if dialog.exact_checkbox.isChecked() else None
+        plan = recovery.plan_recovery(gm.engine, costs, dialog.action_combo.currentData(),
+                                      exact_limit, mode=gm.detection_mode)
+        if not plan:
+            QMessageBox.information(self, "Deadlock Recovery", plan.message())
+            return
+        answer = QMessageBox.question(self, "Deadlock Recovery",
+                                      plan.message() + "\n\nApply this plan?")
+        if answer != QMessageBox.StandardButton.Yes:
+            return
+        self.stop_replay()
+        self.finish_layout_animation()  # Terminated nodes leave the scene
+        gm.save_state()  # Keep earlier edits a separate action
+        gm.apply(plan.ops)
+        gm.save_state()  # The whole plan undoes in one step
+        self.sync_scene(touched_nodes(plan.ops))
+
+    def start_whatif(self):
+        """Rank every candidate next allocation in the background"""
+        if self.whatif_worker is not None:
+            return  # Branches are already being evaluated
+        self.stop_replay()
+        self.finish_layout_animation()
+        gm = self.graph_manager
+        gm.save_state()  # Branches start from the committed graph
+        worker = WhatIfWorker(gm.engine.copy(), gm.detection_mode, gm.avoidance,
+                              gm.revision, self)
+        worker.results_ready.connect(self.whatif_finished)
+        worker.cancelled.connect(self.finish_whatif_worker)
+        self.whatif_worker = worker
+        self.whatif_progress = QProgressDialog("Evaluating what-if branches...", "Cancel", 0, 0, self)
+        self.whatif_progress.setWindowModality(Qt.WindowModality.NonModal)
+        self.whatif_progress.setMinimumDuration(300)
+        self.whatif_progress.canceled.connect(worker.cancel)
+        worker.start()
+
+    def finish_whatif_worker(self):
+        """Tear down the worker and progress indicator of a what-if run"""
+        self.whatif_worker.wait()
+        self.whatif_worker.deleteLater()
+        self.whatif_worker = None
+        self.whatif_progress.canceled.disconnect()
+        self.whatif_progress.close()
+        self.whatif_progress.deleteLater()
+        self.whatif_progress = None
+
+    def whatif_finished(self, branches, records, revision):
+        """List the ranked branches; the selected one is shown in place"""
+        self.finish_whatif_worker()
+        self.finish_layout_animation()  # Branches change the graph in place
+        gm = self.graph_manager
+        if revision != gm.revision:
+            self.statusBar().showMessage("Graph changed during what-if; run it again")
+            return
+        if not records:
+            QMessageBox.information(self, "What If", "No pending request can be granted now.")
+            return
+        dialog = WhatIfDialog(records, self)
+        # Switching applies only the difference between two branches
+        dialog.branch_list.currentRowChanged.connect(
+            lambda row: self.show_branch(branches[records[row]['index']] if row >= 0 else None))
+        if dialog.exec() and gm.branch_ops:
+            gm.keep_branch()  # The chosen branch undoes in one step
+        else:
+            self.show_branch(None)
+
+    def show_branch(self, branch):
+        """Show what-if ``branch`` in the graph, or the graph itself for ``None``"""
+        ops = self.graph_manager.switch_branch(branch.path() if branch is not None else ())
+        self.sync_scene(touched_nodes(ops))
+
+    def start_layout(self):
+        """Compute the chosen automatic layout in the background"""
+        if self.layout_worker is not None:
+            return  # A layout is already being computed
+        self.stop_replay()
+        self.finish_layout_animation()
+        gm = self.graph_manager
+        if not len(gm.engine):
+            return
+        worker = LayoutWorker(gm.engine.copy(), self.layout_combo.currentData(),
+                              gm.revision, self)
+        worker.layout_ready.connect(self.layout_finished)
+        worker.cancelled.connect(self.finish_layout_worker)
+        self.layout_worker = worker
+        self.layout_progress = QProgressDialog("Computing layout...", "Cancel", 0, 0, self)
+        self.layout_progress.setWindowModality(Qt.WindowModality.NonModal)
+        self.layout_progress.setMinimumDuration(300)
+        self.layout_progress.canceled.connect(worker.cancel)
+        worker.start()
+
+    def finish_layout_worker(self):
+        """Tear down the worker and progress indicator of a layout"""
+        self.layout_worker.wait()
+        self.layout_worker.deleteLater()
+        self.layout_worker = None
+        self.layout_progress.canceled.disconnect()
+        self.layout_progress.close()
+        self.layout_progress.deleteLater()
+        self.layout_progress = None
+
+    def layout_finished(self, positions, revision):
+        """Animate nodes from where they are to the computed layout"""
+        self.finish_layout_worker()
+        gm = self.graph_manager
+        if revision != gm.revision:
+            self.statusBar().showMessage("Graph changed during layout; run it again")
+            return
+        engine = gm.engine
+        self.layout_moves = [(name, engine.position(name), target)
+                             for name, target in positions.items()
+                             if name in engine and engine.position(name) != target]
+        self.layout_frame = 0
+        if self.layout_moves:
+            self.layout_timer.start()
+            self.layout_step()
+
+    def layout_step(self):
+        """Move every node one frame closer, then update the edges once"""
+        self.layout_frame += 1
+        # Large graphs jump straight to the end; animating them is too slow
+        frames = 1 if self.large_graph else LAYOUT_ANIMATION_FRAMES
+        t = min(self.layout_frame / frames, 1.0)
+        t = t * t * (3 - 2 * t)  # Ease in and out
+        nodes = self.graph_manager.nodes
+        self.deferring_edges = True
+        try:
+            for name, (x0, y0), (x1, y1) in self.layout_moves:
+                node = nodes.get(name)
+                if node is not None:  # Skip nodes removed since the layout began
+                    node.setPos(x0 + (x1 - x0) * t, y0 + (y1 - y0) * t)
+        finally:
+            self.deferring_edges = False
+        with profiler.span('update_edges.layout', edges=len(self.graph_manager.edges)):
+            for item in self.graph_manager.edges.values():
+                item.update_geometry()
+        if t >= 1.0:
+            self.layout_timer.stop()
+            for name, start, target in self.layout_moves:
+                if name in nodes:
+                    self.graph_manager.move_node(name, start, target)
+            self.layout_moves = None
+            self.graph_manager.save_state()  # The whole layout undoes in one step
+
+    def finish_layout_animation(self):
+        """Jump a running layout animation to its end"""
+        if self.layout_moves is not None:
+            self.layout_frame = LAYOUT_ANIMATION_FRAMES
+            self.layout_step()
+
+    def toggle_stats(self):
+        """Turn profiling and its on-screen stats overlay on or off"""
+        if profiler.enabled:
+            profiler.enable(False)  # Recorded data stays available for export
+            self.stats_timer.stop()
+            self.stats_overlay.hide()
+            return
+        profiler.reset()
+        profiler.enable()
+        self.refresh_stats()
+        self.stats_overlay.show()
+        self.stats_timer.start()
+
+    def refresh_stats(self):
+        """Show the latest profiling totals in the overlay"""
+        self.stats_overlay.setText("\n".join(profiler.summary_lines()))
+        self.stats_overlay.adjustSize()
+
+    def export_profile(self):
+        """Save what the profiler recorded as a Chrome trace"""
+        if not profiler.events:
+            QMessageBox.information(self, "Export Trace",
+                "Nothing recorded yet. Turn on Stats (I) first.")
+            return
+        path, _ = QFileDialog.getSaveFileName(self, "Export Trace", "", PROFILE_FILTER)
+        if not path:
+            return
+        try:
+            profiler.export(path)
+        except OSError as error:
+            QMessageBox.warning(self, "Error", f"Could not export trace:\n{error}")
+
+    def closeEvent(self, event):
+        """Stop a running check or replay before the window goes away"""
+        self.stop_replay()
+        for worker in (self.detection_worker, self.trace_worker, self.layout_worker,
+                       self.whatif_worker):
+            if worker is not None:
+                worker.cancel()
+                worker.wait()
+        super().closeEvent(event)
+
+    def toggle_simulation(self):
+        """Simulate a random workload on the current graph and replay it,
+        or stop a replay in progress"""
+        if self.replay_result is not None:
+            self.stop_replay()
+            return
+        engine = self.graph_manager.engine
+        kinds = set(engine.kinds)
+        if kinds != {0, 1}:
+            QMessageBox.warning(self, "Simulation",
+                "Add at least one process and one resource first.")
+            return
+        self.finish_layout_animation()
+        # The whole run is computed up front; the replay only applies its trace
+        seed = random.randrange(1 << 30)
+        simulation = Simulation(engine.copy(), random_workload(engine, seed=seed),
+                                mode=self.graph_manager.detection_mode, record=True)
+        self.replay_result = simulation.run(max_events=self.replay_max_events)
+        self.replay_position = 0
+        self.replay_time = 0.0
+        self.graph_manager.save_state()  # Keep earlier edits a separate action
+        self.simulate_btn.setText("Stop Simulation (S)")
+        self.statusBar().showMessage(f"Simulating workload seed {seed}")
+        self.replay_timer.start()
+
+    def replay_step(self):
+        """Apply the trace events due by the next frame's simulated time"""
+        result = self.replay_result
+        trace = result.trace
+        self.replay_time += self.replay_speed_combo.currentData() * REPLAY_TICK_MS / 1000
+        start = self.replay_position
+        end = start
+        while end < len(trace) and trace[end][0] <= self.replay_time:
+            end += 1
+        if end > start:
+            ops = [op for _, op in trace[start:end]]
+            self.graph_manager.play(ops)
+            self.replay_position = end
+            self.sync_scene(touched_nodes(ops))  # Batched: one pass per frame
+        self.statusBar().showMessage(
+            f"Simulation t = {min(self.replay_time, result.time):.2f} / {result.time:.2f}"
+            f" ({end} of {len(trace)} changes)")
+        if end == len(trace) and self.replay_time >= result.time:
+            self.stop_replay()
+            self.report_simulation(result)
+
+    def stop_replay(self):
+        """End a replay, keeping what was applied as one undoable action"""
+        if self.replay_result is None:
+            return
+        self.replay_timer.stop()
+        self.replay_result = None
+        self.graph_manager.save_state()
+        self.simulate_btn.setText("Simulate (S)")
+
+    def report_simulation(self, result):
+        """Highlight and describe the outcome of a fully replayed run"""
+        if not result:
+            self.statusBar().showMessage(
+                f"Simulation finished at t = {result.time:.2f} without deadlock "
+                f"({result.events} events)")
+            return
+        self.graph_manager.apply_result(result.deadlock)
+        for key in self.graph_manager.deadlock_edges:
+            self.update_edge(*key)
+        self.statusBar().showMessage(
+            f"Deadlock at t = {result.deadlock_time:.2f} after {result.deadlock_event} events")
+        QMessageBox.warning(self, "Simulation",
+            f"Deadlock formed at t = {result.deadlock_time:.2f}.\n\n"
+            + result.deadlock.message(self.graph_manager.cycle_report_limit))
+
+    def nodes_moved(self, moves):
+        """Record a finished drag of one or more nodes as one undoable action"""
+        for name, old_pos, new_pos in moves:
+            self.graph_manager.move_node(name, old_pos, new_pos)
+        self.graph_manager.save_state()
+
     def undo_last_action(self):
-        """Revert to the previous graph state"""
-        if len(self.graph_manager.history) > 1:  # Must have previous state
-            self.graph_manager.history.pop()  # Remove current state
-            previous_state = self.graph_manager.history[-1]  # Get previous
-            
-            # Clear current visualization
-            self.scene.clear()
-            self.graph_manager.edges.clear()
-            self.graph_manager.deadlock_edges.clear()
-            
-            # Restore graph data
-            self.graph_manager.graph = previous_state['graph'].copy()
-            self.graph_manager.process_count = previous_state['process_count']
-            self.graph_manager.resource_count = previous_state['resource_count']
-            self.graph_manager.nodes = {}
-            
-            # Recreate all nodes
-            for name, pos_data in previous_state['node_positions'].items():
-                node_type = 'process' if name.startswith('P') else 'resource'
-                instances = pos_data[2]
-                available_instances = pos_data[3]
-                node = GraphicsNode(pos_data[0], pos_data[1], name, node_type, instances)
-                node.available_instances = available_instances
-                node.is_in_deadlock = False
+        """Revert the most recent action"""
+        self.stop_replay()
+        self.finish_layout_animation()
+        entry = self.graph_manager.undo()
+        if entry is not None:
+            self.sync_scene(touched_nodes(entry.ops))
+
+    def redo_last_action(self):
+        """Reapply the most recently undone action"""
+        self.stop_replay()
+        self.finish_layout_animation()
+        entry = self.graph_manager.redo()
+        if entry is not None:
+            self.sync_scene(touched_nodes(entry.ops))
+
+    def sync_scene(self, names=None):
+        """Bring the scene in line with the engine, touching only ``names``.
+
+        Items for nodes and edges outside ``names`` are left alone; with
+        ``names=None`` every node is compared. Node types and counts come
+        from the engine, never from the node name.
+        """
+        engine = self.graph_manager.engine
+        nodes = self.graph_manager.nodes
+        items = self.graph_manager.edges
+        if names is None:
+            names = set(nodes) | set(engine.names)
+        self.refresh_render_mode()  # Build new items at the right detail level
+
+        # Highlights describe a state that no longer exists
+        stale_edges = self.graph_manager.clear_highlights()
+
+        for name in names:
+            node = nodes.get(name)
+            if name not in engine:
+                if node is not None:
+                    self.scene.removeItem(nodes.pop(name))
+                continue
+            i = engine.index[name]
+            if node is not None and node.node_type != engine.node_type(name):
+                self.scene.removeItem(nodes.pop(name))
+                node = None
+            if node is None:
+                node = GraphicsNode(engine.xs[i], engine.ys[i], name,
+                                    engine.node_type(name), engine.instances[i])
+                node.bind(engine)
                 self.scene.addItem(node)
-                self.graph_manager.nodes[name] = node
-            
-            self.update_edges()  # Redraw edges
+                nodes[name] = node
+            else:
+                if (node.pos().x(), node.pos().y()) != (engine.xs[i], engine.ys[i]):
+                    node.setPos(engine.xs[i], engine.ys[i])
+                node.update()  # Instance counts may have changed
+
+        # Edges touching a changed node: drop stale items, refresh the rest
+        for key in [key for key in items
+                    if key[0] in names or key[1] in names or key in stale_edges]:
+            item = items[key]
+            if (key[0] not in engine or key[1] not in engine
+                    or item.from_node is not nodes.get(key[0])
+                    or item.to_node is not nodes.get(key[1])):
+                self.scene.removeItem(items.pop(key))
+            else:
+                self.update_edge(*key)
+        for name in names:
+            if name not in engine:
+                continue
+            i = engine.index[name]
+            for j in engine.succ[i]:
+                self.update_edge(name, engine.names[j])
+            for j in engine.pred[i]:
+                if engine.names[j] not in names:  # Otherwise handled as its successor
+                    self.update_edge(engine.names[j], name)
+
+        self.update_deadlock_status()
+
+    def save_scenario(self):
+        """Save the graph to a .rag (JSON Lines) or .ragz (binary) file"""
+        path, _ = QFileDialog.getSaveFileName(self, "Save Scenario", "", SCENARIO_FILTER)
+        if not path:
+            return
+        counters = (self.graph_manager.process_count, self.graph_manager.resource_count)
+        try:
+            rag_io.save(path, self.graph_manager.engine, counters)
+        except OSError as error:
+            QMessageBox.warning(self, "Error", f"Could not save scenario:\n{error}")
+
+    def open_scenario(self):
+        """Load a scenario file chosen by the user"""
+        path, _ = QFileDialog.getOpenFileName(self, "Open Scenario", "", SCENARIO_FILTER)
+        if path:
+            self.load_scenario(path)
+
+    def load_scenario(self, path):
+        """Load a scenario in bulk: one history entry and one repaint"""
+        try:
+            engine, counters = rag_io.load(path)
+        except (OSError, ValueError, TypeError, KeyError, IndexError,
+                AttributeError) as error:
+            # RAGFormatError is a ValueError; the rest guard against files
+            # the loader's checks do not anticipate
+            QMessageBox.warning(self, "Error", f"Could not open scenario:\n{error}")
+            return False
+        self.show_engine(engine, counters)
+        return True
+
+    def open_trace(self):
+        """Show the live lock graph of a trace at a chosen point in time"""
+        if self.trace_worker is not None:
+            return  # A trace is already being read
+        path, _ = QFileDialog.getOpenFileName(self, "Open Lock Trace", "", TRACE_FILTER)
+        if not path:
+            return
+        text, ok = QInputDialog.getText(self, "Open Lock Trace",
+            "Show the graph at time (seconds or ISO 8601; blank for the end):")
+        if not ok:
+            return
+        try:
+            until = lock_trace.parse_time(text.strip()) if text.strip() else None
+        except lock_trace.TraceFormatError as error:
+            QMessageBox.warning(self, "Error", str(error))
+            return
+        self.load_trace(path, until)
+
+    def load_trace(self, path, until=None):
+        """Read a trace in the background; the result replaces the graph"""
+        worker = TraceWorker(path, until, self.graph_manager.detection_mode, self)
+        worker.trace_ready.connect(self.trace_loaded)
+        worker.failed.connect(self.trace_failed)
+        worker.cancelled.connect(self.finish_trace)
+        self.trace_worker = worker
+        # Modal: the graph is replaced when reading finishes
+        self.trace_progress = QProgressDialog("Reading lock trace...", "Cancel", 0, 100, self)
+        self.trace_progress.setWindowModality(Qt.WindowModality.WindowModal)
+        self.trace_progress.setMinimumDuration(300)
+        worker.progress.connect(self.trace_progress.setValue)
+        self.trace_progress.canceled.connect(worker.cancel)
+        worker.start()
+
+    def finish_trace(self):
+        """Tear down the worker and progress dialog of a trace import"""
+        self.trace_worker.wait()
+        self.trace_worker.deleteLater()
+        self.trace_worker = None
+        self.trace_progress.canceled.disconnect()
+        self.trace_progress.close()
+        self.trace_progress.deleteLater()
+        self.trace_progress = None
+
+    def trace_failed(self, message):
+        self.finish_trace()
+        QMessageBox.warning(self, "Error", f"Could not read trace:\n{message}")
+
+    def trace_loaded(self, replayer):
+        """Show the live state where reading stopped and summarise the trace"""
+        self.finish_trace()
+        engine = replayer.snapshot()
+        self.show_engine(engine, rag_io.default_counters(engine))
+        if engine.has_cycle:
+            # Deadlocks still unresolved at this point in the trace
+            self.graph_manager.apply_result(engine.detect(self.graph_manager.detection_mode))
+            for key in self.graph_manager.deadlock_edges:
+                self.update_edge(*key)
+        lines = [f"{replayer.events} events read, {replayer.deadlocks} deadlocks found."]
+        for report in replayer.reports:
+            lines.append(f"Line {report['line']} (t = {report['time']:.3f}): "
+                         + ", ".join(report['processes']))
+        QMessageBox.information(self, "Lock Trace", "\n".join(lines))
+
+    def show_engine(self, engine, counters):
+        """Replace the graph with ``engine`` and build the scene in bulk"""
+        self.stop_replay()
+        self.finish_layout_animation()
+        ops = self.graph_manager.load(engine, counters)
+        # Suspend repaints and scene indexing while thousands of items are added
+        self.view.setUpdatesEnabled(False)
+        self.scene.setItemIndexMethod(QGraphicsScene.ItemIndexMethod.NoIndex)
+        try:
+            self.sync_scene(touched_nodes(ops))
+        finally:
+            self.apply_render_settings(self.large_graph)
+            self.view.setUpdatesEnabled(True)
 
 def main():
     """Application entry point"""
@@ -0,0 +1,155 @@
+"""Lightweight timers and counters for the hot paths.
+
+Instrumentation is off by default, and then ``profiler.span`` returns a
+shared no-op context manager and ``profiler.count`` returns at once. Code on
+the hottest paths checks ``profiler.enabled`` itself before doing any work.
+
+    from profiling import profiler
+
+    with profiler.span('detect.scc'):
+        ...
+    profiler.count('edges.created')
+
+While enabled, every span is kept as a Chrome trace event (the most recent
+``max_events``), and per-name totals are kept for the stats overlay.
+``export`` writes the events as Chrome trace JSON, which opens in
+chrome://tracing or https://ui.perfetto.dev.
+"""
+import json
+import os
+import threading
+import time
+from collections import deque
+
+
+class _NullSpan:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NULL_SPAN = _NullSpan()
+
+
+class _Span:
+    __slots__ = ('profiler', 'name', 'args', 'start')
+
+    def __init__(self, profiler, name, args):
+        self.profiler = profiler
+        self.name = name
+        self.args = args
+
+    def __enter__(self):
+        self.start = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, *exc):
+        self.profiler.add_span(self.name, self.start, time.perf_counter_ns(), self.args)
+        return False
+
+
+class Profiler:
+    """Span timings and counters, collected only while ``enabled``.
+
+    ``stats`` maps span names to ``[calls, total_ns, max_ns]`` and
+    ``counters`` maps counter names to running totals. Spans may end on any
+    thread.
+    """
+
+    def __init__(self, max_events=200000):
+        self.enabled = False
+        self.events = deque(maxlen=max_events)
+        self.stats = {}
+        self.counters = {}
+        self._lock = threading.Lock()
+
+    def enable(self, enabled=True):
+        self.enabled = enabled
+
+    def reset(self):
+        with self._lock:
+            self.events.clear()
+            self.stats = {}
+            self.counters = {}
+
+    def span(self, name, **args):
+        """Context manager timing the block it wraps as span ``name``"""
+        if not self.enabled:
+            return _NULL_SPAN
+        return _Span(self, name, args)
+
+    def add_span(self, name, start_ns, end_ns, args=None):
+        duration = end_ns - start_ns
+        event = {'name': name, 'ph': 'X', 'ts': start_ns / 1000, 'dur': duration / 1000,
+                 'pid': os.getpid(), 'tid': threading.get_ident()}
+        if args:
+            event['args'] = args
+        with self._lock:
+            self.events.append(event)
+            stat = self.stats.get(name)
+            if stat is None:
+                self.stats[name] = [1, duration, duration]
+            else:
+                stat[0] += 1
+                stat[1] += duration
+                if duration > stat[2]:
+                    stat[2] = duration
+
+    def count(self, name, n=1):
+        """Add ``n`` to counter ``name``; the total is also traced over time"""
+        if not self.enabled:
+            return
+        with self._lock:
+            total = self.counters.get(name, 0) + n
+            self.counters[name] = total
+            self.events.append({'name': name, 'ph': 'C', 'ts': time.perf_counter_ns() / 1000,
+                                'pid': os.getpid(), 'args': {name: total}})
+
+    def drain(self):
+        """Remove and return the recorded events, e.g. to ship them from a
+        worker process to ``merge`` in the parent"""
+        with self._lock:
+            events = list(self.events)
+            self.events.clear()
+        return events
+
+    def merge(self, events):
+        """Add trace events recorded elsewhere; totals are not affected"""
+        with self._lock:
+            self.events.extend(events)
+
+    def summary_lines(self, limit=12):
+        """Text lines of the slowest spans by total time, then the counters"""
+        with self._lock:
+            stats = sorted(self.stats.items(), key=lambda item: -item[1][1])[:limit]
+            counters = sorted(self.counters.items())
+        lines = [f"{'span':<24}{'calls':>8}{'total ms':>11}{'avg ms':>9}{'max ms':>9}"]
+        for name, (calls, total, peak) in stats:
+            lines.append(f"{name:<24}{calls:>8}{total / 1e6:>11.1f}"
+                         f"{total / calls / 1e6:>9.2f}{peak / 1e6:>9.2f}")
+        for name, total in counters:
+            lines.append(f"{name:<24}{total:>8}")
+        return lines
+
+    def chrome_trace(self):
+        with self._lock:
+            events = list(self.events)
+        return {'traceEvents': events, 'displayTimeUnit': 'ms'}
+
+    def export(self, path):
+        """Write the recorded events to ``path`` as Chrome trace JSON"""
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(self.chrome_trace(), f)
+
+
+# Shared by the engine, the history and the view
+profiler = Profiler()
+
+
+def enable():
+    """Turn the shared profiler on (usable as a worker-process initializer)"""
+    profiler.enable()
@@ -0,0 +1,102 @@
+"""Seeded generators of synthetic resource allocation graphs.
+
+Used by the benchmarks and for stress-testing detection. Every generator
+takes a ``seed`` so the same arguments always produce the same graph.
+"""
+import random
+
+from deadlock_engine import RAGEngine, PROCESS, RESOURCE
+
+_SPACING = 100
+
+
+def _grid_position(i, columns, row_offset):
+    return float((i % columns) * _SPACING), float(row_offset + (i // columns) * _SPACING)
+
+
+def _add_nodes(engine, processes, resources, max_instances, rng):
+    columns = max(1, int(max(processes, resources) ** 0.5))
+    for p in range(processes):
+        engine.add_node(f"P{p + 1}", PROCESS, 1, *_grid_position(p, columns, 0))
+    offset = (processes // columns + 2) * _SPACING
+    for r in range(resources):
+        engine.add_node(f"R{r + 1}", RESOURCE, rng.randint(1, max_instances),
+                        *_grid_position(r, columns, offset))
+
+
+def random_rag(processes, resources, max_instances=3, edge_density=0.01,
+               cycle_density=0.0, request_ratio=0.5, seed=None):
+    """Build a random graph.
+
+    ``edge_density`` is the fraction of process/resource pairs joined by an
+    edge, ``request_ratio`` the share of those edges that are requests.
+    Allocations never exceed a resource's instances. ``cycle_density`` is
+    the fraction of processes placed on planted circular waits: each holds
+    all instances of one resource and requests the next one in the ring.
+    """
+    rng = random.Random(seed)
+    engine = RAGEngine()
+    _add_nodes(engine, processes, resources, max_instances, rng)
+
+    # Plant circular waits first so they get the resources they need
+    planted = min(int(processes * cycle_density), resources)
+    ring_length = 2
+    start = 0
+    while start + ring_length <= planted:
+        ring = range(start, start + ring_length)
+        for k in ring:
+            resource = f"R{k + 1}"
+            engine.add_edge(resource, f"P{k + 1}", engine.instances[engine.index[resource]])
+        for k in ring:
+            following = start + (k - start + 1) % ring_length
+            engine.add_edge(f"P{k + 1}", f"R{following + 1}", 1)
+        start += ring_length
+        ring_length = 2 + rng.randrange(4)
+
+    edges = int(edge_density * processes * resources)
+    for _ in range(edges):
+        process = f"P{rng.randrange(processes) + 1}"
+        resource = f"R{rng.randrange(resources) + 1}"
+        count = rng.randint(1, max_instances)
+        if rng.random() < request_ratio:
+            engine.add_edge(process, resource, count)
+        else:
+            available = engine.available[engine.index[resource]]
+            if available:
+                engine.add_edge(resource, process, min(count, available))
+    return engine
+
+
+def adversarial_rag(size, seed=None):
+    """A graph with exponentially many simple cycles but one deadlock.
+
+    ``size`` processes each hold one single-instance resource and request
+    every other resource, so the wait-for graph is one dense strongly
+    connected component. Enumerating its simple cycles is hopeless even for
+    small ``size``; component-based detection stays linear.
+    """
+    rng = random.Random(seed)
+    engine = RAGEngine()
+    _add_nodes(engine, size, size, 1, rng)
+    edges = [(f"R{k}", f"P{k}", 1) for k in range(1, size + 1)]
+    for p in range(1, size + 1):
+        edges.extend((f"P{p}", f"R{r}", 1)
+                     for r in rng.sample(range(1, size + 1), size) if r != p)
+    engine.add_edges(edges)
+    return engine
+
+
+def chain_rag(length, closed=True, seed=None):
+    """One long circular wait through ``length`` processes.
+
+    Deep cycles exercise the non-recursive traversals. With ``closed=False``
+    the chain is left open and there is no deadlock.
+    """
+    rng = random.Random(seed)
+    engine = RAGEngine()
+    _add_nodes(engine, length, length, 1, rng)
+    for k in range(1, length + 1):
+        engine.add_edge(f"R{k}", f"P{k}", 1)
+    for k in range(1, length + (1 if closed else 0)):
+        engine.add_edge(f"P{k}", f"R{k % length + 1}", 1)
+    return engine
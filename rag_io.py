@@ -0,0 +1,357 @@
+"""Saving and loading resource allocation graphs.
+
+Two formats hold the same data (nodes, instance and available counts,
+positions, edges with multiplicities, maximum claims and the node name
+counters):
+
+- ``.rag``: versioned JSON Lines. The first line is a header, then one
+  record per node and per edge, so files are readable, diffable and can be
+  read as a stream without holding the parsed document in memory.
+- ``.ragz``: compressed NumPy columns, for large graphs.
+
+Both loaders collect columns and build the ``RAGEngine`` in one bulk pass.
+"""
+import json
+import zipfile
+import zlib
+from array import array
+
+import numpy as np
+
+from deadlock_engine import RAGEngine, PROCESS, RESOURCE
+from profiling import profiler
+
+FORMAT_NAME = 'rag'
+FORMAT_VERSION = 1
+BINARY_SUFFIX = '.ragz'
+
+_KIND_CODES = {PROCESS: 0, RESOURCE: 1}
+_BINARY_COLUMNS = ('version', 'counters', 'names', 'kinds', 'instances',
+                   'available', 'xs', 'ys', 'sources', 'targets', 'counts')
+# Claim columns are optional so files written before claims existed still load
+_CLAIM_COLUMNS = ('claim_processes', 'claim_resources', 'claim_maximums')
+
+
+class RAGFormatError(ValueError):
+    """Raised when a scenario file cannot be read"""
+
+
+def default_counters(engine):
+    """Name counters that will not collide with existing P<n>/R<n> names"""
+    counters = {'P': 0, 'R': 0}
+    for name in engine.names:
+        prefix, digits = name[:1], name[1:]
+        if prefix in counters and digits.isdigit():
+            counters[prefix] = max(counters[prefix], int(digits))
+    return counters['P'], counters['R']
+
+
+def save(path, engine, counters=None):
+    """Save ``engine``; the format follows the file suffix"""
+    if counters is None:
+        counters = default_counters(engine)
+    if str(path).endswith(BINARY_SUFFIX):
+        save_binary(path, engine, counters)
+    else:
+        save_json(path, engine, counters)
+
+
+def load(path):
+    """Load a scenario; returns ``(engine, (process_count, resource_count))``"""
+    with profiler.span('load'):
+        if str(path).endswith(BINARY_SUFFIX):
+            return load_binary(path)
+        with open(path, encoding='utf-8') as stream:
+            return load_json(stream)
+
+
+def save_json(path, engine, counters):
+    with open(path, 'w', encoding='utf-8') as stream:
+        write_records(stream, engine, counters)
+
+
+def write_records(stream, engine, counters):
+    """Write the JSON Lines representation of ``engine`` to ``stream``"""
+    header = {'format': FORMAT_NAME, 'version': FORMAT_VERSION,
+              'process_count': counters[0], 'resource_count': counters[1]}
+    stream.write(json.dumps(header) + '\n')
+    for i, name in enumerate(engine.names):
+        stream.write(json.dumps({
+            'node': name, 'type': engine.node_type(name),
+            'instances': engine.instances[i], 'available': engine.available[i],
+            'x': engine.xs[i], 'y': engine.ys[i]}) + '\n')
+    for from_node, to_node, _, instances in engine.iter_edges():
+        stream.write(json.dumps({'edge': [from_node, to_node],
+                                 'instances': instances}) + '\n')
+    for process, resource, maximum in engine.iter_claims():
+        stream.write(json.dumps({'claim': [process, resource],
+                                 'maximum': maximum}) + '\n')
+
+
+def iter_records(stream):
+    """Yield the parsed records of a JSON Lines scenario, header first"""
+    for line_number, line in enumerate(stream, 1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            record = json.loads(line)
+        except ValueError as error:
+            raise RAGFormatError(f"Line {line_number}: {error}") from None
+        if not isinstance(record, dict):
+            raise RAGFormatError(f"Line {line_number}: expected an object")
+        if line_number == 1:
+            if record.get('format') != FORMAT_NAME:
+                raise RAGFormatError("Not a resource allocation graph file")
+            _integer(record, 'version', 0, "Header")
+            if record.get('version', 0) > FORMAT_VERSION:
+                raise RAGFormatError(
+                    f"File version {record['version']} is newer than supported")
+        yield line_number, record
+
+
+def _integer(record, key, default, where):
+    """``record[key]`` (or ``default``), which must be an integer"""
+    value = record.get(key, default)
+    # bool is an int subclass but never a count
+    if isinstance(value, bool) or not isinstance(value, int):
+        raise RAGFormatError(f"{where}: {key!r} must be an integer, not {value!r}")
+    return value
+
+
+def _number(record, key, where):
+    value = record.get(key, 0.0)
+    if isinstance(value, bool) or not isinstance(value, (int, float)):
+        raise RAGFormatError(f"{where}: {key!r} must be a number, not {value!r}")
+    return value
+
+
+def _pair(record, key, where):
+    """``record[key]`` as two node names"""
+    value = record[key]
+    if (not isinstance(value, list) or len(value) != 2
+            or not all(isinstance(name, str) for name in value)):
+        raise RAGFormatError(f"{where}: {key!r} must be a pair of node names")
+    return value
+
+
+def load_json(stream):
+    """Stream records from ``stream`` into columns, then build the engine"""
+    names = []
+    index = {}
+    kinds = bytearray()
+    instances = array('l')
+    available = array('l')
+    xs = array('d')
+    ys = array('d')
+    sources = array('l')
+    targets = array('l')
+    counts = array('l')
+    claims = []
+    unset = []  # Nodes whose available count follows from their allocations
+    counters = None
+    for line_number, record in iter_records(stream):
+        where = f"Line {line_number}"
+        try:
+            if 'node' in record:
+                name = record['node']
+                if not isinstance(name, str) or not name:
+                    raise RAGFormatError(f"{where}: node name must be a non-empty string")
+                if name in index:
+                    raise RAGFormatError(f"{where}: duplicate node {name!r}")
+                node_type = record['type']
+                if not isinstance(node_type, str) or node_type not in _KIND_CODES:
+                    raise RAGFormatError(f"{where}: unknown node type {node_type!r}")
+                index[name] = len(names)
+                names.append(name)
+                kinds.append(_KIND_CODES[node_type])
+                instances.append(_integer(record, 'instances', 1, where))
+                if 'available' in record:
+                    available.append(_integer(record, 'available', None, where))
+                else:
+                    available.append(0)
+                    unset.append(len(names) - 1)
+                xs.append(_number(record, 'x', where))
+                ys.append(_number(record, 'y', where))
+            elif 'edge' in record:
+                from_node, to_node = _pair(record, 'edge', where)
+                sources.append(index[from_node])
+                targets.append(index[to_node])
+                counts.append(_integer(record, 'instances', 1, where))
+            elif 'claim' in record:
+                process, resource = _pair(record, 'claim', where)
+                claims.append((process, resource, _integer(record, 'maximum', None, where)))
+            elif 'format' in record:
+                counters = tuple(None if record.get(key) is None
+                                 else _integer(record, key, None, "Header")
+                                 for key in ('process_count', 'resource_count'))
+        except KeyError as error:
+            raise RAGFormatError(f"{where}: unknown {error}") from None
+        except OverflowError:
+            raise RAGFormatError(f"{where}: number out of range") from None
+    if counters is None:
+        raise RAGFormatError("Missing header")
+    return _build(names, kinds, instances, available, xs, ys,
+                  sources, targets, counts, counters, claims, unset)
+
+
+def save_binary(path, engine, counters):
+    snapshot = engine.snapshot()
+    claims = [(engine.index[p], engine.index[r], m) for p, r, m in snapshot['claims']
+              if p in engine and r in engine]
+    claim_processes, claim_resources, claim_maximums = zip(*claims) if claims else ((), (), ())
+    with open(path, 'wb') as stream:
+        np.savez_compressed(
+            stream,
+            version=np.int64(FORMAT_VERSION),
+            counters=np.asarray(counters, dtype=np.int64),
+            names=np.asarray(engine.names, dtype=str),
+            kinds=np.frombuffer(snapshot['kinds'], dtype=np.uint8),
+            instances=np.asarray(engine.instances, dtype=np.int64),
+            available=np.asarray(engine.available, dtype=np.int64),
+            xs=np.asarray(engine.xs, dtype=np.float64),
+            ys=np.asarray(engine.ys, dtype=np.float64),
+            sources=np.frombuffer(snapshot['sources'], dtype=engine.instances.typecode),
+            targets=np.frombuffer(snapshot['targets'], dtype=engine.instances.typecode),
+            counts=np.frombuffer(snapshot['counts'], dtype=engine.instances.typecode),
+            claim_processes=np.asarray(claim_processes, dtype=np.int64),
+            claim_resources=np.asarray(claim_resources, dtype=np.int64),
+            claim_maximums=np.asarray(claim_maximums, dtype=np.int64))
+
+
+def load_binary(path):
+    try:
+        data = np.load(path, allow_pickle=False)
+    except (OSError, ValueError, EOFError, zipfile.BadZipFile) as error:
+        raise RAGFormatError(f"Cannot read {path}: {error}") from None
+    if not isinstance(data, np.lib.npyio.NpzFile):
+        raise RAGFormatError(f"Cannot read {path}: not a compressed scenario")
+    with data:
+        missing = [key for key in _BINARY_COLUMNS if key not in data]
+        if missing:
+            raise RAGFormatError(f"Missing column {missing[0]!r}")
+        try:
+            columns = {key: data[key] for key in _BINARY_COLUMNS}
+            claim_columns = [data[key] if key in data else np.zeros(0, dtype=np.int64)
+                             for key in _CLAIM_COLUMNS]
+        except (OSError, ValueError, EOFError, zipfile.BadZipFile, zlib.error) as error:
+            raise RAGFormatError(f"Cannot read {path}: {error}") from None
+    for key, column in columns.items():
+        _check_column(key, column, 0 if key == 'version' else 1)
+    for key, column in zip(_CLAIM_COLUMNS, claim_columns):
+        _check_column(key, column, 1)
+    if int(columns['version']) > FORMAT_VERSION:
+        raise RAGFormatError(
+            f"File version {int(columns['version'])} is newer than supported")
+    if len(columns['counters']) != 2:
+        raise RAGFormatError("Column 'counters' must hold two counts")
+    counters = tuple(int(c) for c in columns['counters'])
+    names = columns['names'].tolist()
+    claim_columns = [column.tolist() for column in claim_columns]
+    if len({len(column) for column in claim_columns}) > 1:
+        raise RAGFormatError("Claim columns differ in length")
+    if not all(0 <= i < len(names) for i in claim_columns[0] + claim_columns[1]):
+        raise RAGFormatError("Claim refers to a missing node")
+    claims = [(names[p], names[r], m) for p, r, m in zip(*claim_columns)]
+    kinds = columns['kinds']
+    if kinds.size and (kinds.min() < 0 or kinds.max() > 1):
+        raise RAGFormatError("Column 'kinds' holds an unknown node type")
+    return _build(names, kinds.astype(np.uint8).tobytes(),
+                  columns['instances'].tolist(), columns['available'].tolist(),
+                  columns['xs'].tolist(), columns['ys'].tolist(),
+                  columns['sources'].tolist(), columns['targets'].tolist(),
+                  columns['counts'].tolist(), counters, claims)
+
+
+def _check_column(key, column, ndim):
+    """Check the shape and element type of a binary column"""
+    if key == 'names':
+        kinds = 'U'
+    elif key in ('xs', 'ys'):
+        kinds = 'iuf'
+    else:
+        kinds = 'iu'
+    if column.ndim != ndim or column.dtype.kind not in kinds:
+        raise RAGFormatError(f"Column {key!r} has the wrong shape or type")
+
+def _build(names, kinds, instances, available, xs, ys, sources, targets, counts,
+           counters, claims=(), unset=()):
+    available = _check_columns(names, kinds, instances, available, xs, ys,
+                               sources, targets, counts, unset)
+    for count in counters:
+        if count is not None and count < 0:
+            raise RAGFormatError("Node name counters must not be negative")
+    engine = RAGEngine()
+    engine.load_arrays(names, kinds, instances, available.tolist(), xs, ys,
+                       sources, targets, counts)
+    for process, resource, maximum in claims:
+        if (process not in engine or resource not in engine
+                or engine.node_type(process) != PROCESS
+                or engine.node_type(resource) != RESOURCE):
+            raise RAGFormatError(
+                f"Claim {process} -> {resource} must be from a process to a resource")
+        if maximum < 0:
+            raise RAGFormatError(f"Claim {process} -> {resource} must not be negative")
+        engine.set_claim(process, resource, maximum)
+    if None in counters:
+        counters = default_counters(engine)
+    return engine, counters
+
+
+def _check_columns(names, kinds, instances, available, xs, ys, sources, targets, counts,
+                   unset=()):
+    """Range-check node and edge columns before they reach the engine.
+
+    Available counts must be the instances the edges leave free; those of
+    the nodes in ``unset`` are filled in. Returns the available counts.
+    """
+    n = len(names)
+    if any(len(column) != n for column in (kinds, instances, available, xs, ys)):
+        raise RAGFormatError("Node columns differ in length")
+    if not len(sources) == len(targets) == len(counts):
+        raise RAGFormatError("Edge columns differ in length")
+    if len(set(names)) != n or not all(names):
+        raise RAGFormatError("Node names must be unique and non-empty")
+    kinds = np.frombuffer(bytes(kinds), dtype=np.uint8)
+    instances = np.asarray(instances, dtype=np.int64)
+    available = np.array(available, dtype=np.int64)
+
+    def first(mask):
+        return names[int(np.flatnonzero(mask)[0])]
+
+    if (instances < 1).any():
+        raise RAGFormatError(f"Node {first(instances < 1)} must have at least one instance")
+    bad = ~np.isfinite(np.asarray(xs, dtype=np.float64)) | ~np.isfinite(
+        np.asarray(ys, dtype=np.float64))
+    if bad.any():
+        raise RAGFormatError(f"Node {first(bad)} has no finite position")
+
+    sources = np.asarray(sources, dtype=np.int64)
+    targets = np.asarray(targets, dtype=np.int64)
+    counts = np.asarray(counts, dtype=np.int64)
+    if ((sources < 0) | (sources >= n) | (targets < 0) | (targets >= n)).any():
+        raise RAGFormatError("Edge refers to a missing node")
+    if (counts < 1).any():
+        u = sources[counts < 1][0]
+        v = targets[counts < 1][0]
+        raise RAGFormatError(f"Edge {names[u]} -> {names[v]} must have at least one instance")
+    same = kinds[sources] == kinds[targets]
+    if same.any():
+        u = sources[same][0]
+        v = targets[same][0]
+        raise RAGFormatError(
+            f"Edge {names[u]} -> {names[v]} must connect a process and a resource")
+    allocations = kinds[sources] == 1
+    held = np.zeros(n, dtype=np.int64)
+    np.add.at(held, sources[allocations], counts[allocations])
+    if (held > instances).any():
+        raise RAGFormatError(
+            f"Resource {first(held > instances)} has more instances allocated than it has")
+    free = instances - held
+    available[np.asarray(unset, dtype=np.intp)] = free[np.asarray(unset, dtype=np.intp)]
+    if (available != free).any():
+        i = int(np.flatnonzero(available != free)[0])
+        raise RAGFormatError(
+            f"Node {names[i]} has {available[i]} instances available, but its "
+            f"allocations leave {free[i]} free")
+    return available
@@ -0,0 +1,460 @@
+"""Deadlock recovery planning.
+
+``plan_recovery`` picks victim processes whose removal resolves every
+deadlock of a graph, keeping their total cost low. Every process costs 1
+unless ``costs`` says otherwise. Victims are either terminated (their edges
+and node are removed) or preempted: everything they hold is taken back and
+requested again, as if they were rolled back to their start.
+
+Each victim breaks the cycles through it, so a plan is a feedback vertex
+set of the process wait graph, where ``p -> q`` when ``p`` waits for a
+resource that ``q`` holds. Any such set resolves the deadlock in both
+detection modes, because freeing the victims' resources only ends other
+waits. The cheapest set is NP-hard to find; a greedy heuristic runs in
+O(E log V) on the deadlocked part of the graph, and components of up to
+``exact_limit`` processes can be solved exactly on top of it.
+
+    python recovery.py scenario.rag --cost P3=5 --cost P7=0.5
+    python recovery.py scenario.rag --action preempt --exact --output fixed.rag
+"""
+import argparse
+import heapq
+import json
+import sys
+
+import rag_io
+from deadlock_engine import DETECTION_MODES, CYCLE_MODE, PROCESS
+from history import apply_ops
+
+TERMINATE = 'terminate'
+PREEMPT = 'preempt'
+RECOVERY_ACTIONS = (TERMINATE, PREEMPT)
+
+# Largest component solved exactly when exact search is asked for without
+# a limit; the search is exponential in the component size
+EXACT_LIMIT = 12
+
+
+class RecoveryPlan:
+    """Victims that resolve the deadlocks of a graph and the history
+    operations that carry out the plan"""
+
+    __slots__ = ('action', 'victims', 'cost', 'exact', 'ops')
+
+    def __init__(self, action, victims=(), cost=0.0, exact=True, ops=()):
+        self.action = action
+        self.victims = list(victims)
+        self.cost = cost
+        # Whether the plan is known to be the cheapest possible
+        self.exact = exact
+        self.ops = list(ops)
+
+    def __bool__(self):
+        return bool(self.victims)
+
+    def summary(self):
+        """JSON-friendly description of the plan"""
+        return {
+            'action': self.action,
+            'victims': self.victims,
+            'cost': self.cost,
+            'exact': self.exact,
+        }
+
+    def message(self):
+        if not self.victims:
+            return "No deadlock to recover from."
+        if self.action == TERMINATE:
+            verb = "Terminate"
+        else:
+            verb = "Preempt everything held by"
+        quality = "optimal" if self.exact else "heuristic"
+        return (f"{verb} {', '.join(self.victims)}\n"
+                f"Total cost {self.cost:g} ({quality}).")
+
+
+def parse_costs(text):
+    """Parse ``"P1=5, P3=0.5"`` into ``{'P1': 5.0, 'P3': 0.5}``"""
+    costs = {}
+    for item in text.replace(',', ' ').split():
+        name, sep, value = item.partition('=')
+        if not sep or not name:
+            raise ValueError(f"Expected NAME=COST, got {item!r}")
+        try:
+            cost = float(value)
+        except ValueError:
+            raise ValueError(f"Invalid cost {value!r} for {name!r}") from None
+        if cost < 0:
+            raise ValueError(f"Cost of {name!r} must not be negative")
+        costs[name] = cost
+    return costs
+
+
+def plan_recovery(engine, costs=None, action=TERMINATE, exact_limit=None,
+                  result=None, mode=CYCLE_MODE, default_cost=1.0):
+    """Plan a cheap recovery from every deadlock of ``engine``.
+
+    ``costs`` maps process names to the cost of making them victims,
+    ``default_cost`` applies to the rest. ``result`` is a detection result
+    for the current state of ``engine``; without one the graph is checked
+    in ``mode`` first. ``exact_limit`` enables exact search for deadlocked
+    components of at most that many processes.
+    """
+    if action not in RECOVERY_ACTIONS:
+        raise ValueError(f"Unknown recovery action {action!r}")
+    if result is None:
+        result = engine.detect(mode)
+    costs = costs or {}
+    names = engine.names
+    kinds = engine.kinds
+
+    weights = {}
+
+    # Reduction also reports processes that request more than their
+    # resources could ever free. No cycle needs to run through them, but
+    # they stay blocked until they are victims themselves.
+    forced = set()
+    for name in result.processes or ():
+        p = engine.index[name]
+        weights[p] = costs.get(name, default_cost)
+        if any(n + engine.succ[r].get(p, 0) > engine.instances[r]
+               for r, n in engine.succ[p].items()):
+            forced.add(p)
+
+    # Process wait graph of the deadlocked components: p -> q through every
+    # resource of the component that p waits for and q holds
+    succ = {}
+    groups = []
+    for component in result.components:
+        graph = result.component_graph(component)
+        processes = [u for u in component if kinds[u] == 0 and u not in forced]
+        for p in processes:
+            succ[p] = {q for r in graph[p] for q in graph[r]} - forced
+            weights[p] = costs.get(names[p], default_cost)
+        groups.append(processes)
+
+    victims = greedy_feedback_set(succ, weights)
+    exact = not victims
+    if exact_limit:
+        exact = True
+        for processes in groups:
+            if len(processes) > exact_limit:
+                exact = False
+                continue
+            # Components share no cycles, so each can be solved on its own
+            greedy = victims.intersection(processes)
+            best = exact_feedback_set({p: succ[p] for p in processes}, weights)
+            if sum(weights[p] for p in best) < sum(weights[p] for p in greedy):
+                victims.difference_update(greedy)
+                victims.update(best)
+    victims |= forced
+
+    victim_names = sorted(names[p] for p in victims)
+    return RecoveryPlan(action, victim_names, sum(weights[p] for p in victims),
+                        exact, recovery_ops(engine, victim_names, action))
+
+
+def recovery_ops(engine, victims, action=TERMINATE):
+    """History operations that terminate or preempt the named ``victims``"""
+    names = engine.names
+    ops = []
+    for name in victims:
+        i = engine.index[name]
+        held = [(names[r], n) for r, n in engine.pred[i].items()]
+        for resource, n in held:
+            ops.append(('remove_edge', resource, name, n))
+        if action == PREEMPT:
+            # Rolled back: everything taken away is requested again
+            for resource, n in held:
+                ops.append(('add_edge', name, resource, n))
+            continue
+        for r, n in engine.succ[i].items():
+            ops.append(('remove_edge', name, names[r], n))
+        for resource, maximum in engine.claims.get(name, {}).items():
+            ops.append(('set_claim', name, resource, maximum, 0))
+        x, y = engine.position(name)
+        ops.append(('remove_node', name, PROCESS, engine.instances[i], x, y))
+    return ops
+
+
+def greedy_feedback_set(succ, weights):
+    """Low-weight feedback vertex set of the directed graph ``succ``
+    (``{vertex: set_of_successors}``).
+
+    Vertices left without predecessors or successors cannot be on a cycle
+    and are pruned as they appear; self-loops are always taken. Otherwise
+    the vertex with the lowest weight per in-degree times out-degree is
+    taken next. A final pass drops every chosen vertex, most expensive
+    first, that no longer lies on a cycle.
+    """
+    out_edges = {u: set(vs) for u, vs in succ.items()}
+    in_edges = {u: set() for u in succ}
+    for u, vs in succ.items():
+        for v in vs:
+            in_edges[v].add(u)
+    chosen = set()
+    heap = []
+    changed = list(succ)
+
+    def remove(u):
+        for v in out_edges.pop(u):
+            if v != u:
+                in_edges[v].discard(u)
+                changed.append(v)
+        for v in in_edges.pop(u):
+            if v != u:
+                out_edges[v].discard(u)
+                changed.append(v)
+
+    def score(u):
+        return weights[u] / (len(in_edges[u]) * len(out_edges[u]))
+
+    while True:
+        while changed:
+            u = changed.pop()
+            if u not in out_edges:
+                continue
+            if u in out_edges[u]:
+                chosen.add(u)
+                remove(u)
+            elif not out_edges[u] or not in_edges[u]:
+                remove(u)
+            else:
+                heapq.heappush(heap, (score(u), u))
+        # Degrees only shrink, so an entry is current iff its score is
+        while heap:
+            key, u = heapq.heappop(heap)
+            if u in out_edges and key == score(u):
+                break
+        else:
+            break
+        chosen.add(u)
+        remove(u)
+
+    return _drop_redundant(succ, weights, chosen)
+
+
+def _drop_redundant(succ, weights, chosen):
+    """Give back chosen vertices, most expensive first, that no longer lie
+    on a cycle.
+
+    The graph without the chosen vertices is acyclic. Chosen vertices start
+    out in its topological order without edges, placed after their
+    predecessors; giving one back inserts its edges one by one while the
+    order is kept up to date (Pearce-Kelly), so each insertion only searches
+    the part of the graph between the edge's ends. An edge that closes a
+    cycle takes the vertex's edges out again.
+    """
+    pred = {u: set() for u in succ}
+    for u, vs in succ.items():
+        for v in vs:
+            pred[v].add(u)
+    active_succ = {u: set() if u in chosen else {v for v in vs if v not in chosen}
+                   for u, vs in succ.items()}
+    active_pred = {u: set() if u in chosen else {v for v in vs if v not in chosen}
+                   for u, vs in pred.items()}
+
+    indegree = {u: len(vs) for u, vs in active_pred.items() if u not in chosen}
+    ready = [u for u, degree in indegree.items() if not degree]
+    rank = {}
+    while ready:
+        u = ready.pop()
+        rank[u] = len(rank)
+        for v in active_succ[u]:
+            indegree[v] -= 1
+            if not indegree[v]:
+                ready.append(v)
+    key = {u: rank[u] for u in rank}
+    for u in chosen:
+        key[u] = max((rank[v] for v in pred[u] if v in rank), default=-1) + 0.5
+    position = {u: i for i, u in enumerate(sorted(key, key=key.get))}
+
+    for u in sorted(chosen, key=lambda u: (-weights[u], u)):
+        if u in succ[u]:
+            continue
+        added = []
+        edges = [(v, u) for v in pred[u] if v not in chosen]
+        edges += [(u, w) for w in succ[u] if w not in chosen]
+        for x, y in edges:
+            if not _insert_edge(x, y, active_succ, active_pred, position):
+                for x, y in added:
+                    active_succ[x].discard(y)
+                    active_pred[y].discard(x)
+                break
+            added.append((x, y))
+        else:
+            chosen.discard(u)
+    return chosen
+
+
+def _insert_edge(x, y, succ, pred, position):
+    """Add edge ``x -> y`` to the ordered acyclic graph unless it closes a
+    cycle; returns whether it was added"""
+    lower = position[y]
+    upper = position[x]
+    if upper < lower:
+        succ[x].add(y)
+        pred[y].add(x)
+        return True
+    # The edge violates the order: reorder what lies in between
+    forward = [y]
+    seen = {y}
+    stack = [y]
+    while stack:
+        for v in succ[stack.pop()]:
+            if v == x:
+                return False
+            if v not in seen and position[v] < upper:
+                seen.add(v)
+                forward.append(v)
+                stack.append(v)
+    backward = [x]
+    seen = {x}
+    stack = [x]
+    while stack:
+        for v in pred[stack.pop()]:
+            if v not in seen and position[v] > lower:
+                seen.add(v)
+                backward.append(v)
+                stack.append(v)
+    backward.sort(key=position.get)
+    forward.sort(key=position.get)
+    pool = sorted(position[v] for v in backward + forward)
+    for v, slot in zip(backward + forward, pool):
+        position[v] = slot
+    succ[x].add(y)
+    pred[y].add(x)
+    return True
+
+
+def exact_feedback_set(succ, weights):
+    """Minimum-weight feedback vertex set of a small graph ``succ``.
+
+    Every feedback set contains a vertex of each cycle, so the search
+    branches on the vertices of a shortest cycle and memoizes the best
+    answer per remaining vertex set. Exponential in the graph size.
+    """
+    vertices = list(succ)
+    bit = {u: i for i, u in enumerate(vertices)}
+    out_mask = [0] * len(vertices)
+    in_mask = [0] * len(vertices)
+    for u, vs in succ.items():
+        for v in vs:
+            if v in bit:
+                out_mask[bit[u]] |= 1 << bit[v]
+                in_mask[bit[v]] |= 1 << bit[u]
+    cost = [weights[u] for u in vertices]
+    memo = {}
+
+    def solve(alive):
+        # Drop vertices that cannot be on a cycle any more
+        pruned = True
+        while pruned:
+            pruned = False
+            rest = alive
+            while rest:
+                low = rest & -rest
+                rest ^= low
+                i = low.bit_length() - 1
+                if not out_mask[i] & alive or not in_mask[i] & alive:
+                    alive ^= low
+                    pruned = True
+        if not alive:
+            return 0.0, 0
+        if alive not in memo:
+            best = (float('inf'), 0)
+            for i in _shortest_cycle(alive, out_mask, in_mask):
+                total, chosen = solve(alive & ~(1 << i))
+                if total + cost[i] < best[0]:
+                    best = (total + cost[i], chosen | 1 << i)
+            memo[alive] = best
+        return memo[alive]
+
+    _, chosen = solve((1 << len(vertices)) - 1)
+    return {u for u in vertices if chosen >> bit[u] & 1}
+
+
+def _shortest_cycle(alive, out_mask, in_mask):
+    """Vertex bits of a shortest cycle among the ``alive`` vertices"""
+    members = [i for i in range(alive.bit_length()) if alive >> i & 1]
+    for i in members:
+        if out_mask[i] >> i & 1:
+            return [i]
+    for i in members:
+        both = out_mask[i] & in_mask[i] & alive
+        if both:
+            return [i, (both & -both).bit_length() - 1]
+    best = None
+    for start in members:
+        # Breadth-first search back to ``start``
+        parent = {start: None}
+        frontier = [start]
+        found = None
+        distance = 0
+        while frontier and found is None:
+            if best is not None and distance + 1 >= len(best):
+                break  # Cannot beat the shortest cycle so far
+            following = []
+            for u in frontier:
+                targets = out_mask[u] & alive
+                if targets >> start & 1:
+                    found = u
+                    break
+                while targets:
+                    low = targets & -targets
+                    targets ^= low
+                    v = low.bit_length() - 1
+                    if v not in parent:
+                        parent[v] = u
+                        following.append(v)
+            frontier = following
+            distance += 1
+        if found is not None:
+            cycle = []
+            while found is not None:
+                cycle.append(found)
+                found = parent[found]
+            if best is None or len(cycle) < len(best):
+                best = cycle
+    return best
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Plan which processes to terminate or preempt to end every deadlock.")
+    parser.add_argument('scenario', help="scenario file (.rag or .ragz)")
+    parser.add_argument('--mode', choices=DETECTION_MODES, default=CYCLE_MODE)
+    parser.add_argument('--action', choices=RECOVERY_ACTIONS, default=TERMINATE)
+    parser.add_argument('--cost', action='append', default=[], metavar='PROCESS=COST',
+                        help="victim cost of a process (default 1), repeatable")
+    parser.add_argument('--exact', type=int, nargs='?', const=EXACT_LIMIT, default=None,
+                        metavar='N', help="solve components of up to N processes exactly "
+                                          f"(default N: {EXACT_LIMIT})")
+    parser.add_argument('--output', '-o', help="save the recovered scenario here")
+    args = parser.parse_args(argv)
+
+    try:
+        engine, counters = rag_io.load(args.scenario)
+    except (OSError, rag_io.RAGFormatError) as error:
+        parser.error(f"cannot open {args.scenario}: {error}")
+    try:
+        costs = parse_costs(' '.join(args.cost))
+    except ValueError as error:
+        parser.error(str(error))
+
+    plan = plan_recovery(engine, costs, args.action, args.exact, mode=args.mode)
+    apply_ops(engine, plan.ops)
+    record = plan.summary()
+    record['resolved'] = not engine.detect(args.mode)
+    print(json.dumps(record))
+    if args.output:
+        try:
+            rag_io.save(args.output, engine, counters)
+        except OSError as error:
+            print(f"cannot save {args.output}: {error}", file=sys.stderr)
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,485 @@
+"""Discrete-event simulation of processes acquiring and releasing resources.
+
+A workload gives each process a script of steps, run over simulated time:
+
+- ``('request', resource, instances)`` blocks until the instances are free
+- ``('hold', duration)`` keeps everything held for ``duration`` time units
+- ``('release', resource)`` releases all held instances of ``resource``;
+  ``('release', resource, instances)`` releases some of them
+
+A process releases whatever it still holds when its script ends. The
+simulation drives a ``RAGEngine`` directly: granted requests become
+allocation edges and blocked ones request edges, so the engine's
+incremental wait-for graph flags a possible deadlock as soon as it forms
+and only then is full detection run. Runs are headless; with
+``record=True`` the edge changes are kept as a trace of history
+operations that the GUI can replay.
+
+Estimate how often a scenario deadlocks under random load:
+
+    python simulation.py scenario.rag --runs 1000 --jobs 8
+    python simulation.py --random 20 10 --runs 500 --mode cycle
+"""
+import argparse
+import heapq
+import json
+import random
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import rag_io
+from deadlock_engine import RAGEngine, DETECTION_MODES, REDUCTION_MODE
+from rag_generator import random_rag
+
+# Compiled step codes
+_REQUEST = 0
+_HOLD = 1
+_RELEASE = 2
+_STEP_CODES = {'request': _REQUEST, 'hold': _HOLD, 'release': _RELEASE}
+
+# Queue entry owner for periodic detection instead of a process index
+_DETECT = -1
+
+
+def random_workload(engine, seed=None, phases=3, max_claims=2, max_request=1,
+                    mean_hold=1.0, start_spread=1.0):
+    """Random acquire/hold/release scripts for every process in ``engine``.
+
+    Each process starts after a uniform delay of up to ``start_spread``,
+    then runs ``phases`` phases. In a phase it requests up to ``max_claims``
+    distinct random resources one at a time (up to ``max_request`` instances
+    each), holding what it has for an exponential time with mean
+    ``mean_hold`` after every grant, and finally releases them all.
+    """
+    rng = random.Random(seed)
+    resources = [(name, engine.instances[i]) for i, name in enumerate(engine.names)
+                 if not engine.is_process(i)]
+    workload = {}
+    for i, name in enumerate(engine.names):
+        if not engine.is_process(i):
+            continue
+        steps = [('hold', rng.uniform(0.0, start_spread))]
+        for _ in range(phases):
+            claims = rng.sample(resources, min(len(resources), rng.randint(1, max_claims)))
+            for resource, instances in claims:
+                steps.append(('request', resource, rng.randint(1, min(max_request, instances))))
+                steps.append(('hold', rng.expovariate(1.0 / mean_hold)))
+            for resource, _ in claims:
+                steps.append(('release', resource))
+        workload[name] = steps
+    return workload
+
+
+def load_workload(path):
+    """Read a scripted workload: a JSON object of process name -> step lists"""
+    with open(path, encoding='utf-8') as stream:
+        workload = json.load(stream)
+    return {name: [tuple(step) for step in steps] for name, steps in workload.items()}
+
+
+class SimulationResult:
+    """Outcome of one simulation run"""
+
+    __slots__ = ('time', 'events', 'elapsed', 'finished', 'blocked',
+                 'deadlock', 'deadlock_time', 'deadlock_event', 'trace')
+
+    def __init__(self):
+        self.time = 0.0  # Simulated time reached
+        self.events = 0  # Steps executed, including grants
+        self.elapsed = 0.0  # Wall-clock seconds
+        self.finished = 0  # Processes that ran to the end of their script
+        self.blocked = 0  # Processes waiting on a request when the run ended
+        self.deadlock = None  # DeadlockResult of the first deadlock found
+        self.deadlock_time = None
+        self.deadlock_event = None
+        self.trace = None  # [(time, op)] when recorded
+
+    def __bool__(self):
+        return self.deadlock is not None
+
+    @property
+    def events_per_second(self):
+        return self.events / self.elapsed if self.elapsed else 0.0
+
+    def summary(self, limit_per_component=5):
+        """JSON-friendly description of the run"""
+        record = {
+            'deadlock': bool(self),
+            'time': self.time,
+            'events': self.events,
+            'elapsed': self.elapsed,
+            'finished': self.finished,
+            'blocked': self.blocked,
+        }
+        if self.deadlock is not None:
+            record['deadlock_time'] = self.deadlock_time
+            record['deadlock_event'] = self.deadlock_event
+            record.update(self.deadlock.summary(limit_per_component))
+        return record
+
+
+class Simulation:
+    """Run a workload against ``engine``, which is modified in place.
+
+    Existing allocation edges are held from the start; existing request
+    edges block their process until granted. Requests are granted first-fit
+    as instances come free, so a request edge only remains while its
+    resource really is short, as the wait-for graph assumes.
+
+    Detection runs after every request that blocks (the only step that can
+    create a deadlock) or, with ``detect_interval``, every that many time
+    units. Either way the engine's incremental ``has_cycle`` is consulted
+    first and ``detect(mode)`` only runs while a wait-for cycle exists.
+    """
+
+    def __init__(self, engine, workload, mode=REDUCTION_MODE, detect_interval=None,
+                 stop_on_deadlock=True, record=False):
+        self.engine = engine
+        self.mode = mode
+        self.detect_interval = detect_interval
+        self.stop_on_deadlock = stop_on_deadlock
+        self.time = 0.0
+        self.events = 0
+        self.trace = [] if record else None
+        self.result = SimulationResult()
+        self.result.trace = self.trace
+        self.stopped = False
+
+        n = len(engine)
+        self.scripts = [()] * n
+        for name, steps in workload.items():
+            self.scripts[engine.index[name]] = self._compile(name, steps)
+        self.positions = [0] * n  # Next step of every process
+        self.blocked = [0] * n  # Outstanding requests per process
+        self.waiters = {}  # resource -> processes blocked on it, oldest first
+        self.queue = []
+        self.sequence = 0  # Tie-breaker keeping equal-time events in order
+
+        for p in range(n):
+            if not engine.is_process(p):
+                continue
+            for r in engine.succ[p]:
+                self.blocked[p] += 1
+                self.waiters.setdefault(r, []).append(p)
+            if not self.blocked[p]:
+                self._schedule(0.0, p)
+        for r in list(self.waiters):
+            self._wake(r)
+        if any(self.blocked):
+            self._check(start=True)  # The graph may be deadlocked from the start
+        if detect_interval is not None:
+            self._schedule(detect_interval, _DETECT)
+
+    def _compile(self, name, steps):
+        """Turn named steps into ``(code, resource index, amount)`` tuples"""
+        engine = self.engine
+        compiled = []
+        for step in steps:
+            code = _STEP_CODES.get(step[0])
+            if code is None:
+                raise ValueError(f"{name}: unknown step {step[0]!r}")
+            if code == _HOLD:
+                compiled.append((_HOLD, -1, float(step[1])))
+                continue
+            r = engine.index.get(step[1])
+            if r is None or engine.is_process(r):
+                raise ValueError(f"{name}: {step[1]!r} is not a resource")
+            amount = step[2] if len(step) > 2 else None
+            if code == _REQUEST:
+                amount = 1 if amount is None else amount
+                if not 0 < amount <= engine.instances[r]:
+                    raise ValueError(f"{name}: cannot request {amount} of {step[1]}")
+            compiled.append((code, r, amount))
+        return tuple(compiled)
+
+    def _schedule(self, at, p):
+        self.sequence += 1
+        heapq.heappush(self.queue, (at, self.sequence, p))
+
+    def _change(self, u, v, delta):
+        """Change edge ``u -> v`` by ``delta`` instances and record it"""
+        names = self.engine.names
+        if delta > 0:
+            op = ('add_edge', names[u], names[v], delta)
+            self.engine.add_edge(*op[1:])
+        else:
+            op = ('remove_edge', names[u], names[v], -delta)
+            self.engine.remove_edge(*op[1:])
+        if self.trace is not None:
+            self.trace.append((self.time, op))
+
+    def run(self, until=float('inf'), max_events=None):
+        """Advance until time ``until``, ``max_events`` steps, a deadlock
+        (with ``stop_on_deadlock``) or until nothing is left to do.
+
+        May be called again to continue. Returns the ``SimulationResult``.
+        """
+        start = time.perf_counter()
+        queue = self.queue
+        limit = float('inf') if max_events is None else max_events
+        while queue and not self.stopped and self.events < limit:
+            at, _, p = queue[0]
+            if at > until:
+                break
+            heapq.heappop(queue)
+            self.time = at
+            if p == _DETECT:
+                self._check()
+                if queue:
+                    self._schedule(at + self.detect_interval, _DETECT)
+            else:
+                self._advance(p)
+        if not queue and self.result.deadlock is None and any(self.blocked):
+            # Nothing can ever run again, so whoever is blocked is stuck
+            self._check()
+        result = self.result
+        result.time = self.time
+        result.events = self.events
+        result.elapsed += time.perf_counter() - start
+        result.blocked = sum(1 for count in self.blocked if count)
+        return result
+
+    def _advance(self, p):
+        """Run process ``p`` until it holds, blocks or finishes"""
+        engine = self.engine
+        available = engine.available
+        script = self.scripts[p]
+        position = self.positions[p]
+        while position < len(script):
+            code, r, amount = script[position]
+            position += 1
+            self.events += 1
+            if code == _REQUEST:
+                if available[r] >= amount:
+                    self._change(r, p, amount)
+                    continue
+                self._change(p, r, amount)
+                self.waiters.setdefault(r, []).append(p)
+                self.blocked[p] = 1
+                self.positions[p] = position
+                if self.detect_interval is None and engine.has_cycle:
+                    self._check(p)
+                return
+            if code == _HOLD:
+                self.positions[p] = position
+                self._schedule(self.time + amount, p)
+                return
+            held = engine.pred[p].get(r, 0)
+            if amount is not None:
+                held = min(held, amount)
+            if held:
+                self._change(r, p, -held)
+                self._wake(r)
+        self.positions[p] = position
+
+        # End of script: release everything still held
+        for r, held in list(engine.pred[p].items()):
+            self._change(r, p, -held)
+            self._wake(r)
+        self.result.finished += 1
+
+    def _wake(self, r):
+        """Grant waiting requests for ``r`` that now fit, oldest first"""
+        waiters = self.waiters.get(r)
+        if not waiters:
+            return
+        available = self.engine.available
+        succ = self.engine.succ
+        still_waiting = []
+        for p in waiters:
+            amount = succ[p][r]
+            if available[r] < amount:
+                still_waiting.append(p)
+                continue
+            self.events += 1
+            self._change(p, r, -amount)
+            self._change(r, p, amount)
+            self.blocked[p] -= 1
+            if not self.blocked[p]:
+                self._schedule(self.time, p)
+        if still_waiting:
+            self.waiters[r] = still_waiting
+        else:
+            del self.waiters[r]
+
+    def _waits_on_itself(self, target):
+        """Whether ``target`` waits, through a chain of blocked holders, on
+        a resource it holds itself.
+
+        A process that just blocked in a deadlock free state can only be
+        deadlocked if it lies on such a cycle. Only blocked processes have
+        outgoing requests, so the search never leaves them.
+        """
+        succ = self.engine.succ
+        blocked = self.blocked
+        seen = {target}
+        stack = [target]
+        while stack:
+            p = stack.pop()
+            for r in succ[p]:
+                for q in succ[r]:
+                    if q == target:
+                        return True
+                    if blocked[q] and q not in seen:
+                        seen.add(q)
+                        stack.append(q)
+        return False
+
+    def _reducible(self, target=None):
+        """Whether every blocked process could still finish.
+
+        Graph reduction limited to the blocked processes: everyone else
+        will release what they hold, so only the allocations of blocked
+        processes are missing from the free instances. Much cheaper than a
+        full ``detect`` while a wait-for cycle exists but is not a deadlock.
+
+        ``target`` is a process that just blocked in a state known to be
+        deadlock free. Any new deadlock must then include it, so the
+        reduction can stop as soon as ``target`` is reduced.
+        """
+        engine = self.engine
+        pred = engine.pred
+        succ = engine.succ
+        pending = {p for waiters in self.waiters.values() for p in waiters if pred[p]}
+        if target in pending:
+            pending.discard(target)
+            pending = [target, *pending]  # Often reducible straight away
+        else:
+            pending = list(pending)
+        work = {}
+        for p in pending:
+            for r, held in pred[p].items():
+                work[r] = work.get(r, engine.instances[r]) - held
+        progress = True
+        while pending and progress:
+            progress = False
+            waiting = []
+            for p in pending:
+                if all(work.get(r, engine.instances[r]) >= n for r, n in succ[p].items()):
+                    if p == target:
+                        return True
+                    for r, held in pred[p].items():
+                        work[r] += held
+                    progress = True
+                else:
+                    waiting.append(p)
+            pending = waiting
+        return not pending
+
+    def _check(self, target=None, start=False):
+        """Confirm a possible deadlock with full detection.
+
+        ``start`` skips the wait-for cycle shortcut: an existing request for
+        more instances than a resource has is a deadlock without a cycle.
+        """
+        if not start and self.queue and not self.engine.has_cycle:
+            return
+        if self.result.deadlock is not None:
+            target = None  # The state is no longer known to be deadlock free
+        if target is not None and not self._waits_on_itself(target):
+            return
+        if self.mode == REDUCTION_MODE and self._reducible(target):
+            return
+        deadlock = self.engine.detect(self.mode)
+        if not deadlock:
+            return
+        result = self.result
+        if result.deadlock is None:
+            result.deadlock = deadlock
+            result.deadlock_time = self.time
+            result.deadlock_event = self.events
+        if self.stop_on_deadlock:
+            self.stopped = True
+
+
+def _trial(snapshot, seed, workload_options, options, until, max_events):
+    engine = RAGEngine.from_snapshot(snapshot)
+    workload = random_workload(engine, seed=seed, **workload_options)
+    result = Simulation(engine, workload, **options).run(until, max_events)
+    record = result.summary()
+    record['seed'] = seed
+    return record
+
+
+def run_trials(engine, runs, seed=0, jobs=1, workload_options=None,
+               until=float('inf'), max_events=None, **options):
+    """Simulate ``runs`` random workloads on copies of ``engine``.
+
+    Run ``i`` uses workload seed ``seed + i``. Yields one summary per run,
+    in order; ``jobs`` > 1 spreads the runs over worker processes.
+    """
+    snapshot = engine.snapshot()
+    workload_options = workload_options or {}
+    arguments = [(snapshot, seed + i, workload_options, options, until, max_events)
+                 for i in range(runs)]
+    if jobs == 1:
+        for args in arguments:
+            yield _trial(*args)
+        return
+    with ProcessPoolExecutor(max_workers=jobs) as pool:
+        yield from pool.map(_trial, *zip(*arguments), chunksize=max(1, runs // (4 * jobs)))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Estimate how often random workloads deadlock a scenario.")
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument('scenario', nargs='?', help="scenario file (.rag or .ragz)")
+    source.add_argument('--random', type=int, nargs=2, metavar=('PROCESSES', 'RESOURCES'),
+                        help="use a generated graph with no edges instead")
+    parser.add_argument('--workload', help="scripted workload (JSON) to run once")
+    parser.add_argument('--runs', type=int, default=100)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--jobs', '-j', type=int, default=1)
+    parser.add_argument('--mode', choices=DETECTION_MODES, default=REDUCTION_MODE)
+    parser.add_argument('--interval', type=float, default=None,
+                        help="detect every this many time units (default: every step)")
+    parser.add_argument('--phases', type=int, default=3)
+    parser.add_argument('--max-claims', type=int, default=2)
+    parser.add_argument('--max-request', type=int, default=1)
+    parser.add_argument('--until', type=float, default=float('inf'))
+    parser.add_argument('--max-events', type=int, default=None)
+    parser.add_argument('--output', '-o', help="write JSON lines here instead of stdout")
+    args = parser.parse_args(argv)
+
+    if args.scenario:
+        try:
+            engine, _ = rag_io.load(args.scenario)
+        except (OSError, rag_io.RAGFormatError) as error:
+            parser.error(f"cannot open {args.scenario}: {error}")
+    else:
+        engine = random_rag(*args.random, edge_density=0.0, seed=args.seed)
+    options = {'mode': args.mode, 'detect_interval': args.interval}
+
+    output = open(args.output, 'w', encoding='utf-8') if args.output else sys.stdout
+    runs = deadlocked = events = 0
+    elapsed = 0.0
+    try:
+        if args.workload:
+            result = Simulation(engine, load_workload(args.workload), **options).run(
+                args.until, args.max_events)
+            records = [result.summary()]
+        else:
+            records = run_trials(
+                engine, args.runs, args.seed, args.jobs,
+                {'phases': args.phases, 'max_claims': args.max_claims,
+                 'max_request': args.max_request},
+                args.until, args.max_events, **options)
+        for record in records:
+            output.write(json.dumps(record) + '\n')
+            runs += 1
+            deadlocked += record['deadlock']
+            events += record['events']
+            elapsed += record['elapsed']
+    finally:
+        if output is not sys.stdout:
+            output.close()
+    rate = events / elapsed if elapsed else 0.0
+    print(f"{runs} runs, {deadlocked} deadlocked (p={deadlocked / max(runs, 1):.3f}), "
+          f"{rate:,.0f} events/s", file=sys.stderr)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,126 @@
+"""Brute-force oracles and random graph edits shared by the tests"""
+import random
+
+from deadlock_engine import RAGEngine, PROCESS, RESOURCE
+
+
+def wait_for_edges(engine):
+    """Wait-for edges straight from the definition, as name pairs"""
+    edges = set()
+    for u, targets in enumerate(engine.succ):
+        for v, n in targets.items():
+            if engine.kinds[u] == 1:
+                edges.add((engine.names[u], engine.names[v]))
+            elif engine.pred[u] and engine.available[v] < n:
+                edges.add((engine.names[u], engine.names[v]))
+    return edges
+
+
+def nodes_on_cycles(edges):
+    """Nodes that can reach themselves again"""
+    succ = {}
+    for u, v in edges:
+        succ.setdefault(u, set()).add(v)
+    on_cycle = set()
+    for start in succ:
+        seen = set()
+        stack = list(succ[start])
+        while stack:
+            u = stack.pop()
+            if u == start:
+                on_cycle.add(start)
+                break
+            if u not in seen:
+                seen.add(u)
+                stack.extend(succ.get(u, ()))
+    return on_cycle
+
+
+def reduction_deadlocked(engine):
+    """Processes left after reducing one runnable process at a time"""
+    work = {name: engine.available[i] for i, name in enumerate(engine.names)
+            if engine.kinds[i] == 1}
+    held = {}
+    wanted = {}
+    for u, v, edge_type, n in engine.iter_edges():
+        if edge_type == 'request':
+            wanted.setdefault(u, {})[v] = n
+        else:
+            held.setdefault(v, {})[u] = n
+    left = {name for i, name in enumerate(engine.names)
+            if engine.kinds[i] == 0 and held.get(name)}
+    progress = True
+    while progress:
+        progress = False
+        for p in sorted(left):
+            if all(work[r] >= n for r, n in wanted.get(p, {}).items()):
+                for r, n in held.get(p, {}).items():
+                    work[r] += n
+                left.discard(p)
+                progress = True
+    return left
+
+
+def check_wait_for(engine):
+    """Assert the incremental wait-for state matches a recompute"""
+    expected = wait_for_edges(engine)
+    adjacency = engine.wait_for_graph()
+    actual = {(engine.names[u], engine.names[v])
+              for u, targets in enumerate(adjacency) for v in targets}
+    assert actual == expected
+    assert engine.has_cycle == bool(nodes_on_cycles(expected))
+    for u, targets in enumerate(engine.dag_succ):
+        for v in targets:
+            assert engine.order[u] < engine.order[v]
+    available = {}
+    for i, name in enumerate(engine.names):
+        if engine.kinds[i] == 1:
+            held = sum(engine.succ[i].values())
+            assert engine.available[i] == engine.instances[i] - held
+        available[name] = engine.available[i]
+    return available
+
+
+def random_engine(rng, processes=6, resources=5, max_instances=3, edges=12):
+    """Small random graph built through the public API"""
+    engine = RAGEngine()
+    for p in range(processes):
+        engine.add_node(f"P{p + 1}", PROCESS)
+    for r in range(resources):
+        engine.add_node(f"R{r + 1}", RESOURCE, rng.randint(1, max_instances))
+    for _ in range(edges):
+        random_edit(engine, rng, removals=False)
+    return engine
+
+
+def random_edit(engine, rng, removals=True):
+    """One random edge addition or removal that keeps the graph valid"""
+    processes = [n for i, n in enumerate(engine.names) if engine.kinds[i] == 0]
+    resources = [n for i, n in enumerate(engine.names) if engine.kinds[i] == 1]
+    if not processes or not resources:
+        return None
+    p = rng.choice(processes)
+    r = rng.choice(resources)
+    choice = rng.random()
+    if removals and choice < 0.35:
+        u, v = (p, r) if rng.random() < 0.5 else (r, p)
+        n = engine.edge_instances(u, v)
+        if n:
+            k = rng.randint(1, n)
+            engine.remove_edge(u, v, k)
+            return ('remove_edge', u, v, k)
+        return None
+    if choice < 0.7:
+        k = rng.randint(1, 2)
+        engine.add_edge(p, r, k)
+        return ('add_edge', p, r, k)
+    free = engine.available[engine.index[r]]
+    if free:
+        k = rng.randint(1, free)
+        engine.add_edge(r, p, k)
+        return ('add_edge', r, p, k)
+    return None
+
+
+def seeds(count):
+    return [random.Random(seed) for seed in range(count)]
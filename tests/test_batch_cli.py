@@ -0,0 +1,89 @@
+import io
+import json
+
+import pytest
+
+import batch_cli
+import rag_io
+from helpers import nodes_on_cycles, random_engine, reduction_deadlocked, seeds, wait_for_edges
+
+MALFORMED = {
+    'truncated.rag': '{"format": "rag", "version": 1}\n{"node": "P1", ',
+    'bad-type.rag': '{"format": "rag", "version": 1}\n{"node": "P1", "type": 3}\n',
+    'array.rag': '[1, 2, 3]\n',
+    'latin1.rag': b'{"format": "rag"}\n{"node": "\xe9"}\n',
+    'garbage.ragz': b'PK\x03\x04 not really a zip file',
+}
+
+
+@pytest.fixture
+def scenarios(tmp_path):
+    """Valid scenarios with their engines, next to malformed files"""
+    engines = {}
+    for number, rng in enumerate(seeds(12)):
+        path = str(tmp_path / f"valid{number}{'.ragz' if number % 3 == 0 else '.rag'}")
+        engines[path] = random_engine(rng)
+        rag_io.save(path, engines[path])
+    for name, content in MALFORMED.items():
+        path = tmp_path / name
+        if isinstance(content, bytes):
+            path.write_bytes(content)
+        else:
+            path.write_text(content)
+    return tmp_path, engines
+
+
+def run(sources, mode, jobs):
+    output = io.StringIO()
+    counts = batch_cli.run(batch_cli.iter_scenarios(sources), output, mode, jobs=jobs)
+    records = [json.loads(line) for line in output.getvalue().splitlines()]
+    return counts, {record['path']: record for record in records}
+
+
+@pytest.mark.parametrize('jobs', [1, 2])
+@pytest.mark.parametrize('mode', ['cycle', 'reduction'])
+def test_malformed_files_are_reported_next_to_valid_ones(scenarios, mode, jobs):
+    directory, engines = scenarios
+    missing = str(directory / 'missing.rag')
+    counts, records = run([str(directory), missing], mode, jobs)
+    broken = {str(directory / name) for name in MALFORMED} | {missing}
+    assert set(records) == set(engines) | broken
+    for path in broken:
+        assert records[path]['error']
+    for path, engine in engines.items():
+        record = records[path]
+        assert 'error' not in record
+        expected = (bool(nodes_on_cycles(wait_for_edges(engine))) if mode == 'cycle'
+                    else bool(reduction_deadlocked(engine)))
+        assert record['deadlock'] == expected
+    deadlocked = sum(record.get('deadlock', False) for record in records.values()
+                     if 'error' not in record)
+    assert counts == (len(records), deadlocked, len(broken))
+
+
+@pytest.mark.parametrize('error', [TypeError, IndexError, AttributeError, KeyError])
+def test_analysis_never_raises(monkeypatch, error):
+    def load(path):
+        raise error("unexpected")
+    monkeypatch.setattr(rag_io, 'load', load)
+    record = batch_cli.analyze_file('scenario.rag')
+    assert record['error'].startswith(error.__name__)
+
+
+@pytest.mark.parametrize('version', [(3, 10), (3, 11)])
+def test_worker_recycling_only_where_supported(scenarios, monkeypatch, version):
+    directory, engines = scenarios
+    options = []
+
+    class Pool(batch_cli.ProcessPoolExecutor):
+        def __init__(self, **kwargs):
+            options.append(set(kwargs))
+            if 'max_tasks_per_child' in kwargs and batch_cli.sys.version_info < (3, 11):
+                raise TypeError("unexpected keyword argument 'max_tasks_per_child'")
+            super().__init__(**kwargs)
+
+    monkeypatch.setattr(batch_cli, 'ProcessPoolExecutor', Pool)
+    monkeypatch.setattr(batch_cli.sys, 'version_info', version)
+    counts, records = run(list(engines), 'cycle', 2)
+    assert counts[0] == len(engines) and counts[2] == 0
+    assert ('max_tasks_per_child' in options[0]) == (version >= (3, 11))
@@ -0,0 +1,69 @@
+import pytest
+
+from deadlock_engine import RAGEngine, PROCESS, RESOURCE
+from helpers import check_wait_for, random_edit, random_engine, seeds
+
+
+def edges(engine):
+    return sorted(engine.iter_edges())
+
+
+def test_allocations_deduct_available_instances():
+    engine = RAGEngine()
+    engine.add_node('P1', PROCESS)
+    engine.add_node('R1', RESOURCE, instances=3)
+    engine.add_edge('R1', 'P1', 2)
+    assert engine.available[engine.index['R1']] == 1
+    engine.remove_edge('R1', 'P1', 1)
+    assert engine.available[engine.index['R1']] == 2
+    assert engine.edge_instances('R1', 'P1') == 1
+    engine.remove_edge('R1', 'P1')
+    assert engine.edge_count == 0
+    assert engine.available[engine.index['R1']] == 3
+
+
+def test_rejects_invalid_edits():
+    engine = RAGEngine()
+    engine.add_node('P1', PROCESS)
+    engine.add_node('P2', PROCESS)
+    engine.add_node('R1', RESOURCE, instances=2)
+    with pytest.raises(ValueError):
+        engine.add_node('P1', PROCESS)
+    with pytest.raises(ValueError):
+        engine.add_edge('P1', 'P2')
+    engine.add_edge('R1', 'P1', 2)
+    with pytest.raises(ValueError):
+        engine.set_instances('R1', 1)
+    with pytest.raises(ValueError):
+        engine.remove_node('P1')
+
+
+def test_remove_node_keeps_arrays_dense():
+    for rng in seeds(20):
+        engine = random_engine(rng)
+        isolated = 'P99'
+        engine.add_node(isolated, PROCESS, x=5.0, y=6.0)
+        engine.add_node('P100', PROCESS, x=7.0, y=8.0)
+        before = edges(engine)
+        engine.remove_node(isolated)
+        assert isolated not in engine
+        assert edges(engine) == before
+        assert engine.position('P100') == (7.0, 8.0)
+        assert all(engine.index[name] == i for i, name in enumerate(engine.names))
+        check_wait_for(engine)
+
+
+def test_copy_and_snapshot_are_independent():
+    for rng in seeds(20):
+        engine = random_engine(rng)
+        engine.set_claim('P1', 'R1', 1)
+        copy = engine.copy()
+        restored = RAGEngine.from_snapshot(engine.snapshot())
+        for other in (copy, restored):
+            assert edges(other) == edges(engine)
+            assert list(other.available) == list(engine.available)
+            assert other.claims == engine.claims
+            check_wait_for(other)
+        for _ in range(10):
+            random_edit(copy, rng)
+        assert edges(RAGEngine.from_snapshot(engine.snapshot())) == edges(restored)
@@ -0,0 +1,85 @@
+from deadlock_engine import (RAGEngine, CYCLE_MODE, REDUCTION_MODE, PROCESS, RESOURCE,
+                             strongly_connected_components)
+from helpers import (nodes_on_cycles, random_engine, reduction_deadlocked, seeds,
+                     wait_for_edges)
+from rag_generator import adversarial_rag
+
+
+def test_cycle_mode_finds_exactly_the_nodes_on_wait_for_cycles():
+    for rng in seeds(200):
+        engine = random_engine(rng, edges=rng.randint(4, 20))
+        result = engine.detect(CYCLE_MODE)
+        assert result.nodes == nodes_on_cycles(wait_for_edges(engine))
+        assert bool(result) == engine.has_cycle
+
+
+def test_reported_cycles_are_real_and_bounded():
+    for rng in seeds(100):
+        engine = random_engine(rng, edges=20)
+        result = engine.detect(CYCLE_MODE)
+        waits = wait_for_edges(engine)
+        cycles = list(result.iter_cycles(limit_per_component=3))
+        assert len(cycles) <= 3 * len(result.components)
+        for cycle in cycles:
+            assert len(set(cycle)) == len(cycle)
+            for u, v in zip(cycle, cycle[1:] + cycle[:1]):
+                assert (u, v) in waits
+
+
+def test_exponentially_many_cycles_are_reported_briefly():
+    engine = adversarial_rag(200, seed=1)
+    result = engine.detect(CYCLE_MODE)
+    assert len(result.components) == 1
+    assert len(list(result.iter_cycles(5))) == 5
+    assert "Deadlock detected!" in result.message(5)
+
+
+def _chain(length, closed):
+    engine = RAGEngine()
+    for i in range(length):
+        engine.add_node(f"P{i}", PROCESS)
+        engine.add_node(f"R{i}", RESOURCE)
+    last = length if closed else length - 1
+    engine.add_edges([(f"R{i}", f"P{i}", 1) for i in range(length)]
+                     + [(f"P{i}", f"R{(i + 1) % length}", 1) for i in range(last)])
+    return engine
+
+
+def test_long_chain_does_not_recurse():
+    assert len(_chain(20000, closed=True).detect(CYCLE_MODE).nodes) == 40000
+    assert not _chain(20000, closed=False).detect(CYCLE_MODE)
+
+
+def test_strongly_connected_components_partition_the_nodes():
+    adjacency = [[1], [2], [0, 3], [4], [3], []]
+    components = sorted(sorted(c) for c in strongly_connected_components(adjacency))
+    assert components == [[0, 1, 2], [3, 4], [5]]
+
+
+def test_reduction_mode_matches_one_at_a_time_reduction():
+    for rng in seeds(300):
+        engine = random_engine(rng, processes=rng.randint(1, 8), resources=rng.randint(1, 6),
+                               edges=rng.randint(0, 25))
+        result = engine.detect(REDUCTION_MODE)
+        expected = reduction_deadlocked(engine)
+        assert set(result.processes) == expected
+        assert bool(result) == bool(expected)
+        # Single-instance graphs deadlock exactly when they have a cycle, and
+        # every process on a cycle is deadlocked
+        if all(engine.instances[i] == 1 for i in range(len(engine)) if engine.kinds[i]):
+            on_cycles = {n for n in engine.detect(CYCLE_MODE).nodes
+                         if engine.node_type(n) == PROCESS}
+            assert on_cycles <= expected
+            assert bool(on_cycles) == bool(expected)
+
+
+def test_edge_lists_hold_one_entry_per_edge():
+    for rng in seeds(20):
+        engine = random_engine(rng)
+        processes, resources, requests, allocations = engine.edge_lists()
+        assert len(requests[0]) + len(allocations[0]) == engine.edge_count
+        for rows, cols, counts in (requests, allocations):
+            for row, col, n in zip(rows, cols, counts):
+                p = engine.names[processes[row]]
+                r = engine.names[resources[col]]
+                assert n == engine.edge_instances(p, r) or n == engine.edge_instances(r, p)
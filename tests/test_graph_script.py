@@ -0,0 +1,136 @@
+import pytest
+
+import graph_script
+from deadlock_engine import RAGEngine, PROCESS, RESOURCE
+from graph_elements import GraphManager
+from graph_script import ScriptError
+from helpers import check_wait_for, random_engine, seeds
+
+
+def state(engine):
+    return (sorted(engine.names), sorted(engine.iter_edges()),
+            sorted((name, engine.instances[i], engine.available[i])
+                   for i, name in enumerate(engine.names)))
+
+
+def test_parse_collects_nodes_edges_and_syntax_errors():
+    script = graph_script.parse(
+        "# comment\n"
+        "process P1 P2\n"
+        "resources R1=2 R2   # trailing comment\n"
+        "R1 -> P1 x2\n"
+        "P2->R1\n"
+        "process\n"
+        "process P3=2\n"
+        "resource R3=0 R4=many\n"
+        "P1 -> R2 x0\n"
+        "P1 => R2\n")
+    assert script.nodes == [('P1', PROCESS, 1, 2), ('P2', PROCESS, 1, 2),
+                            ('R1', RESOURCE, 2, 3), ('R2', RESOURCE, 1, 3)]
+    assert script.edges == [('R1', 'P1', 2, 4), ('P2', 'R1', 1, 5)]
+    assert [line for line, _ in script.errors] == [6, 7, 8, 8, 9, 10]
+
+
+def random_script(engine, rng, lines=25):
+    """Script lines over existing and new names, some of them invalid"""
+    known = list(engine.names)
+    text = []
+    for k in range(rng.randint(0, 3)):
+        name = f"Q{k}" if rng.random() < 0.9 else rng.choice(known or ['Q0'])
+        text.append(f"process {name}")
+        known.append(name)
+    for k in range(rng.randint(0, 3)):
+        name = f"S{k}"
+        text.append(f"resource {name}={rng.randint(1, 3)}")
+        known.append(name)
+    for _ in range(lines):
+        u = rng.choice(known + ['ghost'])
+        v = rng.choice(known)
+        text.append(f"{u} -> {v} x{rng.randint(1, 2)}")
+    return "\n".join(text)
+
+
+def oracle_build(engine, text):
+    """Apply a script item by item; None if any item is invalid"""
+    engine = engine.copy()
+    script = graph_script.parse(text)
+    if script.errors:
+        return None
+    try:
+        for name, node_type, instances, _ in script.nodes:
+            engine.add_node(name, node_type, instances)
+        for u, v, n, _ in script.edges:
+            if engine.node_type(u) == RESOURCE and engine.available[engine.index[u]] < n:
+                return None
+            engine.add_edge(u, v, n)
+    except (KeyError, ValueError):
+        return None
+    return engine
+
+
+def test_build_matches_item_by_item_application():
+    built = 0
+    for rng in seeds(300):
+        engine = random_engine(rng)
+        text = random_script(engine, rng, lines=rng.randint(0, 6))
+        expected = oracle_build(engine, text)
+        before = state(engine)
+        if expected is None:
+            with pytest.raises(ScriptError):
+                graph_script.build(engine, text)
+            assert state(engine) == before
+            continue
+        graph_script.build(engine, text)
+        assert state(engine) == state(expected)
+        check_wait_for(engine)
+        built += 1
+    assert built > 50
+
+
+def test_errors_are_reported_together_in_script_order():
+    engine = RAGEngine()
+    engine.add_node('P1', PROCESS)
+    with pytest.raises(ScriptError) as caught:
+        graph_script.build(engine, "resource R1\nR1 -> P1 x2\nP1 -> P2\nprocess P1\nP1 -> P1")
+    assert [line for line, _ in caught.value.errors] == [3, 4, 5, None]
+    assert "Line 3: Unknown node 'P2'" in str(caught.value)
+
+
+def chain_script(count):
+    lines = [f"process {' '.join(f'P{i}' for i in range(count))}",
+             f"resource {' '.join(f'R{i}' for i in range(count))}"]
+    lines += [f"R{i} -> P{i}" for i in range(count)]
+    lines += [f"P{i} -> R{(i + 1) % count}" for i in range(count)]
+    return "\n".join(lines)
+
+
+def test_undo_and_redo_of_a_build_replay_in_bulk(monkeypatch):
+    manager = GraphManager()
+    manager.build(chain_script(300))
+    built = state(manager.engine)
+    assert manager.engine.has_cycle
+    calls = []
+    add_edges = RAGEngine.add_edges
+    monkeypatch.setattr(RAGEngine, 'add_edges',
+                        lambda engine, edges: calls.append(len(edges)) or add_edges(engine, edges))
+    manager.undo()
+    assert len(manager.engine) == 0
+    manager.redo()
+    assert calls == [600]
+    assert state(manager.engine) == built
+    check_wait_for(manager.engine)
+    assert manager.engine.has_cycle
+
+
+def test_unsafe_build_is_rejected_whole():
+    manager = GraphManager()
+    manager.build("process P1 P2\nresource R1=2")
+    manager.avoidance = True
+    manager.engine.set_claim('P1', 'R1', 2)
+    manager.engine.set_claim('P2', 'R1', 2)
+    before = state(manager.engine)
+    with pytest.raises(ScriptError):
+        manager.build("R1 -> P1\nR1 -> P2")
+    assert state(manager.engine) == before
+    manager.build("R1 -> P1 x2")
+    assert manager.engine.edge_instances('R1', 'P1') == 2
@@ -0,0 +1,242 @@
+"""Scene-side behaviour, on Qt's offscreen platform"""
+import pytest
+
+pytest.importorskip('PyQt6.QtWidgets')
+
+from PyQt6.QtWidgets import QApplication
+
+import main_controller
+from deadlock_engine import RAGEngine, PROCESS, RESOURCE
+
+
+@pytest.fixture(scope='module')
+def app():
+    return QApplication.instance() or QApplication([])
+
+
+@pytest.fixture
+def window(app):
+    window = main_controller.RAGSimulator()
+    window.resize(800, 600)
+    window.show()
+    app.processEvents()
+    yield window
+    window.close()
+
+
+def small_engine():
+    engine = RAGEngine()
+    engine.add_node('P1', PROCESS, x=100, y=100)
+    engine.add_node('P2', PROCESS, x=300, y=100)
+    engine.add_node('R1', RESOURCE, 2, x=100, y=300)
+    engine.add_edge('R1', 'P1', 1)
+    engine.add_edge('P2', 'R1', 1)
+    return engine
+
+
+def render(app, window):
+    app.processEvents()
+    return window.view.viewport().grab().toImage()
+
+
+def test_switching_detail_level_redraws_cached_nodes(app, window, monkeypatch):
+    window.show_engine(small_engine(), (2, 1))
+    full = render(app, window)
+    monkeypatch.setattr(main_controller, 'LOD_NODE_THRESHOLD', 0)
+    window.refresh_render_mode()
+    low = render(app, window)
+    assert low != full
+    # Forcing every item to repaint must not change what is shown
+    for item in window.scene.items():
+        item.update()
+    assert render(app, window) == low
+    monkeypatch.setattr(main_controller, 'LOD_NODE_THRESHOLD', 500)
+    window.refresh_render_mode()
+    assert render(app, window) == full
+
+
+def test_dragging_several_selected_nodes_is_one_undoable_action(app, window):
+    from PyQt6.QtCore import Qt, QPoint
+    from PyQt6.QtTest import QTest
+
+    window.show_engine(small_engine(), (2, 1))
+    nodes = window.graph_manager.nodes
+    start = {name: (node.pos().x(), node.pos().y()) for name, node in nodes.items()}
+    nodes['P1'].setSelected(True)
+    nodes['P2'].setSelected(True)
+    viewport = window.view.viewport()
+    grab = window.view.mapFromScene(nodes['P1'].sceneBoundingRect().center())
+    QTest.mousePress(viewport, Qt.MouseButton.LeftButton,
+                     Qt.KeyboardModifier.ControlModifier, grab)
+    for step in range(1, 6):
+        QTest.mouseMove(viewport, grab + QPoint(10 * step, 5 * step))
+    QTest.mouseRelease(viewport, Qt.MouseButton.LeftButton,
+                       Qt.KeyboardModifier.ControlModifier, grab + QPoint(50, 25))
+    moved = {name for name, node in nodes.items()
+             if (node.pos().x(), node.pos().y()) != start[name]}
+    assert moved == {'P1', 'P2'}
+    assert len(window.graph_manager.history) == 2  # The load, then the drag
+    window.undo_last_action()
+    assert {name: (node.pos().x(), node.pos().y()) for name, node in nodes.items()} == start
+    assert {name: window.graph_manager.engine.position(name) for name in nodes} == start
+
+
+def test_malformed_scenario_shows_an_error(app, window, tmp_path, monkeypatch):
+    warnings = []
+    monkeypatch.setattr(main_controller.QMessageBox, 'warning',
+                        lambda *args: warnings.append(args[2]))
+    path = tmp_path / 'bad.rag'
+    path.write_text('{"format": "rag", "version": 1}\n'
+                    '{"node": "P1", "type": "process", "instances": "many"}\n')
+    assert window.load_scenario(str(path)) is False
+    assert len(warnings) == 1 and "instances" in warnings[0]
+
+
+def start_layout_animation(window, offset=(200, 50)):
+    engine = window.graph_manager.engine
+    window.layout_moves = []
+    for name in engine.names:
+        x, y = engine.position(name)
+        window.layout_moves.append((name, (x, y), (x + offset[0], y + offset[1])))
+    window.layout_frame = 0
+    window.layout_step()
+    return {name: target for name, _, target in window.layout_moves}
+
+
+def test_layout_animation_skips_nodes_removed_meanwhile(app, window):
+    import recovery
+    from history import touched_nodes
+
+    window.show_engine(small_engine(), (2, 1))
+    gm = window.graph_manager
+    targets = start_layout_animation(window)
+    ops = recovery.recovery_ops(gm.engine, ['P1'])
+    gm.apply(ops)
+    window.sync_scene(touched_nodes(ops))
+    while window.layout_moves is not None:
+        window.layout_step()
+    assert 'P1' not in gm.nodes
+    assert {name: gm.engine.position(name) for name in gm.engine.names} == {
+        name: targets[name] for name in ('P2', 'R1')}
+
+
+def test_edits_finish_a_running_layout_animation(app, window):
+    window.show_engine(small_engine(), (2, 1))
+    gm = window.graph_manager
+    before = {name: gm.engine.position(name) for name in gm.engine.names}
+    targets = start_layout_animation(window)
+    window.add_process()
+    assert window.layout_moves is None
+    assert all(gm.engine.position(name) == targets[name] for name in targets)
+    window.undo_last_action()  # The new process
+    assert 'P3' not in gm.engine
+    assert all(gm.engine.position(name) == targets[name] for name in targets)
+    window.undo_last_action()  # The layout
+    assert {name: gm.engine.position(name) for name in gm.engine.names} == before
+
+
+def wait_until(app, condition, timeout=5.0):
+    import time
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "timed out waiting for the GUI"
+        app.processEvents()
+        time.sleep(0.002)
+
+
+@pytest.fixture
+def gated_detection(monkeypatch):
+    """Detection workers that start detecting only once ``gate`` is set;
+    returns ``(gate, workers, messages)``"""
+    import threading
+    gate = threading.Event()
+    workers = []
+    messages = []
+
+    class GatedWorker(main_controller.DetectionWorker):
+        def __init__(self, *args, **kwargs):
+            super().__init__(*args, **kwargs)
+            workers.append(self)
+
+        def run(self):
+            gate.wait(5)
+            super().run()
+
+    monkeypatch.setattr(main_controller, 'DetectionWorker', GatedWorker)
+    for kind in ('warning', 'information'):
+        monkeypatch.setattr(main_controller.QMessageBox, kind,
+                            lambda parent, title, text, kind=kind: messages.append((kind, text)))
+    return gate, workers, messages
+
+
+def deadlocked_engine():
+    engine = RAGEngine()
+    engine.add_node('P1', PROCESS, x=100, y=100)
+    engine.add_node('P2', PROCESS, x=300, y=100)
+    engine.add_node('R1', RESOURCE, x=100, y=300)
+    engine.add_node('R2', RESOURCE, x=300, y=300)
+    engine.add_edges([('R1', 'P1', 1), ('R2', 'P2', 1), ('P1', 'R2', 1), ('P2', 'R1', 1)])
+    return engine
+
+
+def test_stale_detection_result_is_discarded_and_rerun(app, window, gated_detection):
+    gate, workers, messages = gated_detection
+    window.show_engine(deadlocked_engine(), (2, 2))
+    window.check_deadlock()
+    window.graph_manager.remove_edge('R2', 'P2')  # Ends the deadlock mid-run
+    window.graph_manager.save_state()
+    window.sync_scene({'R2', 'P2'})
+    assert window.graph_manager.revision != workers[0].revision
+    gate.set()
+    wait_until(app, lambda: messages)
+    assert len(workers) == 2 and workers[1].revision == window.graph_manager.revision
+    assert messages == [('information', messages[0][1])]  # The fresh result: no deadlock
+    assert not window.graph_manager.deadlock_nodes
+    assert window.detection_worker is None
+
+
+def test_cancelled_detection_reports_nothing(app, window, gated_detection):
+    gate, workers, messages = gated_detection
+    window.show_engine(deadlocked_engine(), (2, 2))
+    window.graph_manager.detection_mode = 'reduction'
+    cancelled = []
+    window.check_deadlock()
+    workers[0].cancelled.connect(cancelled.append)
+    window.detection_progress.canceled.emit()  # The user presses Cancel
+    assert workers[0].cancel_event.is_set()
+    gate.set()
+    wait_until(app, lambda: window.detection_worker is None)
+    assert cancelled == [workers[0].revision]
+    assert messages == [] and not window.graph_manager.deadlock_nodes
+
+
+def test_detection_timeout_is_reported(app, window, gated_detection):
+    gate, workers, messages = gated_detection
+    window.show_engine(deadlocked_engine(), (2, 2))
+    window.graph_manager.detection_mode = 'reduction'
+    window.detection_timeout_ms = 10
+    window.check_deadlock()
+    wait_until(app, lambda: workers[0].cancel_event.is_set())
+    assert window.detection_timed_out
+    gate.set()
+    wait_until(app, lambda: messages)
+    assert messages[0][0] == 'warning' and "timed out after 0.01 s" in messages[0][1]
+    assert window.detection_worker is None and not window.graph_manager.deadlock_nodes
+
+
+def test_adding_a_node_ends_a_running_replay_first(app, window):
+    window.show_engine(small_engine(), (2, 1))
+    gm = window.graph_manager
+    before = set(gm.engine.iter_edges())
+    window.toggle_simulation()
+    window.replay_timer.stop()  # Step by hand
+    while not window.replay_position:
+        window.replay_step()
+    assert window.replay_result is not None
+    replayed = set(gm.engine.iter_edges())
+    window.add_process()
+    assert window.replay_result is None
+    window.undo_last_action()  # The new process only
+    assert 'P3' not in gm.engine and set(gm.engine.iter_edges()) == replayed
+    window.undo_last_action()  # The replayed part of the run
+    assert set(gm.engine.iter_edges()) == before
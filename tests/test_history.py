@@ -0,0 +1,115 @@
+from deadlock_engine import PROCESS
+from helpers import check_wait_for, random_edit, random_engine, seeds
+from history import History, HistoryEntry, apply_ops, diff_ops, invert, touched_nodes
+
+
+def state(engine):
+    return (sorted(engine.iter_edges()),
+            sorted((name, engine.node_type(name), engine.instances[i], engine.available[i],
+                    engine.xs[i], engine.ys[i]) for i, name in enumerate(engine.names)),
+            sorted(engine.iter_claims()))
+
+
+def random_ops(engine, rng, count=30):
+    """Apply random edits, node changes, moves and claims; return the ops"""
+    ops = []
+    for step in range(count):
+        choice = rng.random()
+        if choice < 0.1:
+            name = next(f"N{n}" for n in range(len(engine.names) + 1) if f"N{n}" not in engine.index)
+            op = ('add_node', name, PROCESS, 1, rng.random(), rng.random())
+        elif choice < 0.2:
+            name = rng.choice(engine.names)
+            op = ('move_node', name) + engine.position(name) + (rng.random(), rng.random())
+        elif choice < 0.3:
+            op = ('set_claim', 'P1', 'R1', engine.claim('P1', 'R1'), rng.randint(0, 3))
+        else:
+            op = random_edit(engine, rng)
+            if op is not None:
+                ops.append(op)
+            continue
+        apply_ops(engine, [op])
+        ops.append(op)
+    return ops
+
+
+def test_inverse_operations_restore_the_state():
+    for rng in seeds(100):
+        engine = random_engine(rng)
+        before = state(engine)
+        ops = random_ops(engine, rng)
+        apply_ops(engine, invert(ops))
+        assert state(engine) == before
+        check_wait_for(engine)
+        apply_ops(engine, ops)
+        apply_ops(engine, invert(ops))
+        assert state(engine) == before
+
+
+def test_diff_turns_one_engine_into_another():
+    for rng in seeds(100):
+        current = random_engine(rng)
+        target = current.copy()
+        random_ops(target, rng)
+        target.set_instances('R2', target.instances[target.index['R2']] + 1)
+        ops = diff_ops(current, target)
+        apply_ops(current, ops)
+        assert state(current) == state(target)
+        check_wait_for(current)
+        assert diff_ops(current, target) == []
+
+
+def test_touched_nodes_lists_every_endpoint():
+    ops = [('add_edge', 'P1', 'R1', 1), ('move_node', 'P2', 0, 0, 1, 1)]
+    assert touched_nodes(ops) == {'P1', 'R1', 'P2'}
+
+
+def test_history_is_bounded_and_new_actions_drop_redo():
+    history = History(max_entries=3)
+    entries = [HistoryEntry([('move_node', 'P1', i, 0, i + 1, 0)], (0, 0), (0, 0))
+               for i in range(5)]
+    for entry in entries:
+        history.record(entry)
+    assert len(history) == 3
+    assert history.undo() is entries[4]
+    assert history.undo() is entries[3]
+    assert history.redo() is entries[3]
+    history.record(entries[0])
+    assert history.redo() is None
+    assert [history.undo() for _ in range(4)] == [entries[0], entries[3], entries[2], None]
+
+
+def test_engine_round_trips_through_undo_and_redo():
+    for rng in seeds(30):
+        engine = random_engine(rng)
+        history = History()
+        states = [state(engine)]
+        for _ in range(8):
+            history.record(HistoryEntry(random_ops(engine, rng, 6), (0, 0), (0, 0)))
+            states.append(state(engine))
+        for expected in reversed(states[:-1]):
+            apply_ops(engine, invert(history.undo().ops))
+            assert state(engine) == expected
+        for expected in states[1:]:
+            apply_ops(engine, history.redo().ops)
+            assert state(engine) == expected
+        check_wait_for(engine)
+
+
+def test_history_memory_is_bounded():
+    moves = [HistoryEntry([('move_node', 'P1', i, 0, i + 1, 0)] * (i % 7 + 1), (0, 0), (0, 0))
+             for i in range(200)]
+    limit = sum(entry.nbytes for entry in moves[:10])
+    history = History(max_entries=None, max_bytes=limit)
+    for entry in moves:
+        history.record(entry)
+        assert history.nbytes == sum(kept.nbytes for kept in history.entries) <= limit
+    assert list(history.entries) == moves[-len(history.entries):]
+    assert history.undo() is moves[-1]
+    assert history.nbytes == sum(kept.nbytes for kept in history.entries) + moves[-1].nbytes
+    history.record(moves[0])  # Drops the undone entry
+    assert history.nbytes == sum(kept.nbytes for kept in history.entries) <= limit
+    # An action larger than the cap on its own is not kept
+    history.record(HistoryEntry([('move_node', 'P1', 0, 0, 1, 1)] * 10000, (0, 0), (0, 0)))
+    assert len(history) == 0 and history.nbytes == 0
+    assert history.undo() is None
@@ -0,0 +1,62 @@
+from deadlock_engine import RAGEngine, PROCESS
+from helpers import check_wait_for, random_edit, random_engine, seeds
+
+
+def test_wait_for_graph_tracks_every_edit():
+    for rng in seeds(150):
+        engine = random_engine(rng, edges=5)
+        for _ in range(60):
+            random_edit(engine, rng)
+            check_wait_for(engine)
+
+
+def test_instance_changes_and_node_removal_keep_it_current():
+    for rng in seeds(60):
+        engine = random_engine(rng, edges=15)
+        for _ in range(20):
+            resource = f"R{rng.randint(1, 5)}"
+            r = engine.index[resource]
+            held = engine.instances[r] - engine.available[r]
+            engine.set_instances(resource, rng.randint(max(held, 1), held + 3))
+            check_wait_for(engine)
+            random_edit(engine, rng)
+        # Removing a node moves the last one into its slot
+        engine.add_node('P0', PROCESS)
+        engine.add_node('P9', PROCESS)
+        engine.add_edge('P9', 'R1')
+        engine.remove_node('P0')
+        check_wait_for(engine)
+
+
+def test_bulk_edges_match_incremental_edges():
+    for rng in seeds(60):
+        incremental = random_engine(rng, edges=0)
+        bulk = incremental.copy()
+        batch = []
+        for _ in range(25):
+            op = random_edit(incremental, rng, removals=False)
+            if op is not None:
+                batch.append(op[1:])
+        bulk.add_edges(batch)
+        assert sorted(bulk.iter_edges()) == sorted(incremental.iter_edges())
+        assert check_wait_for(bulk) == check_wait_for(incremental)
+        assert bulk.has_cycle == incremental.has_cycle
+
+
+def test_parked_edges_are_retried_after_deletions():
+    engine = RAGEngine()
+    for name in ('P1', 'P2'):
+        engine.add_node(name, PROCESS)
+    engine.add_node('R1', 'resource')
+    engine.add_node('R2', 'resource')
+    engine.add_edge('R1', 'P1')
+    engine.add_edge('R2', 'P2')
+    engine.add_edge('P1', 'R2')
+    engine.add_edge('P2', 'R1')
+    assert engine.has_cycle
+    engine.remove_edge('R1', 'P1')
+    check_wait_for(engine)
+    assert not engine.has_cycle
+    engine.add_edge('R1', 'P1')
+    check_wait_for(engine)
+    assert engine.has_cycle
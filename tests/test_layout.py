@@ -0,0 +1,106 @@
+import itertools
+import math
+
+import numpy as np
+import pytest
+
+import layout
+from deadlock_engine import RAGEngine, PROCESS, RESOURCE
+from helpers import random_engine, seeds
+
+
+def brute_crossings(upper, lower):
+    """Edges cross when their ends are in opposite orders on the two rows"""
+    return sum(1 for (u1, l1), (u2, l2) in itertools.combinations(zip(upper, lower), 2)
+               if (u1 - u2) * (l1 - l2) < 0)
+
+
+def test_count_crossings_matches_a_pairwise_count():
+    assert layout.count_crossings(np.array([]), np.array([])) == 0
+    assert layout.count_crossings(np.array([0.0]), np.array([3.0])) == 0
+    for rng in seeds(200):
+        size = rng.randint(2, 40)
+        # Few distinct positions, so shared endpoints are common
+        upper = np.array([rng.randint(0, 6) for _ in range(size)], dtype=np.float64)
+        lower = np.array([rng.randint(0, 6) for _ in range(size)], dtype=np.float64)
+        assert layout.count_crossings(upper, lower) == brute_crossings(upper, lower)
+        lower += np.array([rng.random() for _ in range(size)])
+        assert layout.count_crossings(upper, lower) == brute_crossings(upper, lower)
+
+
+def test_grid_pairs_finds_every_pair_within_range():
+    for rng in seeds(100):
+        count = rng.randint(1, 80)
+        spread = rng.choice([50.0, 400.0, 5000.0])
+        points = np.array([(rng.uniform(-spread, spread), rng.uniform(-spread, spread))
+                           for _ in range(count)])
+        if count > 2 and rng.random() < 0.3:
+            points[1] = points[0]  # Coincident points
+        cell = 200.0
+        first, second = layout._grid_pairs(points, cell)
+        pairs = [tuple(sorted(pair)) for pair in zip(first.tolist(), second.tolist())]
+        assert len(pairs) == len(set(pairs))
+        assert all(i != j for i, j in pairs)
+        found = set(pairs)
+        for i, j in itertools.combinations(range(count), 2):
+            distance = math.dist(points[i], points[j])
+            if distance < cell:
+                assert (i, j) in found
+            if (i, j) in found:
+                assert np.abs(points[i] - points[j]).max() < 2 * cell
+
+
+def single_node(node_type):
+    engine = RAGEngine()
+    engine.add_node('N1', node_type, x=30, y=40)
+    return engine
+
+
+@pytest.mark.parametrize('name', sorted(layout.LAYOUTS))
+def test_layouts_of_empty_and_single_node_graphs(name):
+    place = layout.LAYOUTS[name]
+    assert place(RAGEngine()) == {}
+    for node_type in (PROCESS, RESOURCE):
+        positions = place(single_node(node_type))
+        assert list(positions) == ['N1'] and all(map(math.isfinite, positions['N1']))
+
+
+def test_layered_layout_places_every_node_on_its_row():
+    for rng in seeds(30):
+        engine = random_engine(rng, processes=rng.randint(0, 20),
+                               resources=rng.randint(1, 20), edges=30)
+        positions = layout.layered_layout(engine, columns=rng.choice([None, 3]))
+        assert set(positions) == set(engine.names)
+        assert len(set(positions.values())) == len(engine)
+        for name, (_, y) in positions.items():
+            row = round((y - layout.SPACING) / layout.ROW_GAP)
+            assert row % 2 == (0 if engine.node_type(name) == PROCESS else 1)
+
+
+def test_layered_layout_does_not_add_crossings():
+    for rng in seeds(30):
+        engine = random_engine(rng, processes=12, resources=10, edges=30)
+        for i in range(len(engine)):
+            engine.xs[i] = rng.uniform(0, 1000)
+        edges = [(engine.index[u], engine.index[v]) if engine.node_type(u) == PROCESS
+                 else (engine.index[v], engine.index[u])
+                 for u, v, _, _ in engine.iter_edges()]
+
+        def crossings(xs):
+            return brute_crossings(*zip(*[(xs[p], xs[r]) for p, r in edges]))
+
+        before = crossings(engine.xs)
+        positions = layout.layered_layout(engine, columns=100)
+        after = crossings([positions[name][0] for name in engine.names])
+        assert after <= before
+
+
+def test_force_layout_spreads_stacked_nodes():
+    engine = random_engine(seeds(1)[0], processes=15, resources=10, edges=25)
+    positions = layout.force_layout(engine, iterations=60)
+    assert set(positions) == set(engine.names)
+    points = np.array(list(positions.values()))
+    assert np.isfinite(points).all() and (points >= 0).all()
+    closest = min(math.dist(a, b) for a, b in itertools.combinations(points, 2))
+    assert closest > layout.SPACING / 10
+    assert positions == layout.force_layout(engine, iterations=60)  # Seeded
@@ -0,0 +1,131 @@
+import pytest
+
+import lock_trace
+from helpers import check_wait_for, nodes_on_cycles, seeds, wait_for_edges
+
+
+def deadlock_trace(count):
+    """``count`` two-transaction deadlocks, each aborted once it forms"""
+    events = []
+    time = 0.0
+    for k in range(count):
+        a, b, x, y = f"t{k}a", f"t{k}b", f"row{k}x", f"row{k}y"
+        for kind, owner, lock in ((lock_trace.ACQUIRE, a, x), (lock_trace.ACQUIRE, b, y),
+                                  (lock_trace.WAIT, a, y), (lock_trace.WAIT, b, x),
+                                  (lock_trace.EXIT, a, None), (lock_trace.EXIT, b, None)):
+            time += 1.0
+            events.append((len(events) + 1, time, kind, owner, lock, None))
+    return events
+
+
+def test_reports_keep_a_bounded_tail():
+    replayer = lock_trace.LockTraceReplayer(keep_reports=10)
+    replayer.run(deadlock_trace(50))
+    assert replayer.deadlocks == 50
+    assert [report['processes'] for report in replayer.reports] == [
+        [f"t{k}a", f"t{k}b"] for k in range(40, 50)]
+    assert len(replayer.engine) == 0
+
+
+def test_reports_are_not_kept_with_a_callback():
+    seen = []
+    replayer = lock_trace.LockTraceReplayer(on_deadlock=seen.append)
+    replayer.run(deadlock_trace(30))
+    assert replayer.deadlocks == len(seen) == 30
+    assert not replayer.reports
+    assert [event['line'] for event in seen[0]['events']] == [1, 2, 3, 4]
+
+
+def test_live_state_matches_a_recompute():
+    replayer = lock_trace.LockTraceReplayer()
+    for event in deadlock_trace(5):
+        replayer.feed(*event)
+        check_wait_for(replayer.engine)
+        assert replayer.engine.has_cycle == bool(
+            nodes_on_cycles(wait_for_edges(replayer.engine)))
+
+
+def script(*steps):
+    """Events from ``(kind, owner, lock)`` steps, one per second"""
+    return [(line, float(line), kind, owner, lock, None)
+            for line, (kind, owner, lock) in enumerate(steps, 1)]
+
+
+ACQUIRE_CLOSES = [
+    (lock_trace.ACQUIRE, 'A', 'L1'), (lock_trace.ACQUIRE, 'B', 'L3'),
+    (lock_trace.WAIT, 'A', 'L2'), (lock_trace.WAIT, 'B', 'L1'),
+    (lock_trace.ACQUIRE, 'B', 'L2'),  # A's wait for L2 now blocks
+]
+# Y holds L4 and waits for L3, which deadlocked V holds
+BLOCKED_BEHIND = [
+    (lock_trace.ACQUIRE, 'V', 'L5'), (lock_trace.ACQUIRE, 'W', 'L6'),
+    (lock_trace.ACQUIRE, 'V', 'L7'), (lock_trace.ACQUIRE, 'Y', 'L4'),
+    (lock_trace.WAIT, 'V', 'L6'), (lock_trace.WAIT, 'W', 'L5'),
+    (lock_trace.WAIT, 'Y', 'L7'),
+]
+
+
+@pytest.mark.parametrize('mode', ['cycle', 'reduction'])
+def test_an_acquire_can_close_a_deadlock(mode):
+    replayer = lock_trace.LockTraceReplayer(mode)
+    replayer.run(script(*ACQUIRE_CLOSES))
+    assert replayer.engine.has_cycle
+    assert replayer.deadlocks == 1
+    [report] = replayer.reports
+    assert report['line'] == 5 and report['processes'] == ['A', 'B']
+    assert report['deadlocked'] == sorted(replayer.engine.detect(mode).nodes)
+    assert [event['line'] for event in report['events']] == [1, 3, 4, 5]
+
+
+def test_reduction_reports_owners_blocked_behind_a_deadlock():
+    replayer = lock_trace.LockTraceReplayer('reduction')
+    replayer.run(script(*ACQUIRE_CLOSES, *BLOCKED_BEHIND))
+    result = replayer.engine.detect('reduction')
+    assert result.processes == ['A', 'B', 'V', 'W', 'Y']
+    assert [report['processes'] for report in replayer.reports] == [
+        ['A', 'B'], ['V', 'W'], ['V', 'W', 'Y']]
+    assert replayer.reports[-1]['line'] == 12
+    assert 'L7' in replayer.reports[-1]['deadlocked']
+
+    # Cycle mode only counts the owners on cycles
+    replayer = lock_trace.LockTraceReplayer('cycle')
+    replayer.run(script(*ACQUIRE_CLOSES, *BLOCKED_BEHIND))
+    assert [report['processes'] for report in replayer.reports] == [['A', 'B'], ['V', 'W']]
+
+
+@pytest.mark.parametrize('mode', ['cycle', 'reduction'])
+def test_a_deadlock_is_reported_again_only_after_it_ended(mode):
+    replayer = lock_trace.LockTraceReplayer(mode)
+    replayer.run(script(*ACQUIRE_CLOSES,
+                        (lock_trace.ACQUIRE, 'A', 'L9'), (lock_trace.WAIT, 'B', 'L9'),
+                        (lock_trace.RELEASE, 'A', 'L9'),  # Still deadlocked
+                        (lock_trace.ACQUIRE, 'B', 'L9'), (lock_trace.CANCEL, 'B', 'L1'),
+                        (lock_trace.WAIT, 'B', 'L1')))
+    assert [report['line'] for report in replayer.reports] == [5, 11]
+    assert replayer.deadlocked == {'A', 'B'}
+
+
+@pytest.mark.parametrize('mode', ['cycle', 'reduction'])
+def test_reported_deadlocks_follow_detection_after_every_event(mode):
+    for rng in seeds(60):
+        replayer = lock_trace.LockTraceReplayer(mode, window=rng.choice([None, 15.0]))
+        owners = [f"T{k}" for k in range(5)]
+        locks = [f"L{k}" for k in range(4)]
+        kinds = [lock_trace.WAIT] * 4 + [lock_trace.ACQUIRE] * 3 + [
+            lock_trace.RELEASE, lock_trace.CANCEL, lock_trace.EXIT]
+        for line in range(1, 80):
+            before = set(replayer.deadlocked)
+            reports = replayer.deadlocks
+            replayer.feed(line, float(line), rng.choice(kinds), rng.choice(owners),
+                          rng.choice(locks))
+            engine = replayer.engine
+            expected = {name for name in engine.detect(mode).nodes
+                        if engine.node_type(name) == lock_trace.PROCESS}
+            assert replayer.deadlocked == expected
+            if expected - before:
+                assert replayer.deadlocks > reports
+                assert expected - before <= {
+                    name for report in list(replayer.reports)[reports - replayer.deadlocks:]
+                    for name in report['processes']}
+            elif replayer.window is None:  # Expiry can end one the event forms again
+                assert replayer.deadlocks == reports
@@ -0,0 +1,109 @@
+import json
+import threading
+
+import pytest
+
+import profiling
+from deadlock_engine import CYCLE_MODE
+from helpers import random_engine, seeds
+
+
+def check_chrome_trace(trace):
+    """Assert ``trace`` is Chrome trace JSON with complete and counter events"""
+    trace = json.loads(json.dumps(trace))
+    assert set(trace) == {'traceEvents', 'displayTimeUnit'}
+    for event in trace['traceEvents']:
+        assert isinstance(event['name'], str) and isinstance(event['pid'], int)
+        assert isinstance(event['ts'], (int, float))
+        if event['ph'] == 'X':
+            assert event['dur'] >= 0 and isinstance(event['tid'], int)
+            assert isinstance(event.get('args', {}), dict)
+        else:
+            assert event['ph'] == 'C'
+            assert all(isinstance(value, (int, float)) for value in event['args'].values())
+    return trace['traceEvents']
+
+
+def test_nothing_is_recorded_while_disabled():
+    profiler = profiling.Profiler()
+    assert profiler.span('idle') is profiler.span('other')
+    with profiler.span('idle'):
+        profiler.count('idle.calls')
+    assert not profiler.events and not profiler.stats and not profiler.counters
+
+
+def test_spans_and_counters():
+    profiler = profiling.Profiler()
+    profiler.enable()
+    for k in range(3):
+        with profiler.span('outer', step=k):
+            with profiler.span('inner'):
+                profiler.count('items', 2)
+    worker = threading.Thread(target=lambda: profiler.count('items'))
+    worker.start()
+    worker.join()
+    calls, total, peak = profiler.stats['outer']
+    assert calls == 3 and 0 <= peak <= total
+    assert profiler.stats['inner'][0] == 3 and profiler.stats['inner'][1] <= total
+    assert profiler.counters == {'items': 7}
+    events = check_chrome_trace(profiler.chrome_trace())
+    assert [event['args'] for event in events if event['name'] == 'outer'] == [
+        {'step': 0}, {'step': 1}, {'step': 2}]
+    assert [event['args']['items'] for event in events if event['ph'] == 'C'] == [2, 4, 6, 7]
+    assert profiler.summary_lines()[1].startswith('outer')
+    assert profiler.summary_lines()[-1].split() == ['items', '7']
+    profiler.reset()
+    assert not profiler.events and not profiler.stats and not profiler.counters
+
+
+def test_stored_events_are_bounded():
+    profiler = profiling.Profiler(max_events=10)
+    profiler.enable()
+    for k in range(25):
+        with profiler.span('step', k=k):
+            pass
+        profiler.count('steps')
+    assert len(profiler.events) == 10
+    assert profiler.events[-1]['args'] == {'steps': 25}
+    assert profiler.events[-2]['args'] == {'k': 24}
+    # Totals cover every span, not only the stored ones
+    assert profiler.stats['step'][0] == 25 and profiler.counters['steps'] == 25
+    profiler.merge(profiler.drain() * 2)
+    assert len(profiler.events) == 10
+
+
+def test_drain_merge_and_export_write_chrome_traces(tmp_path):
+    parent = profiling.Profiler()
+    worker = profiling.Profiler()
+    worker.enable()
+    with worker.span('batch.detect', path='a.rag'):
+        worker.count('batch.scenarios')
+    shipped = worker.drain()
+    assert not worker.events and worker.stats['batch.detect'][0] == 1
+    parent.merge(shipped)
+    assert not parent.stats
+    path = tmp_path / 'trace.json'
+    parent.export(str(path))
+    events = check_chrome_trace(json.loads(path.read_text()))
+    # The counter inside the span is recorded before the span ends
+    assert [(event['name'], event['ph']) for event in events] == [
+        ('batch.scenarios', 'C'), ('batch.detect', 'X')]
+
+
+@pytest.fixture
+def shared_profiler():
+    profiling.enable()
+    yield profiling.profiler
+    profiling.profiler.enable(False)
+    profiling.profiler.reset()
+
+
+def test_engine_spans_export(shared_profiler, tmp_path):
+    engine = random_engine(seeds(1)[0], edges=20)
+    engine.detect(CYCLE_MODE)
+    assert shared_profiler.stats['detect'][0] == 1
+    path = tmp_path / 'engine.json'
+    shared_profiler.export(str(path))
+    events = check_chrome_trace(json.loads(path.read_text()))
+    [detect] = [event for event in events if event['name'] == 'detect']
+    assert detect['args'] == {'mode': CYCLE_MODE, 'nodes': len(engine)}
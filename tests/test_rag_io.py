@@ -0,0 +1,260 @@
+import io
+import json
+import random
+
+import numpy as np
+import pytest
+
+import rag_io
+from deadlock_engine import PROCESS, RESOURCE
+from helpers import check_wait_for, random_engine, seeds
+from history import apply_ops, diff_ops, invert
+from rag_io import RAGFormatError
+
+
+def state(engine):
+    return (engine.names, bytes(engine.kinds), list(engine.instances),
+            list(engine.available), list(engine.xs), list(engine.ys),
+            sorted(engine.iter_edges()), sorted(engine.iter_claims()))
+
+
+def claimed_engine(rng):
+    engine = random_engine(rng)
+    engine.set_claim('P1', 'R1', 2)
+    engine.set_position('P2', 1.5, -3.25)
+    return engine
+
+
+@pytest.mark.parametrize('suffix', ['.rag', '.ragz'])
+def test_formats_round_trip(tmp_path, suffix):
+    for number, rng in enumerate(seeds(20)):
+        engine = claimed_engine(rng)
+        path = tmp_path / f"scenario{number}{suffix}"
+        rag_io.save(path, engine, (7, 3))
+        loaded, counters = rag_io.load(path)
+        assert counters == (7, 3)
+        assert state(loaded) == state(engine)
+        check_wait_for(loaded)
+
+
+def records(engine):
+    stream = io.StringIO()
+    rag_io.write_records(stream, engine, (6, 5))
+    return [json.loads(line) for line in stream.getvalue().splitlines()]
+
+
+def load_records(lines):
+    return rag_io.load_json(io.StringIO(
+        '\n'.join(line if isinstance(line, str) else json.dumps(line) for line in lines)))
+
+
+def first(lines, key):
+    return next(i for i, record in enumerate(lines) if key in record)
+
+
+def corrupt(key, field, value):
+    """Change ``field`` of the first record holding ``key``"""
+    def change(lines):
+        lines[first(lines, key)][field] = value
+    return change
+
+
+def drop(key, field):
+    def change(lines):
+        del lines[first(lines, key)][field]
+    return change
+
+
+def allocation_instances(value):
+    def change(lines):
+        record = next(record for record in lines if 'edge' in record
+                      and record['edge'][0].startswith('R'))
+        record['instances'] = value
+    return change
+
+
+MALFORMED_JSON = {
+    'not json': lambda lines: lines.insert(1, '{"node": '),
+    'not an object': lambda lines: lines.insert(1, [1, 2]),
+    'no header': lambda lines: lines.pop(0),
+    'string version': corrupt('format', 'version', "1"),
+    'newer version': corrupt('format', 'version', 99),
+    'float counter': corrupt('format', 'process_count', 1.5),
+    'negative counter': corrupt('format', 'resource_count', -1),
+    'numeric name': corrupt('node', 'node', 7),
+    'empty name': corrupt('node', 'node', ""),
+    'duplicate name': lambda lines: lines.insert(2, dict(lines[1])),
+    'unknown type': corrupt('node', 'type', 'thread'),
+    'list type': corrupt('node', 'type', ['process']),
+    'missing type': drop('node', 'type'),
+    'string instances': corrupt('node', 'instances', "2"),
+    'float instances': corrupt('node', 'instances', 2.0),
+    'bool instances': corrupt('node', 'instances', True),
+    'zero instances': corrupt('node', 'instances', 0),
+    'negative instances': corrupt('node', 'instances', -4),
+    'huge instances': corrupt('node', 'instances', 2 ** 80),
+    'negative available': corrupt('node', 'available', -1),
+    'too many available': corrupt('node', 'available', 1000),
+    'available ignores allocations': lambda lines: next(
+        record for record in lines if record.get('node') == 'R1').update(available=3),
+    'string position': corrupt('node', 'x', "left"),
+    'infinite position': lambda lines: lines.insert(
+        1, '{"node": "Q", "type": "process", "y": Infinity}'),
+    'edge not a pair': corrupt('edge', 'edge', ['P1']),
+    'edge of numbers': corrupt('edge', 'edge', [0, 1]),
+    'edge to a missing node': corrupt('edge', 'edge', ['P1', 'R99']),
+    'edge between processes': corrupt('edge', 'edge', ['P1', 'P2']),
+    'zero edge': corrupt('edge', 'instances', 0),
+    'negative edge': corrupt('edge', 'instances', -2),
+    'string edge count': corrupt('edge', 'instances', "1"),
+    'over-allocated resource': allocation_instances(1000),
+    'claim of numbers': corrupt('claim', 'claim', [1, 2]),
+    'claim without maximum': drop('claim', 'maximum'),
+    'negative claim': corrupt('claim', 'maximum', -1),
+    'claim on a process': corrupt('claim', 'claim', ['P1', 'P2']),
+}
+
+
+@pytest.mark.parametrize('change', MALFORMED_JSON.values(), ids=MALFORMED_JSON)
+def test_malformed_json_raises_format_error(change):
+    engine = claimed_engine(random.Random(4))
+    lines = records(engine)
+    load_records(lines)  # The unchanged file loads
+    change(lines)
+    with pytest.raises(RAGFormatError):
+        load_records(lines)
+
+
+def binary_columns(engine):
+    snapshot = engine.snapshot()
+    claims = [(engine.index[p], engine.index[r], m) for p, r, m in snapshot['claims']]
+    columns = dict(
+        version=np.int64(rag_io.FORMAT_VERSION),
+        counters=np.asarray((6, 5), dtype=np.int64),
+        names=np.asarray(engine.names, dtype=str),
+        kinds=np.frombuffer(snapshot['kinds'], dtype=np.uint8),
+        instances=np.asarray(engine.instances, dtype=np.int64),
+        available=np.asarray(engine.available, dtype=np.int64),
+        xs=np.asarray(engine.xs), ys=np.asarray(engine.ys),
+        sources=np.frombuffer(snapshot['sources'], dtype=np.int64),
+        targets=np.frombuffer(snapshot['targets'], dtype=np.int64),
+        counts=np.frombuffer(snapshot['counts'], dtype=np.int64))
+    for key, column in zip(rag_io._CLAIM_COLUMNS, zip(*claims)):
+        columns[key] = np.asarray(column, dtype=np.int64)
+    return columns
+
+
+def write_columns(path, columns):
+    with open(path, 'wb') as stream:
+        np.savez_compressed(stream, **columns)
+
+
+def replace(key, value):
+    def change(columns):
+        columns[key] = np.asarray(value)
+    return change
+
+
+def set_item(key, position, value):
+    def change(columns):
+        columns[key] = columns[key].copy()
+        columns[key][position] = value
+    return change
+
+
+MALFORMED_BINARY = {
+    'missing column': lambda columns: columns.pop('counts'),
+    'string instances': replace('instances', ['1'] * 11),
+    'float sources': lambda columns: columns.update(sources=columns['sources'] + 0.5),
+    'two-dimensional xs': lambda columns: columns.update(xs=columns['xs'][:, None]),
+    'short counters': replace('counters', [1]),
+    'negative counter': replace('counters', [-1, 0]),
+    'short instances': lambda columns: columns.update(instances=columns['instances'][1:]),
+    'short targets': lambda columns: columns.update(targets=columns['targets'][1:]),
+    'duplicate names': set_item('names', 1, 'P1'),
+    'unknown kind': set_item('kinds', 0, 2),
+    'zero instances': set_item('instances', 0, 0),
+    'negative instances': set_item('instances', 3, -1),
+    'negative available': set_item('available', 0, -1),
+    'available ignores allocations': lambda columns: columns.update(
+        available=columns['instances']),
+    'nan position': set_item('ys', 2, np.nan),
+    'source out of range': set_item('sources', 0, 11),
+    'negative target': set_item('targets', 0, -1),
+    'zero edge': set_item('counts', 0, 0),
+    'negative edge': set_item('counts', 0, -3),
+    'edge between processes': lambda columns: columns.update(
+        targets=np.where(columns['kinds'][columns['sources']] == 0,
+                         columns['sources'], columns['targets'])),
+    'claim out of range': set_item('claim_resources', 0, 42),
+    'negative claim index': set_item('claim_processes', 0, -1),
+    'short claim column': lambda columns: columns.update(claim_maximums=np.zeros(0, np.int64)),
+}
+
+
+@pytest.mark.parametrize('change', MALFORMED_BINARY.values(), ids=MALFORMED_BINARY)
+def test_malformed_binary_raises_format_error(tmp_path, change):
+    engine = claimed_engine(random.Random(4))
+    columns = binary_columns(engine)
+    path = tmp_path / 'scenario.ragz'
+    write_columns(path, columns)
+    loaded, _ = rag_io.load(path)  # The unchanged file loads
+    assert state(loaded) == state(engine)
+    change(columns)
+    write_columns(path, columns)
+    with pytest.raises(RAGFormatError):
+        rag_io.load(path)
+
+
+@pytest.mark.parametrize('content', [b'', b'not a zip file', b'PK\x03\x04truncated'])
+def test_unreadable_binary_raises_format_error(tmp_path, content):
+    path = tmp_path / 'scenario.ragz'
+    path.write_bytes(content)
+    with pytest.raises(RAGFormatError):
+        rag_io.load(path)
+
+
+def test_array_file_raises_format_error(tmp_path):
+    path = tmp_path / 'scenario.ragz'
+    with open(path, 'wb') as stream:
+        np.save(stream, np.arange(3))
+    with pytest.raises(RAGFormatError):
+        rag_io.load(path)
+
+
+def test_bulk_replay_matches_single_operations():
+    for rng in seeds(10):
+        engine = random_engine(rng, edges=0)
+        names = engine.names
+        ops = []
+        for _ in range(200):
+            p = rng.choice([n for n in names if engine.node_type(n) == PROCESS])
+            r = rng.choice([n for n in names if engine.node_type(n) == RESOURCE])
+            ops.append(('add_edge', p, r, rng.randint(1, 2)))
+        ops.insert(100, ('move_node', p, 0.0, 0.0, 1.0, 1.0))
+        bulk = engine.copy()
+        apply_ops(bulk, ops)
+        for op in ops:
+            apply_ops(engine, [op])
+        assert state(bulk) == state(engine)
+        check_wait_for(bulk)
+        apply_ops(bulk, invert(ops))
+        check_wait_for(bulk)
+        assert bulk.edge_count == 0
+
+
+def test_available_must_match_the_allocations():
+    header = '{"format": "rag", "version": 1}'
+    nodes = ['{"node": "P1", "type": "process"}',
+             '{"node": "R1", "type": "resource", "instances": 2%s}']
+    edge = '{"edge": ["R1", "P1"], "instances": 2}'
+    with pytest.raises(RAGFormatError, match="R1 has 2 instances available"):
+        load_records([header, nodes[0], nodes[1] % ', "available": 2', edge])
+    # Without an available count it follows from the allocations
+    engine, _ = load_records([header, nodes[0], nodes[1] % '', edge])
+    assert engine.available[engine.index['R1']] == 0
+    rebuilt = type(engine)()
+    apply_ops(rebuilt, diff_ops(rebuilt, engine))
+    assert list(rebuilt.available) == list(engine.available)
+    engine.remove_edge('R1', 'P1')
+    assert engine.available[engine.index['R1']] == 2
@@ -0,0 +1,81 @@
+import itertools
+
+import pytest
+
+import recovery
+from helpers import (nodes_on_cycles, random_engine, reduction_deadlocked, seeds,
+                     wait_for_edges)
+from history import apply_ops, invert
+
+
+def random_digraph(rng, size, density):
+    return {u: {v for v in range(size) if rng.random() < density} for u in range(size)}
+
+
+def acyclic_without(succ, removed):
+    return not nodes_on_cycles((u, v) for u, vs in succ.items() for v in vs
+                               if u not in removed and v not in removed)
+
+
+def brute_force_minimum(succ, weights):
+    """Cheapest feedback vertex set by trying every subset"""
+    vertices = list(succ)
+    return min(sum(weights[u] for u in subset)
+               for size in range(len(vertices) + 1)
+               for subset in itertools.combinations(vertices, size)
+               if acyclic_without(succ, set(subset)))
+
+
+def test_feedback_sets_break_every_cycle():
+    for rng in seeds(200):
+        succ = random_digraph(rng, rng.randint(1, 8), rng.choice([0.15, 0.3, 0.5]))
+        weights = {u: rng.choice([0.5, 1.0, 2.0, 5.0]) for u in succ}
+        greedy = recovery.greedy_feedback_set(succ, weights)
+        exact = recovery.exact_feedback_set(succ, weights)
+        assert acyclic_without(succ, greedy)
+        assert acyclic_without(succ, exact)
+        # No greedy victim can be given back
+        for u in greedy:
+            assert not acyclic_without(succ, greedy - {u})
+        best = brute_force_minimum(succ, weights)
+        assert sum(weights[u] for u in exact) == pytest.approx(best)
+        assert sum(weights[u] for u in greedy) >= best - 1e-9
+
+
+def deadlocked_engines(count):
+    for rng in seeds(count):
+        yield rng, random_engine(rng, processes=7, resources=5, max_instances=2, edges=24)
+
+
+@pytest.mark.parametrize('action', recovery.RECOVERY_ACTIONS)
+@pytest.mark.parametrize('mode', ['cycle', 'reduction'])
+def test_plans_resolve_every_deadlock(action, mode):
+    planned = 0
+    for rng, engine in deadlocked_engines(150):
+        costs = {name: rng.choice([0.5, 1.0, 3.0]) for name in engine.names
+                 if engine.node_type(name) == 'process'}
+        before = engine.copy()
+        plan = recovery.plan_recovery(engine, costs, action, mode=mode)
+        exact = recovery.plan_recovery(engine, costs, action, exact_limit=12, mode=mode)
+        def deadlocked():
+            if mode == 'cycle':
+                return nodes_on_cycles(wait_for_edges(engine))
+            return reduction_deadlocked(engine)
+
+        assert bool(plan) == bool(deadlocked())
+        assert exact.exact and exact.cost <= plan.cost + 1e-9
+        for candidate in (plan, exact):
+            apply_ops(engine, candidate.ops)
+            assert not deadlocked()
+            apply_ops(engine, invert(candidate.ops))
+            assert sorted(engine.iter_edges()) == sorted(before.iter_edges())
+            assert sorted(engine.names) == sorted(before.names)
+        planned += bool(plan)
+    assert planned > 20  # The random graphs do deadlock
+
+
+def test_parse_costs():
+    assert recovery.parse_costs("P1=5, P3=0.5  P4=0") == {'P1': 5.0, 'P3': 0.5, 'P4': 0.0}
+    for text in ("P1", "=3", "P1=cheap", "P1=-1"):
+        with pytest.raises(ValueError):
+            recovery.parse_costs(text)
@@ -0,0 +1,123 @@
+import itertools
+
+from deadlock_engine import RAGEngine, PROCESS, RESOURCE
+from helpers import random_engine, seeds
+
+
+def dense_state(engine, grant=None):
+    """Per-process need and allocation over every resource, as plain dicts"""
+    processes = [n for i, n in enumerate(engine.names) if engine.kinds[i] == 0]
+    resources = [n for i, n in enumerate(engine.names) if engine.kinds[i] == 1]
+    free = {r: engine.available[engine.index[r]] for r in resources}
+    held = {p: {r: engine.edge_instances(r, p) for r in resources} for p in processes}
+    wanted = {p: {r: engine.edge_instances(p, r) for r in resources} for p in processes}
+    if grant is not None:
+        resource, process, count = grant
+        if free[resource] < count:
+            return None
+        free[resource] -= count
+        held[process][resource] += count
+        wanted[process][resource] = max(0, wanted[process][resource] - count)
+    need = {p: {r: max(engine.max_claim(p, r), held[p][r] + wanted[p][r]) - held[p][r]
+                for r in resources} for p in processes}
+    return free, held, need
+
+
+def runs_in_order(state, sequence):
+    free, held, need = state
+    work = dict(free)
+    for p in sequence:
+        if any(need[p][r] > work[r] for r in work):
+            return False
+        for r, n in held[p].items():
+            work[r] += n
+    return True
+
+
+def oracle_safe(state):
+    """Banker's safety by repeatedly finishing any process that fits"""
+    free, held, need = state
+    work = dict(free)
+    left = set(need)
+    while left:
+        runnable = next((p for p in sorted(left)
+                         if all(need[p][r] <= work[r] for r in work)), None)
+        if runnable is None:
+            return False
+        for r, n in held[runnable].items():
+            work[r] += n
+        left.discard(runnable)
+    return True
+
+
+def random_claims(engine, rng):
+    for p in engine.names:
+        if engine.node_type(p) == PROCESS and rng.random() < 0.6:
+            for r in engine.names:
+                if engine.node_type(r) == RESOURCE and rng.random() < 0.5:
+                    engine.set_claim(p, r, rng.randint(0, 4))
+
+
+def check(engine, hint=(), grant=None):
+    state = dense_state(engine, grant)
+    sequence = engine.safe_sequence(hint, grant)
+    if state is None:
+        assert sequence is None
+        return sequence
+    assert (sequence is not None) == oracle_safe(state)
+    if sequence is not None:
+        assert sorted(sequence) == sorted(state[2])
+        assert runs_in_order(state, sequence)
+    return sequence
+
+
+def test_safety_matches_dense_bankers():
+    for rng in seeds(300):
+        engine = random_engine(rng, processes=rng.randint(0, 7), resources=rng.randint(0, 5),
+                               max_instances=4, edges=rng.randint(0, 15))
+        random_claims(engine, rng)
+        sequence = check(engine)
+        processes = [n for n in engine.names if engine.node_type(n) == PROCESS]
+        hints = [sequence or (), processes, processes[::-1],
+                 rng.sample(processes, len(processes) // 2) + ['R1', 'missing', 'P1']]
+        for hint in hints:
+            check(engine, hint)
+        for r, p in itertools.product(engine.names, engine.names):
+            if engine.node_type(r) == RESOURCE and engine.node_type(p) == PROCESS:
+                check(engine, sequence or (), (r, p, rng.randint(1, 3)))
+
+
+def test_undeclared_process_needs_every_resource_entirely_free():
+    engine = RAGEngine()
+    engine.add_node('P1', PROCESS)
+    engine.add_node('P2', PROCESS)
+    engine.add_node('R1', RESOURCE, 2)
+    engine.add_node('R2', RESOURCE, 1)
+    engine.add_edge('R1', 'P2', 1)
+    engine.set_claim('P2', 'R1', 2)
+    # P1 declared nothing, so it waits for P2 to return R1 although P1
+    # holds and requests nothing
+    assert engine.safe_sequence() == ['P2', 'P1']
+    assert engine.safe_sequence(['P1', 'P2']) == ['P2', 'P1']
+    # Both declared processes wait on the instance the other holds
+    engine.set_claim('P1', 'R2', 1)
+    engine.add_edge('R1', 'P1', 1)
+    engine.add_edge('P1', 'R1', 1)
+    engine.add_edge('R2', 'P2', 1)
+    engine.add_edge('P2', 'R2', 1)
+    engine.set_claim('P1', 'R1', 2)
+    assert engine.safe_sequence() is None
+
+
+def test_large_graph_stays_sparse():
+    engine = RAGEngine()
+    count = 20000
+    engine.load_arrays([f"P{i}" for i in range(count)] + [f"R{i}" for i in range(count)],
+                       bytes(count) + bytes([1]) * count, [1] * (2 * count),
+                       [1] * count + [0] * count, [0.0] * (2 * count), [0.0] * (2 * count),
+                       list(range(count, 2 * count)), list(range(count)), [1] * count)
+    for i in range(count):
+        engine.set_claim(f"P{i}", f"R{i}", 1)
+    sequence = engine.safe_sequence()
+    assert len(sequence) == count
+    assert engine.safe_sequence(sequence[::-1]) == sequence[::-1]
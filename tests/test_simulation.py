@@ -0,0 +1,147 @@
+import json
+
+import pytest
+
+from deadlock_engine import RAGEngine, CYCLE_MODE, REDUCTION_MODE, PROCESS, RESOURCE
+from helpers import random_engine, seeds
+from history import apply_ops
+from simulation import Simulation, random_workload, load_workload, run_trials
+
+
+class CheckedSimulation(Simulation):
+    """Runs full detection after every edge change, with no shortcuts, and
+    remembers when a deadlock first showed up as ``(time, event, nodes)``"""
+
+    first = None
+    started = False  # Set once the initial grants are done
+
+    def _change(self, u, v, delta):
+        super()._change(u, v, delta)
+        if self.started:
+            self._detect()
+
+    def _detect(self):
+        if self.first is None:
+            result = self.engine.detect(self.mode)
+            if result:
+                self.first = (self.time, self.events, result.nodes)
+
+
+def first_deadlock(engine, workload, mode):
+    simulation = CheckedSimulation(engine.copy(), workload, mode=mode, stop_on_deadlock=False)
+    simulation.started = True
+    simulation._detect()
+    simulation.run()
+    return simulation.first
+
+
+@pytest.mark.parametrize('mode', [CYCLE_MODE, REDUCTION_MODE])
+def test_first_deadlock_matches_detection_after_every_event(mode):
+    deadlocked = 0
+    for seed, rng in enumerate(seeds(200)):
+        # Some graphs start with edges, a few of them deadlocked already
+        engine = random_engine(rng, processes=rng.randint(2, 6), resources=rng.randint(1, 4),
+                               edges=rng.choice([0, 0, 4, 8]))
+        workload = random_workload(engine, seed=seed, max_request=2)
+        result = Simulation(engine.copy(), workload, mode=mode).run()
+        expected = first_deadlock(engine, workload, mode)
+        if expected is None:
+            assert not result
+        else:
+            deadlocked += 1
+            assert (result.deadlock_time, result.deadlock_event,
+                    result.deadlock.nodes) == expected
+    assert 20 < deadlocked < 180
+
+
+def crossed_engine():
+    engine = RAGEngine()
+    for name in ('P1', 'P2'):
+        engine.add_node(name, PROCESS)
+    for name in ('R1', 'R2'):
+        engine.add_node(name, RESOURCE)
+    return engine
+
+
+CROSSED = {
+    'P1': [('request', 'R1'), ('hold', 1), ('request', 'R2'), ('release', 'R2')],
+    'P2': [('request', 'R2', 1), ('hold', 1), ('request', 'R1'), ('release', 'R1')],
+}
+
+
+@pytest.mark.parametrize('mode', [CYCLE_MODE, REDUCTION_MODE])
+def test_scripted_workload(mode, tmp_path):
+    path = tmp_path / 'crossed.json'
+    path.write_text(json.dumps(CROSSED))
+    engine = crossed_engine()
+    result = Simulation(engine, load_workload(str(path)), mode=mode).run()
+    # Both hold one resource at t = 1 and then request the other's
+    assert result.deadlock_time == 1.0 and result.time == 1.0
+    assert result.deadlock_event == 6
+    assert result.deadlock.nodes == {'P1', 'P2', 'R1', 'R2'}
+    assert result.blocked == 2 and result.finished == 0
+    summary = result.summary()
+    assert summary['deadlock'] and summary['deadlock_time'] == 1.0
+
+    # Taking the resources in the same order never deadlocks
+    ordered = dict(CROSSED, P2=[('request', 'R1'), ('hold', 1), ('request', 'R2')])
+    result = Simulation(crossed_engine(), ordered, mode=mode).run()
+    assert not result and result.finished == 2 and result.blocked == 0
+    assert result.time == 2.0
+
+
+def test_scripted_workload_errors():
+    for steps in ([('sleep', 1)], [('request', 'P2')], [('request', 'R3')],
+                  [('request', 'R1', 2)], [('release', 'R1', 1), ('request', 'R1', 0)]):
+        with pytest.raises(ValueError):
+            Simulation(crossed_engine(), {'P1': steps})
+
+
+def test_recorded_trace_replays_the_run():
+    for seed, rng in enumerate(seeds(40)):
+        engine = random_engine(rng, edges=rng.choice([0, 6]))
+        start = engine.copy()
+        simulation = Simulation(engine, random_workload(engine, seed=seed),
+                                stop_on_deadlock=False, record=True)
+        result = simulation.run()
+        times = [at for at, _ in result.trace]
+        assert times == sorted(times) and times[-1] <= result.time
+        apply_ops(start, [op for _, op in result.trace])
+        assert set(start.iter_edges()) == set(engine.iter_edges())
+        assert list(start.available) == list(engine.available)
+        assert start.detect(REDUCTION_MODE).nodes == engine.detect(REDUCTION_MODE).nodes
+
+
+def test_random_workload_is_seeded_and_releases_everything():
+    engine = random_engine(seeds(1)[0], edges=0)
+    workload = random_workload(engine, seed=5, phases=4, max_claims=3, max_request=3)
+    assert workload == random_workload(engine, seed=5, phases=4, max_claims=3, max_request=3)
+    assert workload != random_workload(engine, seed=6, phases=4, max_claims=3, max_request=3)
+    assert set(workload) == {name for i, name in enumerate(engine.names)
+                             if engine.is_process(i)}
+    for steps in workload.values():
+        held = set()
+        for step in steps:
+            if step[0] == 'request':
+                assert step[1] not in held
+                assert 0 < step[2] <= engine.instances[engine.index[step[1]]]
+                held.add(step[1])
+            elif step[0] == 'release':
+                held.remove(step[1])
+        assert not held
+
+
+@pytest.mark.parametrize('jobs', [1, 2])
+def test_run_trials_match_single_runs(jobs):
+    engine = random_engine(seeds(2)[1], edges=0)
+    options = {'phases': 2, 'max_claims': 3}
+    records = list(run_trials(engine, 6, seed=10, jobs=jobs, workload_options=options,
+                              mode=CYCLE_MODE))
+    assert [record['seed'] for record in records] == list(range(10, 16))
+    for record in records:
+        workload = random_workload(engine, seed=record['seed'], **options)
+        expected = Simulation(engine.copy(), workload, mode=CYCLE_MODE).run().summary()
+        expected['seed'] = record['seed']
+        del record['elapsed'], expected['elapsed']
+        assert record == expected
+    assert not list(engine.iter_edges())  # Trials run on copies
@@ -0,0 +1,99 @@
+import pytest
+
+import whatif
+from helpers import nodes_on_cycles, random_engine, reduction_deadlocked, seeds, wait_for_edges
+from history import apply_ops
+
+
+def snapshot_state(engine):
+    return sorted(engine.iter_edges()), list(engine.available)
+
+
+def oracle_record(engine, mode):
+    if mode == 'cycle':
+        deadlocked = nodes_on_cycles(wait_for_edges(engine))
+    else:
+        deadlocked = reduction_deadlocked(engine)
+    processes = sorted(name for name in deadlocked if engine.node_type(name) == 'process')
+    waiting = {u for u, _ in wait_for_edges(engine) if engine.node_type(u) == 'process'}
+    return {'deadlock': bool(processes), 'deadlocked': processes, 'waiting': len(waiting)}
+
+
+def branching_engines(count):
+    for rng in seeds(count):
+        engine = random_engine(rng, processes=5, resources=4, max_instances=3, edges=14)
+        if whatif.candidate_allocations(engine):
+            yield rng, engine
+
+
+def rank_key(record):
+    return ('error' in record, record.get('deadlock', True), len(record.get('deadlocked', ())),
+            record.get('safe') is False, record.get('waiting', 0))
+
+
+@pytest.mark.parametrize('mode', ['cycle', 'reduction'])
+def test_records_match_a_recompute_of_each_branch(mode):
+    evaluated = 0
+    for _, engine in branching_engines(60):
+        before = snapshot_state(engine)
+        root = whatif.Branch.from_engine(engine)
+        branches = whatif.allocation_branches(root, engine, depth=2)
+        assert snapshot_state(engine) == before
+        records = whatif.evaluate(branches, mode, safety=True, jobs=1)
+        assert sorted(record['index'] for record in records) == list(range(len(branches)))
+        assert [rank_key(record) for record in records] == sorted(map(rank_key, records))
+        for record in records:
+            branch = branches[record['index']]
+            state = branch.engine()
+            assert record['branch'] == branch.name
+            assert record['ops'] == len(branch.path())
+            expected = oracle_record(state, mode)
+            assert {key: record[key] for key in expected} == expected
+            assert record['safe'] == (state.safe_sequence() is not None)
+        evaluated += len(records)
+    assert evaluated > 100
+
+
+def test_parallel_evaluation_matches_serial(monkeypatch):
+    monkeypatch.setattr(whatif, 'CHUNK_SIZE', 4)
+    monkeypatch.setattr(whatif, 'PARALLEL_MIN_BRANCHES', 8)
+    for _, engine in list(branching_engines(20))[:4]:
+        root = whatif.Branch.from_engine(engine)
+        branches = whatif.allocation_branches(root, engine, depth=2)
+        serial = whatif.evaluate(branches, 'reduction', safety=True, jobs=1)
+        parallel = whatif.evaluate(branches, 'reduction', safety=True, jobs=2)
+        assert parallel == serial
+
+
+def test_failing_branch_does_not_affect_the_others():
+    _, engine = next(branching_engines(20))
+    root = whatif.Branch.from_engine(engine)
+    broken = root.fork([('add_edge', 'P1', 'R1', 1), ('remove_node', 'missing', 'process', 1, 0, 0)],
+                       "broken")
+    branches = [broken] + whatif.allocation_branches(root, engine)
+    records = whatif.evaluate(branches, jobs=1)
+    assert records[-1]['branch'] == "broken" and 'error' in records[-1]
+    for record in records[:-1]:
+        assert 'error' not in record
+        state = branches[record['index']].engine()
+        assert record['deadlocked'] == oracle_record(state, 'cycle')['deadlocked']
+
+
+def test_branches_must_share_a_root():
+    _, engine = next(branching_engines(20))
+    first = whatif.Branch.from_engine(engine).fork([], "a")
+    second = whatif.Branch.from_engine(engine).fork([], "b")
+    with pytest.raises(ValueError):
+        whatif.evaluate([first, second])
+    assert whatif.evaluate([]) == []
+
+
+def test_branch_path_composes_parent_operations():
+    _, engine = next(branching_engines(20))
+    root = whatif.Branch.from_engine(engine)
+    child = whatif.allocation_branches(root, engine)[0]
+    grandchild = child.fork([('move_node', 'P1', 0.0, 0.0, 5.0, 5.0)], "moved")
+    assert grandchild.path() == list(child.ops) + list(grandchild.ops)
+    expected = engine.copy()
+    apply_ops(expected, grandchild.path())
+    assert snapshot_state(grandchild.engine()) == snapshot_state(expected)
@@ -1,9 +1,14 @@
 # Import necessary PyQt6 modules
 from PyQt6.QtWidgets import (QDialog, QVBoxLayout, QHBoxLayout, QLabel, 
                            QSpinBox, QPushButton, QLineEdit, QGraphicsScene,
-                           QGraphicsView, QMainWindow, QWidget)
+                           QGraphicsView, QMainWindow, QWidget, QComboBox,
+                           QCheckBox, QPlainTextEdit, QListWidget,
+                           QStyleOptionGraphicsItem)
 from PyQt6.QtCore import Qt
-from PyQt6.QtGui import QKeySequence, QShortcut, QPainter
+from PyQt6.QtGui import QKeySequence, QShortcut, QPainter, QFontDatabase
+
+from graph_elements import LOD_ZOOM_THRESHOLD
+from profiling import profiler
 
 class ResourceDialog(QDialog):
   #Dialog window to add a new resource with a specified number of instances.
@@ -69,6 +74,125 @@ class EdgeDialog(QDialog):
         add_button = QPushButton("Add")
         add_button.clicked.connect(self.accept)
         layout.addWidget(add_button)
+class ClaimDialog(QDialog):
+  #Dialog window to declare a process's maximum claim on a resource.
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.setWindowTitle("Set Maximum Claim")
+        layout = QVBoxLayout(self)
+        process_layout = QHBoxLayout()
+        process_layout.addWidget(QLabel("Process:"))
+        self.process_edit = QLineEdit()
+        process_layout.addWidget(self.process_edit)
+        layout.addLayout(process_layout)
+        resource_layout = QHBoxLayout()
+        resource_layout.addWidget(QLabel("Resource:"))
+        self.resource_edit = QLineEdit()
+        resource_layout.addWidget(self.resource_edit)
+        layout.addLayout(resource_layout)
+       # Most instances the process will ever hold at once (0 withdraws the claim)
+        maximum_layout = QHBoxLayout()
+        maximum_layout.addWidget(QLabel("Maximum instances:"))
+        self.maximum_spinbox = QSpinBox()
+        self.maximum_spinbox.setMinimum(0)
+        self.maximum_spinbox.setMaximum(99)
+        self.maximum_spinbox.setValue(1)
+        maximum_layout.addWidget(self.maximum_spinbox)
+        layout.addLayout(maximum_layout)
+        set_button = QPushButton("Set")
+        set_button.clicked.connect(self.accept)
+        layout.addWidget(set_button)
+class RecoveryDialog(QDialog):
+  #Dialog window to plan a deadlock recovery: victim costs, action and exact search.
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.setWindowTitle("Recover From Deadlock")
+        layout = QVBoxLayout(self)
+       # Victim costs as NAME=COST pairs; unlisted processes cost 1
+        costs_layout = QHBoxLayout()
+        costs_layout.addWidget(QLabel("Process costs:"))
+        self.costs_edit = QLineEdit()
+        self.costs_edit.setPlaceholderText("e.g. P1=5, P3=0.5")
+        costs_layout.addWidget(self.costs_edit)
+        layout.addLayout(costs_layout)
+        action_layout = QHBoxLayout()
+        action_layout.addWidget(QLabel("Action:"))
+        self.action_combo = QComboBox()
+        self.action_combo.addItem("Terminate victims", 'terminate')
+        self.action_combo.addItem("Preempt their resources", 'preempt')
+        action_layout.addWidget(self.action_combo)
+        layout.addLayout(action_layout)
+       # Exact search is exponential, so it only runs on small components
+        self.exact_checkbox = QCheckBox("Exact for small components")
+        layout.addWidget(self.exact_checkbox)
+        plan_button = QPushButton("Plan")
+        plan_button.clicked.connect(self.accept)
+        layout.addWidget(plan_button)
+class BulkEdgeDialog(QDialog):
+  #Dialog window to paste or type a script of nodes and edges, applied as one action.
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.setWindowTitle("Bulk Edit")
+        self.resize(420, 360)
+        layout = QVBoxLayout(self)
+        layout.addWidget(QLabel("One item per line: 'process P1 P2', 'resource R1=2',\n"
+                                "'R1 -> P1 x2' (allocation), 'P2 -> R1' (request); # comments"))
+        self.script_edit = QPlainTextEdit()
+        self.script_edit.setPlaceholderText("process P1 P2\nresource R1 R2\n"
+                                            "R1 -> P1\nR2 -> P2\nP1 -> R2\nP2 -> R1")
+        layout.addWidget(self.script_edit)
+        apply_button = QPushButton("Apply")
+        apply_button.clicked.connect(self.accept)
+        layout.addWidget(apply_button)
+class WhatIfDialog(QDialog):
+  #Dialog window listing ranked what-if branches; selecting one shows it in the graph.
+    def __init__(self, records, parent=None):
+        super().__init__(parent)
+        self.setWindowTitle("What If")
+        self.resize(480, 360)
+        layout = QVBoxLayout(self)
+        layout.addWidget(QLabel("Next allocations, best first. Select one to see it:"))
+        self.branch_list = QListWidget()
+        for number, record in enumerate(records, 1):
+            if record.get('error'):
+                outcome = record['error']
+            elif record['deadlock']:
+                outcome = "deadlock: " + ", ".join(record['deadlocked'])
+            else:
+                outcome = "no deadlock"
+            if 'safe' in record:
+                outcome += ", safe" if record['safe'] else ", unsafe"
+            self.branch_list.addItem(f"{number}. {record['branch']} — {outcome}, "
+                                     f"{record.get('waiting', 0)} waiting")
+        layout.addWidget(self.branch_list)
+        buttons = QHBoxLayout()
+        keep_button = QPushButton("Keep")  # Commit the selected branch
+        keep_button.clicked.connect(self.accept)
+        buttons.addWidget(keep_button)
+        close_button = QPushButton("Close")  # Back to the graph as it was
+        close_button.clicked.connect(self.reject)
+        buttons.addWidget(close_button)
+        layout.addLayout(buttons)
+# Graphics view with mouse-wheel zoom around the cursor
+class GraphView(QGraphicsView):
+    def __init__(self, scene):
+        super().__init__(scene)
+        self.setTransformationAnchor(QGraphicsView.ViewportAnchor.AnchorUnderMouse)
+
+    def wheelEvent(self, event):
+        factor = 1.15 if event.angleDelta().y() > 0 else 1 / 1.15
+        before = QStyleOptionGraphicsItem.levelOfDetailFromTransform(self.transform())
+        self.scale(factor, factor)
+        after = QStyleOptionGraphicsItem.levelOfDetailFromTransform(self.transform())
+        if (before >= LOD_ZOOM_THRESHOLD) != (after >= LOD_ZOOM_THRESHOLD):
+            # Labels appear or disappear: drop the items' cached pixmaps
+            for item in self.scene().items():
+                item.update()
+
+    def paintEvent(self, event):
+        with profiler.span('paint'):
+            super().paintEvent(event)
+
 # Main Application Window UI 
 class MainWindowUI(QMainWindow):
     def __init__(self):
@@ -82,13 +206,46 @@ class MainWindowUI(QMainWindow):
          # Graphics scene and view (for drawing the graph)
         self.scene = QGraphicsScene()
         self.scene.setParent(self)
-        self.view = QGraphicsView(self.scene)
-        self.view.setRenderHint(QPainter.RenderHint.Antialiasing)
-        self.view.setViewportUpdateMode(QGraphicsView.ViewportUpdateMode.FullViewportUpdate)
+        self.view = GraphView(self.scene)
+        self.apply_render_settings(large_graph=False)
         layout.addWidget(self.view)
 
       # Create buttons panel at the bottom
         self.create_button_panel(layout)
+        # Live deadlock status, kept current as edges change
+        self.deadlock_status_label = QLabel()
+        self.statusBar().addPermanentWidget(self.deadlock_status_label)
+        # Current safe sequence, shown while Banker's avoidance is on
+        self.safe_sequence_label = QLabel()
+        self.safe_sequence_label.hide()
+        self.statusBar().addPermanentWidget(self.safe_sequence_label)
+        # Profiling stats drawn over the top-left corner of the view
+        self.stats_overlay = QLabel(self.view)
+        self.stats_overlay.setFont(QFontDatabase.systemFont(QFontDatabase.SystemFont.FixedFont))
+        self.stats_overlay.setStyleSheet(
+            "background-color: rgba(255, 255, 255, 210); padding: 4px;")
+        self.stats_overlay.setAttribute(Qt.WidgetAttribute.WA_TransparentForMouseEvents)
+        self.stats_overlay.move(8, 8)
+        self.stats_overlay.hide()
+
+    # Pick view settings for the graph size: small graphs get antialiasing and
+    # full repaints, large graphs repaint only changed regions without it.
+    # Long edges make the BSP scene index degenerate, so large graphs skip it.
+    def apply_render_settings(self, large_graph):
+        self.view.setRenderHint(QPainter.RenderHint.Antialiasing, not large_graph)
+        self.scene.setItemIndexMethod(
+            QGraphicsScene.ItemIndexMethod.NoIndex if large_graph
+            else QGraphicsScene.ItemIndexMethod.BspTreeIndex)
+        if large_graph:
+            self.view.setViewportUpdateMode(
+                QGraphicsView.ViewportUpdateMode.BoundingRectViewportUpdate)
+            self.view.setOptimizationFlag(
+                QGraphicsView.OptimizationFlag.DontSavePainterState, True)
+        else:
+            self.view.setViewportUpdateMode(
+                QGraphicsView.ViewportUpdateMode.FullViewportUpdate)
+            self.view.setOptimizationFlag(
+                QGraphicsView.OptimizationFlag.DontSavePainterState, False)
 
     # Create UI buttons and shortcuts
     def create_button_panel(self, layout):
@@ -109,14 +266,76 @@ class MainWindowUI(QMainWindow):
         self.allocation_edge_btn = QPushButton("Allocation Edge (A)")
         QShortcut(QKeySequence("A"), self).activated.connect(lambda: self.show_add_edge_dialog('allocation'))
         button_panel.addWidget(self.allocation_edge_btn)
+  # Bulk edit (B): many nodes and edges from a pasted script in one step
+        self.bulk_btn = QPushButton("Bulk Edit (B)")
+        QShortcut(QKeySequence("B"), self).activated.connect(self.show_bulk_dialog)
+        button_panel.addWidget(self.bulk_btn)
      # Check Deadlock button with shortcut (D)
         self.check_deadlock_btn = QPushButton("Check Deadlock (D)")
         QShortcut(QKeySequence("D"), self).activated.connect(self.check_deadlock)
         button_panel.addWidget(self.check_deadlock_btn)
+        # Plan and apply a deadlock recovery (V)
+        self.recover_btn = QPushButton("Recover (V)")
+        QShortcut(QKeySequence("V"), self).activated.connect(self.show_recovery_dialog)
+        button_panel.addWidget(self.recover_btn)
+        # Detection mode selector (item data is the GraphManager mode name)
+        self.detection_mode_combo = QComboBox()
+        self.detection_mode_combo.addItem("Cycle (SCC)", 'cycle')
+        self.detection_mode_combo.addItem("Reduction (multi-instance)", 'reduction')
+        button_panel.addWidget(self.detection_mode_combo)
+  # What-if branches (W): every candidate next allocation, ranked
+        self.whatif_btn = QPushButton("What If (W)")
+        QShortcut(QKeySequence("W"), self).activated.connect(self.start_whatif)
+        button_panel.addWidget(self.whatif_btn)
+  # Banker's avoidance toggle and maximum claims (M)
+        self.avoidance_checkbox = QCheckBox("Banker's avoidance")
+        button_panel.addWidget(self.avoidance_checkbox)
+        self.claim_btn = QPushButton("Max Claim (M)")
+        QShortcut(QKeySequence("M"), self).activated.connect(self.show_claim_dialog)
+        button_panel.addWidget(self.claim_btn)
+  # Automatic layout (L) with the layout algorithm to use
+        self.layout_btn = QPushButton("Auto Layout (L)")
+        QShortcut(QKeySequence("L"), self).activated.connect(self.start_layout)
+        button_panel.addWidget(self.layout_btn)
+        self.layout_combo = QComboBox()
+        self.layout_combo.addItem("Layered", 'layered')
+        self.layout_combo.addItem("Force-directed", 'force')
+        button_panel.addWidget(self.layout_combo)
   # Undo last action button with Left Arrow shortcut
         self.undo_btn = QPushButton("Undo (←)")
         QShortcut(QKeySequence(Qt.Key.Key_Left), self).activated.connect(self.undo_last_action)
         button_panel.addWidget(self.undo_btn)
+  # Redo button with Right Arrow shortcut
+        self.redo_btn = QPushButton("Redo (→)")
+        QShortcut(QKeySequence(Qt.Key.Key_Right), self).activated.connect(self.redo_last_action)
+        button_panel.addWidget(self.redo_btn)
+  # Simulate a random workload and replay it (S), at the chosen speed
+        self.simulate_btn = QPushButton("Simulate (S)")
+        QShortcut(QKeySequence("S"), self).activated.connect(self.toggle_simulation)
+        button_panel.addWidget(self.simulate_btn)
+        self.replay_speed_combo = QComboBox()
+        for speed in (0.25, 1, 4, 16, 64):
+            self.replay_speed_combo.addItem(f"{speed:g}x", speed)
+        self.replay_speed_combo.setCurrentIndex(1)
+        button_panel.addWidget(self.replay_speed_combo)
+  # Import a lock-manager trace (T)
+        self.trace_btn = QPushButton("Open Trace (T)")
+        QShortcut(QKeySequence("T"), self).activated.connect(self.open_trace)
+        button_panel.addWidget(self.trace_btn)
+  # Profiling stats overlay (I) and trace export (Ctrl+E)
+        self.stats_btn = QPushButton("Stats (I)")
+        QShortcut(QKeySequence("I"), self).activated.connect(self.toggle_stats)
+        button_panel.addWidget(self.stats_btn)
+        self.export_trace_btn = QPushButton("Export Trace (Ctrl+E)")
+        QShortcut(QKeySequence("Ctrl+E"), self).activated.connect(self.export_profile)
+        button_panel.addWidget(self.export_trace_btn)
+  # Save and open scenario files (Ctrl+S / Ctrl+O)
+        self.save_btn = QPushButton("Save (Ctrl+S)")
+        QShortcut(QKeySequence("Ctrl+S"), self).activated.connect(self.save_scenario)
+        button_panel.addWidget(self.save_btn)
+        self.open_btn = QPushButton("Open (Ctrl+O)")
+        QShortcut(QKeySequence("Ctrl+O"), self).activated.connect(self.open_scenario)
+        button_panel.addWidget(self.open_btn)
 
         # Add the button panel to the main layout
         layout.addLayout(button_panel)
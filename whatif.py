@@ -0,0 +1,308 @@
+"""What-if branches of a resource allocation graph, evaluated in parallel.
+
+A branch is a list of history operations (see ``history``) on top of its
+parent; only the root holds the graph, as an immutable ``snapshot``. Forking
+therefore costs as much as the operations it adds, and any number of
+branches share the parent state:
+
+    root = Branch.from_engine(engine)
+    first = root.fork([('remove_edge', 'P3', 'R2', 1), ('add_edge', 'R2', 'P3', 1)],
+                      "R2 -> P3 x1")
+    records = evaluate([first] + allocation_branches(root, engine), jobs=4)
+
+``evaluate`` hands the branches to a pool of worker processes. Every worker
+builds the root engine once, then applies each branch's operations, checks
+it and applies the inverse operations again, so no branch is ever copied.
+Records come back ranked, best first. The command line evaluates every
+candidate next allocation of a scenario:
+
+    python whatif.py scenario.rag --depth 2 --safety --jobs 8
+"""
+import argparse
+import json
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+
+import profiling
+import rag_io
+from deadlock_engine import (RAGEngine, DetectionCancelled, DETECTION_MODES,
+                             CYCLE_MODE, PROCESS)
+from history import apply_ops, invert
+from profiling import profiler
+
+# Branches per task sent to a worker, and fewer branches than this are
+# evaluated in the calling process
+CHUNK_SIZE = 64
+PARALLEL_MIN_BRANCHES = 2 * CHUNK_SIZE
+
+
+class Branch:
+    """One what-if state: the operations on top of ``parent`` (the root has
+    none and holds the snapshot everything is relative to)"""
+
+    __slots__ = ('parent', 'ops', 'name', 'snapshot')
+
+    def __init__(self, parent, ops, name, snapshot=None):
+        self.parent = parent
+        self.ops = tuple(ops)
+        self.name = name
+        self.snapshot = snapshot
+
+    @classmethod
+    def from_engine(cls, engine, name="current"):
+        """Root branch holding a snapshot of ``engine`` as it is now"""
+        return cls(None, (), name, engine.snapshot())
+
+    def fork(self, ops, name):
+        """Child branch applying ``ops`` on top of this one"""
+        return Branch(self, ops, name)
+
+    @property
+    def root(self):
+        branch = self
+        while branch.parent is not None:
+            branch = branch.parent
+        return branch
+
+    def path(self):
+        """Operations from the root state to this branch"""
+        chain = []
+        branch = self
+        while branch.parent is not None:
+            chain.append(branch.ops)
+            branch = branch.parent
+        return [op for ops in reversed(chain) for op in ops]
+
+    def engine(self):
+        """A new engine in the state of this branch"""
+        engine = RAGEngine.from_snapshot(self.root.snapshot)
+        apply_ops(engine, self.path())
+        return engine
+
+
+def grant_ops(process, resource, instances):
+    """Operations granting ``instances`` of a pending request"""
+    return [('remove_edge', process, resource, instances),
+            ('add_edge', resource, process, instances)]
+
+
+def candidate_allocations(engine):
+    """``(process, resource, instances)`` for every pending request that
+    could be granted now, as far as the free instances allow"""
+    names = engine.names
+    available = engine.available
+    kinds = engine.kinds
+    candidates = []
+    for p, requests in enumerate(engine.succ):
+        if kinds[p] != 0:
+            continue
+        for r, n in requests.items():
+            if available[r] > 0:
+                candidates.append((names[p], names[r], min(n, available[r])))
+    return candidates
+
+
+def allocation_branches(branch, engine=None, depth=1):
+    """Fork ``branch`` once per candidate next allocation, and those again
+    down to ``depth`` allocations. ``engine`` is the state of ``branch``
+    if the caller already has it; it is left as it was."""
+    if engine is None:
+        engine = branch.engine()
+    branches = []
+    for process, resource, instances in candidate_allocations(engine):
+        label = f"{resource} -> {process} x{instances}"
+        if branch.parent is not None:
+            label = f"{branch.name}, {label}"
+        child = branch.fork(grant_ops(process, resource, instances), label)
+        branches.append(child)
+        if depth > 1:
+            apply_ops(engine, child.ops)
+            branches.extend(allocation_branches(child, engine, depth - 1))
+            apply_ops(engine, invert(child.ops))
+    return branches
+
+
+def waiting_processes(engine):
+    """How many processes hold instances while waiting for more, read off
+    the incrementally maintained wait-for graph"""
+    kinds = engine.kinds
+    waiting = {p for p, successors in enumerate(engine.dag_succ)
+               if successors and kinds[p] == 0}
+    waiting.update(u for u, _ in engine.back_edges if kinds[u] == 0)
+    return len(waiting)
+
+
+def evaluate_engine(engine, mode=CYCLE_MODE, safety=False):
+    """Deadlock (and with ``safety`` Banker's safety) summary of a state"""
+    if mode == CYCLE_MODE and not engine.back_edges:
+        # No wait-for edge closes a cycle; unlike has_cycle this never
+        # re-tries parked edges, which costs more than detection
+        deadlocked = []
+    else:
+        result = engine.detect(mode)
+        if result.processes is not None:
+            deadlocked = result.processes
+        else:
+            deadlocked = sorted(name for name in result.nodes
+                                if engine.node_type(name) == PROCESS)
+    record = {'deadlock': bool(deadlocked), 'deadlocked': deadlocked,
+              'waiting': waiting_processes(engine)}
+    if safety:
+        sequence = engine.safe_sequence()
+        record['safe'] = sequence is not None
+        record['safe_sequence'] = sequence
+    return record
+
+
+def _evaluate_paths(engine, snapshot, tasks, mode, safety):
+    """Evaluate ``(name, ops)`` tasks on ``engine`` in the root state,
+    bringing it back to that state after each; returns the records and
+    the engine to use next"""
+    records = []
+    for name, ops in tasks:
+        record = {'branch': name, 'ops': len(ops)}
+        try:
+            with profiler.span('whatif.branch', ops=len(ops)):
+                apply_ops(engine, ops)
+                record.update(evaluate_engine(engine, mode, safety))
+                apply_ops(engine, invert(ops))
+        except (KeyError, ValueError) as error:
+            record['error'] = f"{type(error).__name__}: {error}"
+            # Half-applied operations cannot be reverted reliably
+            engine = RAGEngine.from_snapshot(snapshot)
+        records.append(record)
+    return records, engine
+
+
+# Worker process state: the root snapshot and an engine in the root state
+_worker_snapshot = None
+_worker_engine = None
+
+
+def _init_worker(snapshot, profile):
+    global _worker_snapshot, _worker_engine
+    if profile:
+        profiling.enable()
+    _worker_snapshot = snapshot
+    _worker_engine = RAGEngine.from_snapshot(snapshot)
+
+
+def _evaluate_in_worker(tasks, mode, safety):
+    """``_evaluate_paths`` on the worker's engine, with the trace events it
+    recorded"""
+    global _worker_engine
+    records, _worker_engine = _evaluate_paths(
+        _worker_engine, _worker_snapshot, tasks, mode, safety)
+    return records, profiler.drain()
+
+
+def rank(records):
+    """Sort records best first: no error, no deadlock, fewest deadlocked
+    processes, safe, fewest waiting processes, then the original order"""
+    return sorted(records, key=lambda record: (
+        'error' in record, record.get('deadlock', True),
+        len(record.get('deadlocked', ())), record.get('safe') is False,
+        record.get('waiting', 0)))
+
+
+def evaluate(branches, mode=CYCLE_MODE, safety=False, jobs=None,
+             cancel=None, mp_context=None):
+    """Evaluate branches of one root in parallel and return ranked records.
+
+    Each record holds the branch name, its position in ``branches``
+    (``index``), the number of operations from the root, whether it
+    deadlocks, the deadlocked processes and how many processes are
+    waiting; with ``safety`` also whether it is safe and a safe sequence.
+    A branch whose operations do not apply gets an ``error`` instead.
+    ``cancel`` is polled as results arrive and raises
+    ``DetectionCancelled``.
+    """
+    if not branches:
+        return []
+    root = branches[0].root
+    if any(branch.root is not root for branch in branches):
+        raise ValueError("Branches must share one root")
+    tasks = [(branch.name, branch.path()) for branch in branches]
+    jobs = jobs or os.cpu_count() or 1
+
+    with profiler.span('whatif.evaluate', branches=len(branches), jobs=jobs):
+        if jobs == 1 or len(tasks) < PARALLEL_MIN_BRANCHES:
+            engine = RAGEngine.from_snapshot(root.snapshot)
+            records = []
+            for start in range(0, len(tasks), CHUNK_SIZE):
+                if cancel is not None and cancel():
+                    raise DetectionCancelled()
+                chunk, engine = _evaluate_paths(engine, root.snapshot,
+                                                tasks[start:start + CHUNK_SIZE], mode, safety)
+                records.extend(chunk)
+        else:
+            records = _evaluate_parallel(root.snapshot, tasks, mode, safety,
+                                         jobs, cancel, mp_context)
+    for index, record in enumerate(records):
+        record['index'] = index
+    return rank(records)
+
+
+def _evaluate_parallel(snapshot, tasks, mode, safety, jobs, cancel, mp_context):
+    # Chunks are submitted in order and results kept by chunk, so records
+    # line up with ``tasks`` however the workers finish
+    chunks = [tasks[start:start + CHUNK_SIZE] for start in range(0, len(tasks), CHUNK_SIZE)]
+    results = [None] * len(chunks)
+    with ProcessPoolExecutor(max_workers=jobs, mp_context=mp_context,
+                             initializer=_init_worker,
+                             initargs=(snapshot, profiler.enabled)) as pool:
+        pending = {pool.submit(_evaluate_in_worker, chunk, mode, safety): number
+                   for number, chunk in enumerate(chunks)}
+        while pending:
+            done, _ = wait(pending, timeout=0.1, return_when=FIRST_COMPLETED)
+            if cancel is not None and cancel():
+                pool.shutdown(wait=False, cancel_futures=True)
+                raise DetectionCancelled()
+            for future in done:
+                records, events = future.result()
+                profiler.merge(events)
+                results[pending.pop(future)] = records
+    return [record for chunk in results for record in chunk]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Rank what-if branches of every candidate next allocation.")
+    parser.add_argument('scenario', help="scenario file (.rag or .ragz)")
+    parser.add_argument('--depth', type=int, default=1,
+                        help="allocations per branch (default: 1)")
+    parser.add_argument('--mode', choices=DETECTION_MODES, default=CYCLE_MODE)
+    parser.add_argument('--safety', action='store_true',
+                        help="also run the Banker's safety check")
+    parser.add_argument('--jobs', '-j', type=int, default=None,
+                        help="worker processes (default: all cores)")
+    parser.add_argument('--top', type=int, default=None, help="print only the best N branches")
+    parser.add_argument('--output', '-o', help="write JSON lines here instead of stdout")
+    parser.add_argument('--trace', help="write a Chrome trace of the run here")
+    args = parser.parse_args(argv)
+
+    profiler.enable(bool(args.trace))
+    try:
+        engine, _ = rag_io.load(args.scenario)
+    except (OSError, rag_io.RAGFormatError) as error:
+        parser.error(f"cannot open {args.scenario}: {error}")
+    root = Branch.from_engine(engine)
+    branches = allocation_branches(root, engine, args.depth)
+    records = evaluate(branches, args.mode, args.safety, args.jobs)
+    output = open(args.output, 'w', encoding='utf-8') if args.output else sys.stdout
+    try:
+        for record in records[:args.top]:
+            output.write(json.dumps(record) + '\n')
+    finally:
+        if output is not sys.stdout:
+            output.close()
+    if args.trace:
+        profiler.export(args.trace)
+    deadlocked = sum(1 for record in records if record.get('deadlock'))
+    print(f"{len(records)} branches, {deadlocked} deadlocked", file=sys.stderr)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())